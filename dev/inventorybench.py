@@ -0,0 +1,95 @@
+"""
+dev/inventorybench.py
+=====================
+
+Measures the inventory queries used by the big inv
+(`SqliteInventory.unexpired_hashes_by_stream`) and by the pubkey / broadcast
+lookups (`SqliteInventory.by_type_and_tag`) with and without the indexes
+created by the schema version 11.
+
+Usage: python dev/inventorybench.py [rows ...]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+QUERY_BIGINV = (
+    'SELECT hash FROM inventory WHERE streamnumber=? AND expirestime>?')
+QUERY_TAG = (
+    'SELECT objecttype, streamnumber, payload, expirestime, tag'
+    ' FROM inventory WHERE objecttype=? AND tag=?')
+
+
+def randbytes(length):
+    """Random bytes, not cryptographically secure"""
+    return bytes(bytearray(random.getrandbits(8) for _ in range(length)))
+
+
+def populate(cur, rows):
+    """Fill the inventory table with *rows* objects expiring in 28 days"""
+    now = int(time.time())
+    payload = sqlite3.Binary(randbytes(256))
+    tags = [sqlite3.Binary(randbytes(32)) for _ in range(1000)]
+    cur.executemany(
+        'INSERT INTO inventory VALUES (?, ?, ?, ?, ?, ?)', (
+            (sqlite3.Binary(os.urandom(32)), random.randint(0, 3),
+             1 if i % 10 else 2, payload,
+             now + random.randint(-3 * 3600, 28 * 86400),
+             random.choice(tags))
+            for i in range(rows)))
+    return tags
+
+
+def measure(cur, query, args, repeat=5):
+    """Best of *repeat* runs, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        cur.execute(query, args)
+        cur.fetchall()
+        elapsed = (time.time() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(rows):
+    """Benchmark one inventory size"""
+    fd, filename = tempfile.mkstemp(suffix='.dat')
+    os.close(fd)
+    conn = sqlite3.connect(filename)
+    cur = conn.cursor()
+    cur.execute(
+        'CREATE TABLE inventory (hash blob, objecttype int,'
+        ' streamnumber int, payload blob, expirestime integer, tag blob,'
+        ' UNIQUE(hash) ON CONFLICT REPLACE)')
+    tags = populate(cur, rows)
+    conn.commit()
+
+    bigInvArgs = (1, int(time.time()))
+    tagArgs = (1, tags[0])
+    before = (
+        measure(cur, QUERY_BIGINV, bigInvArgs),
+        measure(cur, QUERY_TAG, tagArgs))
+    cur.execute(
+        'CREATE INDEX inventory_stream_expires'
+        ' ON inventory (streamnumber, expirestime, hash)')
+    cur.execute('CREATE INDEX inventory_type_tag ON inventory (objecttype, tag)')
+    conn.commit()
+    after = (
+        measure(cur, QUERY_BIGINV, bigInvArgs),
+        measure(cur, QUERY_TAG, tagArgs))
+    conn.close()
+    os.remove(filename)
+
+    print('%9i rows  big inv: %9.2f ms -> %9.2f ms'
+          '  tag lookup: %9.2f ms -> %9.2f ms' % (
+              rows, before[0], after[0], before[1], after[1]))
+
+
+if __name__ == '__main__':
+    for size in [int(x) for x in sys.argv[1:]] or (100000, 1000000):
+        run(size)
@@ -0,0 +1,145 @@
+"""
+dev/inventorycleanbench.py
+==========================
+
+Measures the cleaning of the expired objects (`SqliteInventory.clean`)
+and the object lookups of the inventory partitioned by the expiration
+time, compared to the former single inventory table cleaned
+with a DELETE of the expired rows.
+
+The objects expire evenly over 28 days, the clean is measured
+after moving the clock by two hours (the `singleCleaner` interval).
+The queries of all the tables, `by_type_and_tag` and
+`unexpired_hashes_by_stream`, are timed as well.
+
+Usage: python2 dev/inventorycleanbench.py [objects [bucket hours]]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import helper_sql  # noqa:E402
+import helper_startup  # noqa:E402
+import state  # noqa:E402
+from class_sqlThread import sqlThread  # noqa:E402
+from storage.sqlite import SqliteInventory  # noqa:E402
+
+LOOKUPS = 10000
+
+
+def objects(count, now):
+    """Generate *count* (hash, item) expiring evenly over 28 days"""
+    payload = buffer(os.urandom(256))
+    for i in range(count):
+        yield os.urandom(32), (
+            random.randint(0, 3), 1, payload,
+            now - 3 * 3600 + i * 28 * 86400 // count, buffer(os.urandom(32)))
+
+
+def flat(filename, items, now):
+    """Time the DELETE of the expired objects from one table"""
+    conn = sqlite3.connect(filename)
+    cur = conn.cursor()
+    cur.execute('PRAGMA journal_mode = WAL')
+    cur.execute('PRAGMA synchronous = NORMAL')
+    cur.execute('PRAGMA secure_delete = false')
+    cur.execute(
+        'CREATE TABLE inventory (hash blob, objecttype int,'
+        ' streamnumber int, payload blob, expirestime integer, tag blob,'
+        ' UNIQUE(hash) ON CONFLICT REPLACE)')
+    cur.execute(
+        'CREATE INDEX inventory_stream_expires'
+        ' ON inventory (streamnumber, expirestime, hash)')
+    cur.execute('CREATE INDEX inventory_type_tag ON inventory (objecttype, tag)')
+    cur.executemany(
+        'INSERT INTO inventory VALUES (?, ?, ?, ?, ?, ?)',
+        ((buffer(h),) + value for h, value in items))
+    conn.commit()
+    start = time.time()
+    minTime = now + 2 * 3600 - 3 * 3600
+    cur.execute(
+        'SELECT hash FROM inventory WHERE expirestime<?', (minTime,))
+    expired = len(cur.fetchall())
+    cur.execute('DELETE FROM inventory WHERE expirestime<?', (minTime,))
+    conn.commit()
+    elapsed = time.time() - start
+    conn.close()
+    return elapsed * 1000, expired
+
+
+def bucketed(items, now):
+    """Time the clean and the lookups of the SqliteInventory"""
+    inventory = SqliteInventory()
+    for objectHash, value in items:
+        inventory[objectHash] = value
+    inventory.flush()
+
+    start = time.time()
+    inventory = SqliteInventory()
+    loaded = time.time() - start
+
+    hashes = random.sample([h for h, _ in items], LOOKUPS)
+    start = time.time()
+    for objectHash in hashes:
+        inventory[objectHash]  # pylint: disable=pointless-statement
+    lookup = time.time() - start
+
+    start = time.time()
+    inventory.by_type_and_tag(1, items[0][1][4])
+    tagged = time.time() - start
+    start = time.time()
+    inventory.unexpired_hashes_by_stream(1)
+    unexpired = time.time() - start
+
+    count = len(inventory)
+    realTime = time.time
+    time.time = lambda: realTime() + 2 * 3600
+    try:
+        start = realTime()
+        inventory.clean()
+        elapsed = realTime() - start
+    finally:
+        time.time = realTime
+    return (
+        elapsed * 1000, count - len(inventory), loaded,
+        lookup * 1000000 / LOOKUPS, tagged * 1000, unexpired * 1000)
+
+
+def main():
+    """Benchmark both layouts in a temporary directory"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    if len(sys.argv) > 2:
+        SqliteInventory.bucketLength = int(float(sys.argv[2]) * 3600)
+    state.appdata = tempfile.mkdtemp() + os.sep
+    helper_startup.loadConfig()
+    # SqliteInventory looks for the inventory in messages.dat
+    thread = sqlThread()
+    thread.daemon = True
+    thread.start()
+    now = int(time.time())
+    items = list(objects(count, now))
+
+    flatTime, flatExpired = flat(state.appdata + 'flat.dat', items, now)
+    cleanTime, expired, loaded, lookup, tagged, unexpired = bucketed(
+        items, now)
+    print('%i objects' % count)
+    print('clean  single table: %8.1f ms (%i expired)' % (
+        flatTime, flatExpired))
+    print('clean  %2i h buckets: %8.1f ms (%i expired)' % (
+        SqliteInventory.bucketLength // 3600, cleanTime, expired))
+    print('load %.1f s, lookup %.1f us' % (loaded, lookup))
+    print('by_type_and_tag %.1f ms, unexpired_hashes_by_stream %.1f ms' % (
+        tagged, unexpired))
+
+    helper_sql.sqlStoredProcedure('exit')
+    thread.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+dev/inventoryflushbench.py
+==========================
+
+Measures the longest time the inventory lock is held to write the new
+objects under a heavy inflow, with the write-behind thread of
+`SqliteInventory`, compared to all of them written at once under the
+lock at the end of the `singleCleaner` cycle as before, and the largest
+number of new objects kept in memory.
+
+Usage: python2 dev/inventoryflushbench.py [objects] [payload size]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import helper_sql  # noqa:E402
+import helper_startup  # noqa:E402
+import state  # noqa:E402
+from class_sqlThread import sqlThread  # noqa:E402
+from storage.sqlite import SqliteInventory  # noqa:E402
+
+
+class TimedLock(object):
+    """A lock recording the longest hold by the inventoryWriter thread"""
+    def __init__(self, lock):
+        self.lock = lock
+        self.longest = 0
+        self._depth = 0
+        self._start = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            self._start = time.time()
+
+    def __exit__(self, *args):
+        self._depth -= 1
+        if (
+            self._depth == 0
+            and threading.current_thread().name == 'inventoryWriter'
+        ):
+            self.longest = max(self.longest, time.time() - self._start)
+        self.lock.release()
+
+
+def inflow(count, size, writeBehind):
+    """Add *count* objects, return the longest lock hold and the peak"""
+    inventory = SqliteInventory()
+    inventory.lock = lock = TimedLock(inventory.lock)
+    stop = threading.Event()
+    if writeBehind:
+        # as the threads.inventoryWriter
+        writer = threading.Thread(
+            target=inventory.writeBehind, args=(stop,),
+            name='inventoryWriter')
+        writer.start()
+    else:
+        inventory.flushCount = inventory.flushSize = sys.maxint
+        inventory.flushAge = sys.maxint
+    expires = int(time.time()) + 86400
+    payload = buffer(os.urandom(size))
+    peak = 0
+    for i in range(count):
+        inventory[os.urandom(32)] = (1, 1, payload, expires + i % 3600, '')
+        peak = max(peak, len(inventory._inventory))
+
+    def cleaner():
+        """The end of the cleaner cycle, holding the lock as before"""
+        if writeBehind:
+            inventory.flush()
+        else:
+            with lock:
+                inventory.flush()
+
+    thread = threading.Thread(target=cleaner, name='inventoryWriter')
+    thread.start()
+    thread.join()
+    stop.set()
+    if writeBehind:
+        writer.join()
+    return lock.longest * 1000, peak
+
+
+def main():
+    """Benchmark both modes in a temporary directory"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    state.appdata = tempfile.mkdtemp() + os.sep
+    helper_startup.loadConfig()
+    # SqliteInventory looks for the inventory in messages.dat
+    thread = sqlThread()
+    thread.daemon = True
+    thread.start()
+
+    print('%i objects of %i bytes' % (count, size))
+    for name, writeBehind in (('flush', False), ('write-behind', True)):
+        if os.path.exists(state.appdata + SqliteInventory.dbFilename):
+            os.remove(state.appdata + SqliteInventory.dbFilename)
+        longest, peak = inflow(count, size, writeBehind)
+        print('%-12s longest lock hold %8.1f ms, peak %i objects in memory' % (
+            name, longest, peak))
+
+    helper_sql.sqlStoredProcedure('exit')
+    thread.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+dev/listbench.py
+================
+
+Measures the time to list the inbox (the query of the message list of
+the folder view) over a mailbox of 100k messages with the bodies kept
+in the message_body table, compared to the former layout with the
+bodies in the inbox rows, and the time to load one body.
+
+Usage: python2 dev/listbench.py [messages] [body size]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import helper_sql  # noqa:E402
+import helper_startup  # noqa:E402
+import state  # noqa:E402
+from class_sqlThread import sqlThread  # noqa:E402
+
+LIST_QUERY = (
+    "SELECT toaddress, fromaddress, subject, msgid, received, read"
+    " FROM %s WHERE folder='inbox' ORDER BY received")
+REPEAT = 5
+
+
+def populate(count, size):
+    """Insert *count* messages with *size* bytes bodies into the inbox"""
+    with helper_sql.SqlBulkExecute() as sql:
+        for i in range(count):
+            sql.execute(
+                'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                os.urandom(32), 'BM-to%i' % (i % 10), 'BM-from',
+                'subject %i' % i, str(i), os.urandom(size // 2).encode('hex'),
+                'inbox', 2, i % 2, os.urandom(32))
+
+
+def inline(conn):
+    """Create inbox_inline: a copy of the inbox with the bodies inline"""
+    conn.execute(
+        'CREATE TABLE inbox_inline AS SELECT msgid, toaddress, fromaddress,'
+        ' subject, received, message_body.message AS message, folder,'
+        ' encodingtype, read, sighash FROM inbox'
+        ' JOIN message_body ON message_body.id = msgid')
+    conn.execute(
+        'CREATE INDEX inbox_inline_folder_received'
+        ' ON inbox_inline (folder, received, msgid)')
+    conn.execute('CREATE INDEX inbox_inline_msgid ON inbox_inline (msgid)')
+    conn.commit()
+
+
+def measure(filename, query, *args):
+    """Best of `REPEAT` runs on a new connection in ms"""
+    best = None
+    for _ in range(REPEAT):
+        conn = sqlite3.connect(filename)
+        conn.text_factory = str
+        start = time.time()
+        conn.execute(query, args).fetchall()
+        elapsed = (time.time() - start) * 1000
+        conn.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    """Populate a temporary database in the sqlThread and benchmark it"""
+    state.appdata = tempfile.mkdtemp() + os.sep
+    state.enableGUI = False
+    helper_startup.loadConfig()
+    thread = sqlThread()
+    thread.daemon = True
+    thread.start()
+    while not state.sqlReady:
+        time.sleep(0.1)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    populate(count, size)
+    helper_sql.sqlStoredProcedure('exit')
+    thread.join()
+
+    filename = state.appdata + 'messages.dat'
+    conn = sqlite3.connect(filename)
+    conn.text_factory = str
+    inline(conn)
+    msgid, = conn.execute(
+        'SELECT msgid FROM inbox WHERE rowid = ?', (count // 2,)).fetchone()
+    conn.close()
+    print('%i messages, %i bytes bodies' % (count, size))
+    print('list  inline: %8.2f ms  split: %8.2f ms' % (
+        measure(filename, LIST_QUERY % 'inbox_inline'),
+        measure(filename, LIST_QUERY % 'inbox')))
+    print('body  inline: %8.2f ms  split: %8.2f ms' % (
+        measure(filename, 'SELECT message FROM inbox_inline WHERE msgid=?',
+                msgid),
+        measure(filename, 'SELECT message FROM message_body WHERE id=?',
+                msgid)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+dev/pollbench.py
+================
+
+Measures the CPU time of one iteration of the asyncore loop per count of
+idle connections, with the `epoll_poller` checking all the dispatchers
+on every iteration and with the `epoll_event_poller` keeping them
+registered.
+
+Usage: python2 dev/pollbench.py [connections ...]
+"""
+
+import os
+import resource
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import network.asyncore_pollchoose as asyncore  # noqa:E402
+from network.advanceddispatcher import AdvancedDispatcher  # noqa:E402
+
+ITERATIONS = 2000
+
+
+def measure(poller, count):
+    """CPU time per iteration in microseconds with *count* connections"""
+    socketMap = {}
+    peers = []
+    for _ in range(count):
+        local, remote = socket.socketpair()
+        local.setblocking(0)
+        dispatcher = AdvancedDispatcher()
+        dispatcher.set_socket(local, socketMap)
+        dispatcher.connected = True
+        dispatcher.fullyEstablished = True
+        peers.append((dispatcher, remote))
+    # the first ones register all of them
+    for _ in range(2):
+        poller(0, socketMap)
+    start = time.clock()
+    for _ in range(ITERATIONS):
+        poller(0, socketMap)
+    elapsed = time.clock() - start
+    for dispatcher, remote in peers:
+        dispatcher.del_channel(socketMap)
+        dispatcher.socket.close()
+        remote.close()
+    return elapsed * 1000000 / ITERATIONS
+
+
+def main():
+    """Benchmark both pollers"""
+    counts = [int(arg) for arg in sys.argv[1:]] or [10, 100, 500, 1000]
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(
+        resource.RLIMIT_NOFILE, (min(hard, max(counts) * 2 + 100), hard))
+    asyncore.event_poller = True
+    print('connections   epoll_poller   epoll_event_poller (us per loop)')
+    for count in counts:
+        print('%11i %14.1f %20.1f' % (
+            count, measure(asyncore.epoll_poller, count),
+            measure(asyncore.epoll_event_poller, count)))
+
+
+if __name__ == '__main__':
+    main()
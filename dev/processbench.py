@@ -0,0 +1,138 @@
+"""
+dev/processbench.py
+===================
+
+Measures the messages per second and the round trip latency of the
+loopback connections echoing the length prefixed messages, with the
+received data passed through the `receiveDataQueue` to the processing
+threads, as the `.ReceiveQueueThread` does, and with the
+`inlineProcessing` in the network thread.
+
+Usage: python2 dev/processbench.py [connections [processing threads]]
+"""
+
+import os
+import Queue
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import network.asyncore_pollchoose as asyncore  # noqa:E402
+from network.advanceddispatcher import (  # noqa:E402
+    AdvancedDispatcher, receiveDataQueue)
+from network.threads import StoppableThread  # noqa:E402
+
+DURATION = 3
+MESSAGE = 'x' * 200
+connections = {}
+
+
+class Echo(AdvancedDispatcher):
+    """Sends back each message received"""
+
+    def __init__(self, sock):
+        AdvancedDispatcher.__init__(self, sock)
+        self.set_state('header', 0, 4)
+
+    def handle_read(self):
+        AdvancedDispatcher.handle_read(self)
+        self.schedule_process(self._fileno)
+
+    def state_header(self):
+        length, = struct.unpack('>L', self.read_buf[:4])
+        self.set_state('payload', 4, length)
+        return True
+
+    def state_payload(self):
+        payload = self.read_buf[:self.expectBytes]
+        self.append_write_buf(struct.pack('>L', len(payload)) + payload)
+        self.set_state('header', len(payload), 4)
+        return True
+
+
+class NetworkThread(StoppableThread):
+    """Polls the socket map as the `.BMNetworkThread`"""
+    def run(self):
+        while not self._stopped:
+            asyncore.loop(timeout=0.5, count=1000)
+
+
+class ProcessingThread(StoppableThread):
+    """Processes the connections queued as the `.ReceiveQueueThread`"""
+    def run(self):
+        while not self._stopped:
+            try:
+                fd = receiveDataQueue.get(timeout=0.5)
+            except Queue.Empty:
+                continue
+            if fd in connections:
+                connections[fd].process_received()
+            receiveDataQueue.task_done()
+
+
+def client(sock, deadline, latencies):
+    """Sends the messages one by one, timing the replies"""
+    packet = struct.pack('>L', len(MESSAGE)) + MESSAGE
+    while time.time() < deadline:
+        start = time.time()
+        sock.sendall(packet)
+        received = 0
+        while received < len(packet):
+            received += len(sock.recv(len(packet) - received))
+        latencies.append(time.time() - start)
+
+
+def measure(count, processing):
+    """Messages per second and the median and 99th percentile latency"""
+    AdvancedDispatcher.inlineProcessing = not processing
+    peers = []
+    for _ in range(count):
+        local, remote = socket.socketpair()
+        echo = Echo(local)
+        echo.connected = True
+        connections[echo._fileno] = echo  # pylint: disable=protected-access
+        peers.append(remote)
+    workers = [NetworkThread(name='network')] + [
+        ProcessingThread(name='processing') for _ in range(processing)]
+    for worker in workers:
+        worker.start()
+    latencies = [[] for _ in peers]
+    deadline = time.time() + DURATION
+    clients = [
+        threading.Thread(target=client, args=(sock, deadline, result))
+        for sock, result in zip(peers, latencies)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    for worker in workers:
+        worker.stopThread()
+        worker.join()
+    for echo in connections.values():
+        echo.close()
+    connections.clear()
+    for sock in peers:
+        sock.close()
+    latencies = sorted(sum(latencies, []))
+    return (
+        len(latencies) / float(DURATION),
+        latencies[len(latencies) // 2] * 1000,
+        latencies[len(latencies) * 99 // 100] * 1000)
+
+
+def main():
+    """Benchmark the queue handoff and the inline processing"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    processing = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print('%i connections' % count)
+    print('mode          msg/s   median ms   p99 ms')
+    print('queue %12.0f %11.2f %8.2f' % measure(count, processing))
+    print('inline %11.0f %11.2f %8.2f' % measure(count, 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+dev/recvbench.py
+================
+
+Measures the bytes copied in the process per received byte and the time
+to receive and split a stream of packets into payloads, with the former
+read buffer (recv, extend, slice the payload, delete the front) and with
+the `ReceiveBuffer` (recv_into, a view of the payload, move the cursor).
+
+The stream is a mix of inv packets of 1000 vectors, 1 kB objects and
+1 MB objects, sent through a socket pair.
+
+Usage: python2 dev/recvbench.py [megabytes]
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import protocol  # noqa:E402
+from network.advanceddispatcher import ReceiveBuffer  # noqa:E402
+
+CHUNK = 131072
+
+
+def packets(megabytes):
+    """The packets of the stream"""
+    inv = protocol.CreatePacket('inv', '\xfd\x03\xe8' + os.urandom(32000))
+    small = protocol.CreatePacket('object', os.urandom(1024))
+    large = protocol.CreatePacket('object', os.urandom(1024 * 1024))
+    stream = []
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        for packet in [inv] + [small] * 20 + [large]:
+            stream.append(packet)
+            size += len(packet)
+    return stream
+
+
+def send(sock, stream):
+    """Send the stream and close the socket"""
+    for packet in stream:
+        sock.sendall(packet)
+    sock.close()
+
+
+def bytearrayBuffer(sock):
+    """Split the stream as before, return the count of bytes copied"""
+    read_buf = bytearray()
+    copied = 0
+    expect = protocol.Header.size
+    length = None
+    while True:
+        data = sock.recv(CHUNK)
+        if not data:
+            return copied
+        read_buf.extend(data)
+        copied += len(data)
+        while len(read_buf) >= expect:
+            if length is None:
+                _, _, length, _ = protocol.Header.unpack(
+                    read_buf[:protocol.Header.size])
+                del read_buf[:protocol.Header.size]
+                copied += protocol.Header.size + len(read_buf)
+                expect = length
+            else:
+                payload = read_buf[:length]
+                copied += len(payload)
+                del read_buf[:length]
+                copied += len(read_buf)
+                expect, length = protocol.Header.size, None
+
+
+class CountingBuffer(ReceiveBuffer):
+    """Counts the bytes moved to the new chunks"""
+    copied = 0
+
+    def reserve(self, length, expected=0):
+        chunk = self._chunk
+        view = ReceiveBuffer.reserve(self, length, expected)
+        if self._chunk is not chunk:
+            self.copied += len(self)
+        return view
+
+
+def cursorBuffer(sock):
+    """Split the stream with a ReceiveBuffer"""
+    read_buf = CountingBuffer(CHUNK)
+    expect = protocol.Header.size
+    length = None
+    while True:
+        buf = read_buf.reserve(CHUNK, expect)
+        received = sock.recv_into(buf, len(buf))
+        if not received:
+            return read_buf.copied
+        read_buf.advance(received)
+        while len(read_buf) >= expect:
+            if length is None:
+                _, _, length, _ = protocol.Header.unpack(
+                    read_buf[:protocol.Header.size])
+                read_buf.consume(protocol.Header.size)
+                expect = length
+            else:
+                payload = read_buf.view(length)  # noqa:F841
+                read_buf.consume(length)
+                expect, length = protocol.Header.size, None
+
+
+def measure(function, stream):
+    """Return the bytes copied per byte and the time of *function*"""
+    sender, receiver = socket.socketpair()
+    thread = threading.Thread(target=send, args=(sender, stream))
+    start = time.time()
+    thread.start()
+    copied = function(receiver)
+    elapsed = time.time() - start
+    thread.join()
+    receiver.close()
+    return float(copied) / sum(len(packet) for packet in stream), elapsed
+
+
+def main():
+    """Benchmark both buffers"""
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    stream = packets(megabytes)
+    print('%i MB in %i packets' % (megabytes, len(stream)))
+    for name, function in (
+            ('bytearray', bytearrayBuffer), ('cursor', cursorBuffer)):
+        copied, elapsed = measure(function, stream)
+        print('%-10s %5.2f bytes copied per byte, %6.2f s' % (
+            name, copied, elapsed))
+
+
+if __name__ == '__main__':
+    main()
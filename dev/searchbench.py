@@ -0,0 +1,92 @@
+"""
+dev/searchbench.py
+==================
+
+Measures the latency of `helper_search.search_sql` over a mailbox
+of 100k messages with the full text index, compared to the former
+LIKE search of all the message fields.
+
+Usage: python2 dev/searchbench.py [messages]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import helper_search  # noqa:E402
+import helper_sql  # noqa:E402
+import helper_startup  # noqa:E402
+import state  # noqa:E402
+from class_sqlThread import sqlThread  # noqa:E402
+
+LIKE_QUERY = (
+    "SELECT toaddress, fromaddress, subject, folder, msgid, received, read"
+    " FROM inbox WHERE folder = ? AND"
+    " toaddress || fromaddress || subject || message LIKE ?")
+WORDS = [
+    ''.join(random.choice('abcdefghijklmnopqrstuvwxyz')
+            for _ in range(random.randint(3, 10)))
+    for _ in range(20000)]
+REPEAT = 5
+
+
+def text(words):
+    """A random text of *words* words"""
+    return ' '.join(random.choice(WORDS) for _ in range(words))
+
+
+def populate(count):
+    """Insert *count* messages into the inbox"""
+    with helper_sql.SqlBulkExecute() as sql:
+        for i in range(count):
+            sql.execute(
+                'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                os.urandom(32), 'BM-to%i' % (i % 10), 'BM-from',
+                text(6), str(int(time.time())), text(200),
+                'inbox', 2, i % 2, os.urandom(32))
+
+
+def measure(func, *args):
+    """Best of `REPEAT` runs in ms and the number of results"""
+    best = None
+    for _ in range(REPEAT):
+        start = time.time()
+        result = func(*args)
+        elapsed = (time.time() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(result)
+
+
+def main():
+    """Start the sqlThread on a temporary database and benchmark it"""
+    state.appdata = tempfile.mkdtemp() + os.sep
+    state.enableGUI = False
+    helper_startup.loadConfig()
+    thread = sqlThread()
+    thread.daemon = True
+    thread.start()
+    while not state.sqlReady:
+        time.sleep(0.1)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    populate(count)
+    print('%i messages, %s index' % (
+        count, helper_search._search_index_kind()))
+
+    for what in (random.choice(WORDS), random.choice(WORDS)[:4], 'zzzzz'):
+        like = measure(
+            helper_sql.sqlQuery, LIKE_QUERY, 'inbox', '%' + what + '%')
+        fts = measure(
+            helper_search.search_sql, 'toaddress', None, 'inbox', None, what)
+        print('%-10s LIKE: %8.2f ms (%i found)  index: %8.2f ms (%i found)'
+              % ((what,) + like + fts))
+
+    helper_sql.sqlStoredProcedure('exit')
+    thread.join()
+
+
+if __name__ == '__main__':
+    main()
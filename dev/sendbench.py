@@ -0,0 +1,108 @@
+"""
+dev/sendbench.py
+================
+
+Measures the bytes copied in the process per sent byte and the time to
+send an upload batch of 2 MB of 1 MB and 1 kB objects interleaved with
+inv packets, with the former write buffer (extend a bytearray, send a
+slice, delete the front) and with the `SendBuffer` (queue the buffers,
+send them from an offset).
+
+Usage: python2 dev/sendbench.py [batches]
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import protocol  # noqa:E402
+from network.advanceddispatcher import SendBuffer  # noqa:E402
+
+CHUNK = 131072
+
+
+def batch():
+    """The buffers of one upload batch and the inv packets"""
+    large = buffer(os.urandom(1024 * 1024))
+    small = buffer(os.urandom(1024))
+    inv = protocol.CreatePacket('inv', '\x01' + os.urandom(32))
+    packets = [protocol.CreatePacketHeader('object', large), large]
+    for _ in range(1000):
+        packets += [
+            protocol.CreatePacketHeader('object', small), small, inv]
+    return packets
+
+
+def drain(sock):
+    """Receive and drop everything"""
+    while sock.recv(1048576):
+        pass
+
+
+def bytearrayBuffer(sock, batches):
+    """Send as before, return the count of bytes copied"""
+    copied = 0
+    for packets in batches:
+        write_buf = bytearray()
+        for data in packets:
+            write_buf.extend(data)
+            copied += len(data)
+        while write_buf:
+            data = write_buf[0:CHUNK]
+            copied += len(data)
+            written = sock.send(data)
+            del write_buf[0:written]
+            copied += len(write_buf)
+    return copied
+
+
+def queueBuffer(sock, batches):
+    """Send with a SendBuffer, return the count of bytes copied"""
+    copied = 0
+    for packets in batches:
+        write_buf = SendBuffer()
+        for data in packets:
+            write_buf.append(data)
+        while write_buf:
+            first = write_buf._buffers[0]  # pylint: disable=protected-access
+            data = write_buf.peek(CHUNK)
+            if write_buf._buffers[0] is not first:
+                # the small buffers have been joined
+                copied += len(write_buf._buffers[0])
+            write_buf.consume(sock.send(data))
+    return copied
+
+
+def measure(function, batches):
+    """Return the bytes copied per byte and the time of *function*"""
+    sender, receiver = socket.socketpair()
+    thread = threading.Thread(target=drain, args=(receiver,))
+    thread.start()
+    start = time.time()
+    copied = function(sender, batches)
+    elapsed = time.time() - start
+    sender.close()
+    thread.join()
+    receiver.close()
+    size = sum(len(data) for packets in batches for data in packets)
+    return float(copied) / size, elapsed
+
+
+def main():
+    """Benchmark both buffers"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    batches = [batch()] * count
+    print('%i batches' % count)
+    for name, function in (
+            ('bytearray', bytearrayBuffer), ('queue', queueBuffer)):
+        copied, elapsed = measure(function, batches)
+        print('%-10s %6.2f bytes copied per byte, %6.2f s' % (
+            name, copied, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+dev/shardbench.py
+=================
+
+Measures the throughput of the loopback connections split between
+the socket maps, each polled by its own thread as the
+`.network.BMNetworkShardThread` does, per count of the network threads.
+Half of the connections send continuously to the other half, which
+receive and drop the data.
+
+Usage: python2 dev/shardbench.py [connections [threads ...]]
+"""
+
+import os
+import resource
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import network.asyncore_pollchoose as asyncore  # noqa:E402
+from network.advanceddispatcher import AdvancedDispatcher  # noqa:E402
+from network.threads import StoppableThread  # noqa:E402
+
+DURATION = 3
+CHUNK = 'x' * 16384
+
+
+class Sender(AdvancedDispatcher):
+    """A connection always having the data to send"""
+    sharded = True
+
+    def writable(self):
+        if len(self.write_buf) < len(CHUNK):
+            self.write_buf.append(CHUNK)
+        return AdvancedDispatcher.writable(self)
+
+
+class Receiver(AdvancedDispatcher):
+    """A connection dropping the data received"""
+    sharded = True
+
+    def handle_read(self):
+        AdvancedDispatcher.handle_read(self)
+        self.read_buf.clear()
+
+
+class ShardThread(StoppableThread):
+    """Polls one socket map"""
+    def __init__(self, socketMap):
+        super(ShardThread, self).__init__(name='shard')
+        self.map = socketMap
+
+    def run(self):
+        while not self._stopped:
+            asyncore.loop(timeout=0.5, map=self.map, count=100)
+
+
+def measure(count, threads):
+    """Received megabytes per second with *count* connections"""
+    shards = [asyncore.add_shard() for _ in range(threads - 1)]
+    dispatchers = []
+    for _ in range(count // 2):
+        local, remote = socket.socketpair()
+        for cls, sock in ((Sender, local), (Receiver, remote)):
+            dispatcher = cls()
+            dispatcher.set_socket(sock)
+            dispatcher.connected = True
+            dispatchers.append(dispatcher)
+    workers = [ShardThread(asyncore.socket_map)] + [
+        ShardThread(shard) for shard in shards]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.5)
+    received = asyncore.receivedBytes
+    start = time.time()
+    time.sleep(DURATION)
+    received = asyncore.receivedBytes - received
+    elapsed = time.time() - start
+    for worker in workers:
+        worker.stopThread()
+        worker.join()
+    for dispatcher in dispatchers:
+        dispatcher.close()
+    del asyncore.shard_maps[:]
+    return received / elapsed / 1024 / 1024
+
+
+def main():
+    """Benchmark the counts of the network threads"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    threads = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(
+        resource.RLIMIT_NOFILE, (min(hard, count + 100), hard))
+    print('%i connections' % count)
+    print('threads   MB/s received')
+    for num in threads:
+        print('%7i %15.1f' % (num, measure(count, num)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+dev/sqlreadbench.py
+===================
+
+Measures the throughput of `helper_sql.sqlQuery` with several threads
+reading concurrently, served by the sqlThread alone and by the pool of
+reader connections (`helper_sql.sqlReaders`), and the latency of a short
+query while another thread runs long ones.
+
+Usage: python2 dev/sqlreadbench.py [messages]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import helper_sql  # noqa:E402
+import helper_startup  # noqa:E402
+import state  # noqa:E402
+from class_sqlThread import sqlThread  # noqa:E402
+
+QUERY = (
+    "SELECT toaddress, folder, count(msgid) FROM inbox"
+    " WHERE read = 0 AND subject LIKE ? GROUP BY toaddress, folder")
+SHORT_QUERY = "SELECT value FROM settings WHERE key='version'"
+DURATION = 3
+
+
+def populate(count):
+    """Insert *count* messages into the inbox"""
+    with helper_sql.SqlBulkExecute() as sql:
+        for i in range(count):
+            sql.execute(
+                'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                os.urandom(32), 'BM-to%i' % (i % 10), 'BM-from',
+                'subject %i' % i, str(int(time.time())), 'x' * 1000,
+                'inbox', 2, i % 2, os.urandom(32))
+
+
+def reader(deadline, counter):
+    """Query until *deadline*, counting the queries"""
+    while time.time() < deadline:
+        helper_sql.sqlQuery(QUERY, '%subject 1%')
+        counter.append(1)
+
+
+def run(threads):
+    """Return the number of queries per second done by *threads* threads"""
+    counter = []
+    deadline = time.time() + DURATION
+    workers = [
+        threading.Thread(target=reader, args=(deadline, counter))
+        for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(counter) / float(DURATION)
+
+
+def latency():
+    """Average latency of the short query in ms, with a reader running"""
+    deadline = time.time() + DURATION
+    background = threading.Thread(target=reader, args=(deadline, []))
+    background.start()
+    count = 0
+    start = time.time()
+    while time.time() < deadline:
+        helper_sql.sqlQuery(SHORT_QUERY)
+        count += 1
+    elapsed = time.time() - start
+    background.join()
+    return elapsed * 1000 / count
+
+
+def main():
+    """Start the sqlThread on a temporary database and benchmark it"""
+    state.appdata = tempfile.mkdtemp() + os.sep
+    helper_startup.loadConfig()
+    thread = sqlThread()
+    thread.daemon = True
+    thread.start()
+    populate(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+    filename = helper_sql.sqlReaders.filename
+
+    for threads in (1, 2, 4, 8):
+        helper_sql.sqlReaders.reset()
+        single = run(threads)
+        helper_sql.sqlReaders.reset(filename)
+        helper_sql.sqlReaders.size = threads
+        pooled = run(threads)
+        print('%i threads: sqlThread %8.1f q/s, readers %8.1f q/s' % (
+            threads, single, pooled))
+
+    helper_sql.sqlReaders.reset()
+    single = latency()
+    helper_sql.sqlReaders.reset(filename)
+    pooled = latency()
+    print('short query latency: sqlThread %.2f ms, readers %.2f ms' % (
+        single, pooled))
+
+    helper_sql.sqlStoredProcedure('exit')
+    thread.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -131,13 +131,14 @@ def decodeVarint(data):
         return (encodedValue, 9)
 
 
-def calculateInventoryHash(data):
-    """Calculate inventory hash from object data"""
-    sha = hashlib.new('sha512')
-    sha2 = hashlib.new('sha512')
-    sha.update(data)
-    sha2.update(sha.digest())
-    return sha2.digest()[0:32]
+def calculateInventoryHash(data, digest=None):
+    """
+    Calculate inventory hash from object data,
+    or from its SHA-512 *digest* if already known
+    """
+    if digest is None:
+        digest = hashlib.sha512(data).digest()
+    return hashlib.sha512(digest).digest()[0:32]
 
 
 def encodeAddress(version, stream, ripe):
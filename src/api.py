@@ -74,6 +74,7 @@ from struct import pack
 
 import defaults
 import helper_inbox
+import helper_search
 import helper_sent
 import network.stats
 import proofofwork
@@ -91,7 +92,7 @@ from addresses import (
 from bmconfigparser import BMConfigParser
 from debug import logger
 from helper_ackPayload import genAckPayload
-from helper_sql import SqlBulkExecute, sqlExecute, sqlQuery, sqlStoredProcedure
+from helper_sql import sqlExecute, sqlQuery, sqlStats, sqlStoredProcedure
 from inventory import Inventory
 from network.threads import StoppableThread
 from version import softwareVersion
@@ -446,6 +447,11 @@ class BMXMLRPCRequestHandler(SimpleXMLRPCRequestHandler):
 class BMRPCDispatcher(object):
     """This class is used to dispatch API commands"""
     __metaclass__ = CommandHandler
+    #: the maximum number of messages in a page
+    maxPageSize = 1000
+    #: the column expressions of the message bodies of the inbox and sent
+    inboxBody = '(SELECT message FROM message_body WHERE id=msgid)'
+    sentBody = '(SELECT message FROM message_body WHERE id=ackdata)'
 
     @staticmethod
     def _decode(text, decode_type):
@@ -530,6 +536,61 @@ class BMRPCDispatcher(object):
             'ackData': hexlify(ackdata)
         }
 
+    def _page(  # pylint: disable=too-many-arguments
+            self, query, position, key, cursor, limit):
+        """
+        Execute the *query* of messages for a page of at most *limit*
+        messages ordered by the *position* column, the fifth of the
+        query, and the unique *key* column, the first or the last one,
+        following the *cursor*. Return the rows and the cursor of the
+        next page, which is empty after the last page.
+        """
+        if not 0 < limit <= self.maxPageSize:
+            raise APIError(
+                28, 'Limit should be between 1 and %i' % self.maxPageSize)
+        args = []
+        if cursor:
+            try:
+                last, hid = cursor.split(',')
+                args = [last, last, unhexlify(hid)]
+            except (ValueError, TypeError):
+                raise APIError(28, 'Invalid cursor: %r' % cursor)
+            query += ' AND {0}>=? AND ({0}>? OR {1}>?)'.format(position, key)
+        query += ' ORDER BY {0}, {1} LIMIT ?'.format(position, key)
+        queryreturn = sqlQuery(query, *(args + [limit]))
+        if len(queryreturn) < limit:
+            return queryreturn, ''
+        last = queryreturn[-1]
+        return queryreturn, '%s,%s' % (
+            last[4], hexlify(last[0] if key == 'msgid' else last[-1]))
+
+    def _inbox_page(self, cursor, limit, headers=False):
+        queryreturn, cursor = self._page(
+            "SELECT msgid, toaddress, fromaddress, subject, received, %s,"
+            " encodingtype, read FROM inbox WHERE folder='inbox'"
+            % ("''" if headers else self.inboxBody),
+            'received', 'msgid', cursor, limit)
+        messages = [
+            self._dump_inbox_message(*data) for data in queryreturn]
+        if headers:
+            for message in messages:
+                del message['message']
+        return messages, cursor
+
+    def _sent_page(self, cursor, limit, headers=False):
+        queryreturn, cursor = self._page(
+            "SELECT msgid, toaddress, fromaddress, subject, lastactiontime,"
+            " %s, encodingtype, status, ackdata FROM sent"
+            " WHERE folder='sent'" % ("''" if headers else self.sentBody),
+            # the msgid is empty until the message is sent
+            'lastactiontime', 'ackdata', cursor, limit)
+        messages = [
+            self._dump_sent_message(*data) for data in queryreturn]
+        if headers:
+            for message in messages:
+                del message['message']
+        return messages, cursor
+
     # Request Handlers
 
     @command('decodeAddress')
@@ -879,14 +940,31 @@ class BMRPCDispatcher(object):
         *subject* and *message* are base64 encoded.
         """
 
-        queryreturn = sqlQuery(
-            "SELECT msgid, toaddress, fromaddress, subject, received, message,"
-            " encodingtype, read FROM inbox WHERE folder='inbox'"
-            " ORDER BY received"
-        )
-        return {"inboxMessages": [
-            self._dump_inbox_message(*data) for data in queryreturn
-        ]}
+        messages, cursor = self._inbox_page('', self.maxPageSize)
+        while cursor:
+            page, cursor = self._inbox_page(cursor, self.maxPageSize)
+            messages.extend(page)
+        return {"inboxMessages": messages}
+
+    @command('getInboxMessages')
+    def HandleGetInboxMessages(self, cursor='', limit=100):
+        """
+        Returns a page of at most *limit* inbox messages in the same form
+        as *getAllInboxMessages*, the oldest first, and the cursor of the
+        next page in the *nextCursor* key or empty string if there are
+        no more messages. Start with an empty *cursor*.
+        """
+        messages, cursor = self._inbox_page(cursor, limit)
+        return {"inboxMessages": messages, "nextCursor": cursor}
+
+    @command('getInboxMessageHeaders')
+    def HandleGetInboxMessageHeaders(self, cursor='', limit=100):
+        """
+        The same as *getInboxMessages* but the messages
+        have no *message* key.
+        """
+        messages, cursor = self._inbox_page(cursor, limit, True)
+        return {"inboxMessages": messages, "nextCursor": cursor}
 
     @command('getAllInboxMessageIds', 'getAllInboxMessageIDs')
     def HandleGetAllInboxMessageIds(self):
@@ -930,8 +1008,9 @@ class BMRPCDispatcher(object):
             except IndexError:
                 pass
         queryreturn = sqlQuery(
-            "SELECT msgid, toaddress, fromaddress, subject, received, message,"
-            " encodingtype, read FROM inbox WHERE msgid=?", msgid
+            "SELECT msgid, toaddress, fromaddress, subject, received, %s,"
+            " encodingtype, read FROM inbox WHERE msgid=?" % self.inboxBody,
+            msgid
         )
         try:
             return {"inboxMessage": [
@@ -949,14 +1028,29 @@ class BMRPCDispatcher(object):
         *ackData* is also a hex encoded string.
         """
 
-        queryreturn = sqlQuery(
-            "SELECT msgid, toaddress, fromaddress, subject, lastactiontime,"
-            " message, encodingtype, status, ackdata FROM sent"
-            " WHERE folder='sent' ORDER BY lastactiontime"
-        )
-        return {"sentMessages": [
-            self._dump_sent_message(*data) for data in queryreturn
-        ]}
+        messages, cursor = self._sent_page('', self.maxPageSize)
+        while cursor:
+            page, cursor = self._sent_page(cursor, self.maxPageSize)
+            messages.extend(page)
+        return {"sentMessages": messages}
+
+    @command('getSentMessages')
+    def HandleGetSentMessages(self, cursor='', limit=100):
+        """
+        The same as *getInboxMessages* but for sent, result key -
+        *sentMessages*, ordered by *lastActionTime*.
+        """
+        messages, cursor = self._sent_page(cursor, limit)
+        return {"sentMessages": messages, "nextCursor": cursor}
+
+    @command('getSentMessageHeaders')
+    def HandleGetSentMessageHeaders(self, cursor='', limit=100):
+        """
+        The same as *getSentMessages* but the messages
+        have no *message* key.
+        """
+        messages, cursor = self._sent_page(cursor, limit, True)
+        return {"sentMessages": messages, "nextCursor": cursor}
 
     @command('getAllSentMessageIds', 'getAllSentMessageIDs')
     def HandleGetAllSentMessageIds(self):
@@ -973,6 +1067,57 @@ class BMRPCDispatcher(object):
             {'msgid': hexlify(msgid)} for msgid, in queryreturn
         ]}
 
+    @command('searchMessages')
+    def HandleSearchMessages(self, what, folder='inbox', where=''):
+        """
+        Returns the messages in *folder* containing *what* in the *where*
+        field: 'toaddress', 'fromaddress', 'subject', 'message' or any
+        of them if empty. For the 'sent' folder the result key is
+        *sentMessages* and the message dict keys are *ackData*,
+        *toAddress*, *fromAddress*, *subject*, *lastActionTime*, *status*.
+        For the other folders the result key is *inboxMessages* and
+        the keys are *msgid*, *toAddress*, *fromAddress*, *subject*,
+        *receivedTime*, *read*. *subject* is base64 encoded.
+        """
+        queryreturn = helper_search.search_sql(
+            folder=folder, where=where, what=what)
+        if folder == 'sent':
+            return {"sentMessages": [{
+                'ackData': hexlify(ackdata),
+                'toAddress': toAddress,
+                'fromAddress': fromAddress,
+                'subject': base64.b64encode(
+                    shared.fixPotentiallyInvalidUTF8Data(subject)),
+                'lastActionTime': lastactiontime,
+                'status': status
+            } for toAddress, fromAddress, subject, status, ackdata,
+                lastactiontime in queryreturn]}
+        return {"inboxMessages": [{
+            'msgid': hexlify(msgid),
+            'toAddress': toAddress,
+            'fromAddress': fromAddress,
+            'subject': base64.b64encode(
+                shared.fixPotentiallyInvalidUTF8Data(subject)),
+            'receivedTime': received,
+            'read': read
+        } for toAddress, fromAddress, subject, _, msgid, received, read
+            in queryreturn]}
+
+    @command('getUnreadCounts')
+    def HandleGetUnreadCounts(self, toAddress=''):
+        """
+        Returns the numbers of unread messages in the *unreadCounts* key,
+        a list of dicts with keys *toAddress*, *folder* and *count*,
+        or, if *toAddress* is given, with keys *fromAddress*, *folder* and
+        *count* for the messages sent to *toAddress*.
+        """
+        addressKey = 'fromAddress' if toAddress else 'toAddress'
+        return {"unreadCounts": [
+            {addressKey: address, 'folder': folder, 'count': count}
+            for address, folder, count in helper_inbox.unreadCounts(
+                toAddress or None)
+        ]}
+
     # after some time getInboxMessagesByAddress should be removed
     @command('getInboxMessagesByReceiver', 'legacy:getInboxMessagesByAddress')
     def HandleInboxMessagesByReceiver(self, toAddress):
@@ -983,8 +1128,8 @@ class BMRPCDispatcher(object):
 
         queryreturn = sqlQuery(
             "SELECT msgid, toaddress, fromaddress, subject, received,"
-            " message, encodingtype, read FROM inbox WHERE folder='inbox'"
-            " AND toAddress=?", toAddress)
+            " %s, encodingtype, read FROM inbox WHERE folder='inbox'"
+            " AND toAddress=?" % self.inboxBody, toAddress)
         return {"inboxMessages": [
             self._dump_inbox_message(*data) for data in queryreturn
         ]}
@@ -1000,8 +1145,8 @@ class BMRPCDispatcher(object):
         msgid = self._decode(hid, "hex")
         queryreturn = sqlQuery(
             "SELECT msgid, toaddress, fromaddress, subject, lastactiontime,"
-            " message, encodingtype, status, ackdata FROM sent WHERE msgid=?",
-            msgid
+            " %s, encodingtype, status, ackdata FROM sent WHERE msgid=?"
+            % self.sentBody, msgid
         )
         try:
             return {"sentMessage": [
@@ -1019,9 +1164,9 @@ class BMRPCDispatcher(object):
 
         queryreturn = sqlQuery(
             "SELECT msgid, toaddress, fromaddress, subject, lastactiontime,"
-            " message, encodingtype, status, ackdata FROM sent"
-            " WHERE folder='sent' AND fromAddress=? ORDER BY lastactiontime",
-            fromAddress
+            " %s, encodingtype, status, ackdata FROM sent"
+            " WHERE folder='sent' AND fromAddress=? ORDER BY lastactiontime"
+            % self.sentBody, fromAddress
         )
         return {"sentMessages": [
             self._dump_sent_message(*data) for data in queryreturn
@@ -1037,8 +1182,8 @@ class BMRPCDispatcher(object):
         ackData = self._decode(ackData, "hex")
         queryreturn = sqlQuery(
             "SELECT msgid, toaddress, fromaddress, subject, lastactiontime,"
-            " message, encodingtype, status, ackdata FROM sent"
-            " WHERE ackdata=?", ackData
+            " %s, encodingtype, status, ackdata FROM sent"
+            " WHERE ackdata=?" % self.sentBody, ackData
         )
 
         try:
@@ -1393,26 +1538,18 @@ class BMRPCDispatcher(object):
                 ' thus 64 characters).')
         requestedHash = self._decode(requestedHash, "hex")
 
-        # This is not a particularly commonly used API function. Before we
-        # use it we'll need to fill out a field in our inventory database
-        # which is blank by default (first20bytesofencryptedmessage).
-        queryreturn = sqlQuery(
-            "SELECT hash, payload FROM inventory WHERE tag = ''"
-            " and objecttype = 2")
-        with SqlBulkExecute() as sql:
-            for hash01, payload in queryreturn:
-                readPosition = 16  # Nonce length + time length
-                # Stream Number length
-                readPosition += decodeVarint(
-                    payload[readPosition:readPosition + 10])[1]
-                t = (payload[readPosition:readPosition + 32], hash01)
-                sql.execute("UPDATE inventory SET tag=? WHERE hash=?", *t)
-
-        queryreturn = sqlQuery(
-            "SELECT payload FROM inventory WHERE tag = ?", requestedHash)
-        return {"receivedMessageDatas": [
-            {'data': hexlify(payload)} for payload, in queryreturn
-        ]}
+        # This is not a particularly commonly used API function, so we
+        # simply look for the destination hash in every msg object.
+        receivedMessageDatas = []
+        for value in Inventory().by_type_and_tag(2):
+            payload = value.payload
+            readPosition = 16  # Nonce length + time length
+            # Stream Number length
+            readPosition += decodeVarint(
+                payload[readPosition:readPosition + 10])[1]
+            if payload[readPosition:readPosition + 32] == requestedHash:
+                receivedMessageDatas.append({'data': hexlify(payload)})
+        return {"receivedMessageDatas": receivedMessageDatas}
 
     @command('clientStatus')
     def HandleClientStatus(self):
@@ -1464,6 +1601,18 @@ class BMRPCDispatcher(object):
         sqlStoredProcedure('deleteandvacuume')
         return 'done'
 
+    @command('getSqlStats')
+    def HandleGetSqlStats(self, reset=False):
+        """
+        Returns the timings of the SQL statements since the start or the
+        last reset as a dict with keys *since* and *statements*, a list
+        of dicts with keys *statement*, *count*, *rows*, *lockWaitMs*,
+        *queueWaitMs*, *executeMs*, *maxExecuteMs*, *histogram* (the number
+        of executions by upper bound of the execution time) and *callers*.
+        Resets the timings if *reset* is true.
+        """
+        return sqlStats.dump(reset)
+
     @command('shutdown')
     def HandleShutdown(self):
         """Shutdown the bitmessage. Returns 'done'."""
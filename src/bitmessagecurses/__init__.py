@@ -29,6 +29,7 @@ import state
 from addresses import addBMIfNotPresent, decodeAddress
 from bmconfigparser import BMConfigParser
 from helper_ackPayload import genAckPayload
+from helper_inbox import unreadCount
 from helper_sql import sqlExecute, sqlQuery
 from inventory import Inventory
 # pylint: disable=global-statement
@@ -41,6 +42,7 @@ naptime = 100
 log = ""
 logpad = None
 inventorydata = 0
+unread = 0
 startuptime = time.time()
 
 inbox = []
@@ -118,6 +120,8 @@ def drawmenu(stdscr):
             menustr = menustr[:-1]
             menustr += "["
         menustr += str(i + 1) + menu[i]
+        if i == 0 and unread:
+            menustr += " (%i)" % unread
         if menutab == i + 1:
             menustr += "] "
         elif i != len(menu) - 1:
@@ -142,13 +146,20 @@ def scrollbox(d, text, height=None, width=None):
 
 
 def resetlookups():
-    """Reset the Inventory Lookups"""
+    """Reset the Inventory Lookups and refresh the unread count"""
     global inventorydata
     inventorydata = Inventory().numberOfInventoryLookupsPerformed
     Inventory().numberOfInventoryLookupsPerformed = 0
+    updateUnread()
     Timer(1, resetlookups, ()).start()
 
 
+def updateUnread():
+    """Cache the number of unread inbox messages for the menu"""
+    global unread
+    unread = unreadCount()
+
+
 def drawtab(stdscr):
     """Method for drawing different tabs"""
     # pylint: disable=too-many-branches, too-many-statements
@@ -357,7 +368,7 @@ def handlech(c, stdscr):
                                 inbox[inboxcur][1] +
                                 "\"")
                             data = ""       # pyint: disable=redefined-outer-name
-                            ret = sqlQuery("SELECT message FROM inbox WHERE msgid=?", inbox[inboxcur][0])
+                            ret = sqlQuery("SELECT message FROM message_body WHERE id=?", inbox[inboxcur][0])
                             if ret != []:
                                 for row in ret:
                                     data, = row
@@ -368,11 +379,13 @@ def handlech(c, stdscr):
                                 scrollbox(d, unicode(ascii(msg)), 30, 80)
                                 sqlExecute("UPDATE inbox SET read=1 WHERE msgid=?", inbox[inboxcur][0])
                                 inbox[inboxcur][7] = 1
+                                updateUnread()
                             else:
                                 scrollbox(d, unicode("Could not fetch message."))
                         elif t == "2":       # Mark unread
                             sqlExecute("UPDATE inbox SET read=0 WHERE msgid=?", inbox[inboxcur][0])
                             inbox[inboxcur][7] = 0
+                            updateUnread()
                         elif t == "3":       # Reply
                             curses.curs_set(1)
                             m = inbox[inboxcur]
@@ -395,7 +408,7 @@ def handlech(c, stdscr):
                             if not m[5][:4] == "Re: ":
                                 subject = "Re: " + m[5]
                             body = ""
-                            ret = sqlQuery("SELECT message FROM inbox WHERE msgid=?", m[0])
+                            ret = sqlQuery("SELECT message FROM message_body WHERE id=?", m[0])
                             if ret != []:
                                 body = "\n\n------------------------------------------------------\n"
                                 for row in ret:
@@ -421,7 +434,7 @@ def handlech(c, stdscr):
                             r, t = d.inputbox("Filename", init=inbox[inboxcur][5] + ".txt")
                             if r == d.DIALOG_OK:
                                 msg = ""
-                                ret = sqlQuery("SELECT message FROM inbox WHERE msgid=?", inbox[inboxcur][0])
+                                ret = sqlQuery("SELECT message FROM message_body WHERE id=?", inbox[inboxcur][0])
                                 if ret != []:
                                     for row in ret:
                                         msg, = row
@@ -433,6 +446,7 @@ def handlech(c, stdscr):
                         elif t == "6":       # Move to trash
                             sqlExecute("UPDATE inbox SET folder='trash' WHERE msgid=?", inbox[inboxcur][0])
                             del inbox[inboxcur]
+                            updateUnread()
                             scrollbox(d, unicode(
                                 "Message moved to trash. There is no interface to view your trash,"
                                 " \nbut the message is still on disk if you are desperate to recover it."))
@@ -461,8 +475,7 @@ def handlech(c, stdscr):
                                 "\"")
                             data = ""
                             ret = sqlQuery(
-                                "SELECT message FROM sent WHERE subject=? AND ackdata=?",
-                                sentbox[sentcur][4],
+                                "SELECT message FROM message_body WHERE id=?",
                                 sentbox[sentcur][6])
                             if ret != []:
                                 for row in ret:
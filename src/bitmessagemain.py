@@ -43,14 +43,15 @@ from inventory import Inventory
 # Network objects and threads
 from network import (
     BMConnectionPool, Dandelion, AddrThread, AnnounceThread, BMNetworkThread,
-    InvThread, ReceiveQueueThread, DownloadThread, UploadThread
+    BMNetworkShardThread, InvThread, ReceiveQueueThread, DownloadThread,
+    UploadThread
 )
 from network.knownnodes import readKnownNodes
 from singleinstance import singleinstance
 # Synchronous threads
 from threads import (
-    set_thread_name, printLock,
-    addressGenerator, objectProcessor, singleCleaner, singleWorker, sqlThread)
+    set_thread_name, printLock, addressGenerator, inventoryWriter,
+    objectProcessor, singleCleaner, singleWorker, sqlThread)
 
 
 def _fixSocket():
@@ -262,6 +263,11 @@ class Main(object):
         sqlLookup.start()
 
         Inventory()  # init
+        # Start the thread writing the new objects behind,
+        # stopped and joined after the final flush by the shutdown
+        inventoryWriterThread = inventoryWriter()
+        inventoryWriterThread.daemon = True
+        inventoryWriterThread.start()
         # init, needs to be early because other thread may access it early
         Dandelion()
 
@@ -316,7 +322,16 @@ class Main(object):
             asyncoreThread = BMNetworkThread()
             asyncoreThread.daemon = True
             asyncoreThread.start()
-            for i in range(config.getint('threads', 'receive')):
+            for i in range(1, config.getint('threads', 'network')):
+                networkShardThread = BMNetworkShardThread(i)
+                networkShardThread.daemon = True
+                networkShardThread.start()
+            # the received data is processed by the network threads
+            # with the inline processing
+            for i in range(
+                0 if config.safeGetBoolean('network', 'inlineprocessing')
+                else config.getint('threads', 'receive')
+            ):
                 receiveQueueThread = ReceiveQueueThread(i)
                 receiveQueueThread.daemon = True
                 receiveQueueThread.start()
@@ -37,6 +37,7 @@ import settingsmixin
 import support
 from helper_ackPayload import genAckPayload
 from helper_sql import sqlQuery, sqlExecute, sqlExecuteChunked, sqlStoredProcedure
+import helper_inbox
 import helper_search
 import l10n
 from utils import str_broadcast_subscribers, avatarize
@@ -535,7 +536,7 @@ class MyForm(settingsmixin.SMainWindow):
 
         # get number of (unread) messages
         total = 0
-        queryreturn = sqlQuery('SELECT toaddress, folder, count(msgid) as cnt FROM inbox WHERE read = 0 GROUP BY toaddress, folder')
+        queryreturn = helper_inbox.unreadCounts()
         for row in queryreturn:
             toaddress, folder, cnt = row
             total += cnt
@@ -1010,9 +1011,7 @@ class MyForm(settingsmixin.SMainWindow):
     # - corresponding account if current is "All accounts"
     # - current account otherwise
     def propagateUnreadCount(self, folder=None, widget=None):
-        queryReturn = sqlQuery(
-            'SELECT toaddress, folder, COUNT(msgid) AS cnt'
-            ' FROM inbox WHERE read = 0 GROUP BY toaddress, folder')
+        queryReturn = helper_inbox.unreadCounts()
         totalUnread = {}
         normalUnread = {}
         broadcastsUnread = {}
@@ -1033,10 +1032,8 @@ class MyForm(settingsmixin.SMainWindow):
                 self.ui.treeWidgetYourIdentities,
                 self.ui.treeWidgetSubscriptions, self.ui.treeWidgetChans
             )
-            queryReturn = sqlQuery(
-                'SELECT fromaddress, folder, COUNT(msgid) AS cnt'
-                ' FROM inbox WHERE read = 0 AND toaddress = ?'
-                ' GROUP BY fromaddress, folder', str_broadcast_subscribers)
+            queryReturn = helper_inbox.unreadCounts(
+                str_broadcast_subscribers)
             for addr, fld, count in queryReturn:
                 try:
                     broadcastsUnread[addr][fld] = count
@@ -1799,11 +1796,7 @@ class MyForm(settingsmixin.SMainWindow):
 
     def findInboxUnreadCount(self, count=None):
         if count is None:
-            queryreturn = sqlQuery('''SELECT count(*) from inbox WHERE folder='inbox' and read=0''')
-            cnt = 0
-            for row in queryreturn:
-                cnt, = row
-            self.unreadCount = int(cnt)
+            self.unreadCount = int(helper_inbox.unreadCount())
         else:
             self.unreadCount = count
         return self.unreadCount
@@ -2847,7 +2840,7 @@ class MyForm(settingsmixin.SMainWindow):
         if not msgid:
             return
         queryreturn = sqlQuery(
-            '''select message from inbox where msgid=?''', msgid)
+            '''select message from message_body where id=?''', msgid)
         if queryreturn != []:
             for row in queryreturn:
                 messageText, = row
@@ -2969,8 +2962,7 @@ class MyForm(settingsmixin.SMainWindow):
             currentInboxRow, column_from).address
         msgid = tableWidget.item(currentInboxRow, 3).data()
         queryreturn = sqlQuery(
-            "SELECT message FROM inbox WHERE msgid=?", msgid
-        ) or sqlQuery("SELECT message FROM sent WHERE ackdata=?", msgid)
+            "SELECT message FROM message_body WHERE id=?", msgid)
         if queryreturn != []:
             for row in queryreturn:
                 messageAtCurrentInboxRow, = row
@@ -3200,7 +3192,7 @@ class MyForm(settingsmixin.SMainWindow):
         # Retrieve the message data out of the SQL database
         msgid = tableWidget.item(currentInboxRow, 3).data()
         queryreturn = sqlQuery(
-            '''select message from inbox where msgid=?''', msgid)
+            '''select message from message_body where id=?''', msgid)
         if queryreturn != []:
             for row in queryreturn:
                 message, = row
@@ -4040,11 +4032,7 @@ class MyForm(settingsmixin.SMainWindow):
         folder = self.getCurrentFolder()
         if msgid:
             queryreturn = sqlQuery(
-                '''SELECT message FROM %s WHERE %s=?''' % (
-                    ('sent', 'ackdata') if folder == 'sent'
-                    else ('inbox', 'msgid')
-                ), msgid
-            )
+                '''SELECT message FROM message_body WHERE id=?''', msgid)
 
         try:
             message = queryreturn[-1][0]
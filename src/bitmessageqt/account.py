@@ -20,6 +20,7 @@ import queues
 from addresses import decodeAddress
 from bmconfigparser import BMConfigParser
 from helper_ackPayload import genAckPayload
+from helper_inbox import unreadCounts
 from helper_sql import sqlQuery, sqlExecute
 from .foldertree import AccountMixin
 from .utils import str_broadcast_subscribers
@@ -63,12 +64,11 @@ def getSortedSubscriptions(count=False):
         ret[address]["inbox"]['enabled'] = enabled
         ret[address]["inbox"]['count'] = 0
     if count:
-        queryreturn = sqlQuery('''SELECT fromaddress, folder, count(msgid) as cnt
-            FROM inbox, subscriptions ON subscriptions.address = inbox.fromaddress
-            WHERE read = 0 AND toaddress = ?
-            GROUP BY inbox.fromaddress, folder''', str_broadcast_subscribers)
+        queryreturn = unreadCounts(str_broadcast_subscribers)
         for row in queryreturn:
             address, folder, cnt = row
+            if address not in ret:
+                continue
             if folder not in ret[address]:
                 ret[address][folder] = {
                     'label': ret[address]['inbox']['label'],
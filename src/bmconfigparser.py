@@ -23,18 +23,25 @@ BMConfigDefaults = {
     },
     "threads": {
         "receive": 3,
+        "network": 1,
     },
     "network": {
         "bind": '',
         "dandelion": 90,
+        "eventpoller": False,
+        "inlineprocessing": False,
     },
     "inventory": {
         "storage": "sqlite",
         "acceptmismatch": False,
+        "cachesize": 32,
     },
     "knownnodes": {
         "maxnodes": 20000,
     },
+    "sql": {
+        "slowquerythreshold": 500,
+    },
     "zlib": {
         'maxsize': 1048576
     }
@@ -0,0 +1,17 @@
+"""
+The `inventoryWriter` thread writes the new objects of the inventory
+to the disk in the background, when the storage wants them written
+(see `.storage.sqlite.SqliteInventory`). It's stopped before the final
+`.Inventory.flush` in the `.shutdown`, which then joins it.
+"""
+
+from inventory import Inventory
+from network import StoppableThread
+
+
+class inventoryWriter(StoppableThread):
+    """The inventoryWriter thread class"""
+    name = "inventoryWriter"
+
+    def run(self):
+        Inventory().writeBehind(self.stop)
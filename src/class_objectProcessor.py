@@ -6,6 +6,7 @@ processes the network objects
 # pylint: disable=too-many-branches,too-many-statements
 import hashlib
 import logging
+import os
 import random
 import threading
 import time
@@ -30,7 +31,7 @@ from addresses import (
 from bmconfigparser import BMConfigParser
 from fallback import RIPEMD160Hash
 from helper_ackPayload import genAckPayload
-from helper_sql import SqlBulkExecute, sqlExecute, sqlQuery
+from helper_sql import sqlExecute, sqlQuery
 from network import bmproto, knownnodes
 from network.node import Peer
 # pylint: disable=too-many-locals, too-many-return-statements, too-many-branches, too-many-statements
@@ -46,20 +47,25 @@ class objectProcessor(threading.Thread):
     def __init__(self):
         threading.Thread.__init__(self, name="objectProcessor")
         random.seed()
-        # It may be the case that the last time Bitmessage was running,
-        # the user closed it before it finished processing everything in the
-        # objectProcessorQueue. Assuming that Bitmessage wasn't closed
-        # forcefully, it should have saved the data in the queue into the
-        # objectprocessorqueue table. Let's pull it out.
+        # The objects put into the objectProcessorQueue are journaled
+        # until they are processed, the objects left in the journal
+        # the last time Bitmessage was running are processed first.
+        backlog = queues.objectProcessorQueue.open(
+            os.path.join(state.appdata, 'objectqueue'))
+        logger.debug(
+            '%s objects left in the objectProcessorQueue journal.', backlog)
+        # The older versions saved the objects left in the queue
+        # into the objectprocessorqueue table on shutdown.
         queryreturn = sqlQuery(
             '''SELECT objecttype, data FROM objectprocessorqueue''')
         for row in queryreturn:
             objectType, data = row
             queues.objectProcessorQueue.put((objectType, data))
-        sqlExecute('''DELETE FROM objectprocessorqueue''')
-        logger.debug(
-            'Loaded %s objects from disk into the objectProcessorQueue.',
-            len(queryreturn))
+        if queryreturn:
+            sqlExecute('''DELETE FROM objectprocessorqueue''')
+            logger.debug(
+                'Loaded %s objects from disk into the objectProcessorQueue.',
+                len(queryreturn))
         self._ack_obj = bmproto.BMStringParser()
         self.successfullyDecryptMessageTimings = []
 
@@ -109,22 +115,16 @@ class objectProcessor(threading.Thread):
                 logger.critical(
                     'Critical error within objectProcessorThread: \n',
                     exc_info=True)
+            queues.objectProcessorQueue.acknowledge()
 
             if state.shutdown:
                 # Wait just a moment for most of the connections to close
                 time.sleep(.5)
-                numberOfObjectsThatWereInTheObjectProcessorQueue = 0
-                with SqlBulkExecute() as sql:
-                    while queues.objectProcessorQueue.curSize > 0:
-                        objectType, data = queues.objectProcessorQueue.get()
-                        sql.execute(
-                            'INSERT INTO objectprocessorqueue VALUES (?,?)',
-                            objectType, data)
-                        numberOfObjectsThatWereInTheObjectProcessorQueue += 1
+                # the objects left are kept in the journal
+                queues.objectProcessorQueue.close()
                 logger.debug(
-                    'Saved %s objects from the objectProcessorQueue to'
-                    ' disk. objectProcessorThread exiting.',
-                    numberOfObjectsThatWereInTheObjectProcessorQueue)
+                    'Closed the objectProcessorQueue journal.'
+                    ' objectProcessorThread exiting.')
                 state.shutdown = 2
                 break
 
@@ -28,7 +28,7 @@ from addresses import (
     calculateInventoryHash, decodeAddress, decodeVarint, encodeVarint
 )
 from bmconfigparser import BMConfigParser
-from helper_sql import sqlExecute, sqlQuery
+from helper_sql import sqlExecute, sqlExecuteDeferred, sqlQuery
 from inventory import Inventory
 from network import knownnodes, StoppableThread
 
@@ -524,8 +524,9 @@ class singleWorker(StoppableThread):
 
             '''WHERE status = 'doingbroadcastpow' ''')
         queryreturn = sqlQuery(
-            '''SELECT fromaddress, subject, message, '''
+            '''SELECT fromaddress, subject, message_body.message, '''
             ''' ackdata, ttl, encodingtype FROM sent '''
+            ''' LEFT JOIN message_body ON message_body.id=ackdata '''
             ''' WHERE status=? and folder='sent' ''', 'broadcastqueued')
 
         for row in queryreturn:
@@ -679,7 +680,7 @@ class singleWorker(StoppableThread):
 
             # Update the status of the message in the 'sent' table to have
             # a 'broadcastsent' status
-            sqlExecute(
+            sqlExecuteDeferred(
                 'UPDATE sent SET msgid=?, status=?, lastactiontime=?'
                 ' WHERE ackdata=?',
                 inventoryHash, 'broadcastsent', int(time.time()), ackdata
@@ -693,9 +694,10 @@ class singleWorker(StoppableThread):
             '''UPDATE sent SET status='msgqueued' '''
             ''' WHERE status IN ('doingpubkeypow', 'doingmsgpow')''')
         queryreturn = sqlQuery(
-            '''SELECT toaddress, fromaddress, subject, message, '''
-            ''' ackdata, status, ttl, retrynumber, encodingtype FROM '''
-            ''' sent WHERE (status='msgqueued' or status='forcepow') '''
+            '''SELECT toaddress, fromaddress, subject, message_body.message, '''
+            ''' ackdata, status, ttl, retrynumber, encodingtype FROM sent '''
+            ''' LEFT JOIN message_body ON message_body.id=ackdata '''
+            ''' WHERE (status='msgqueued' or status='forcepow') '''
             ''' and folder='sent' ''')
         # while we have a msg that needs some work
         for row in queryreturn:
@@ -753,7 +755,7 @@ class singleWorker(StoppableThread):
                     # is >= 4 then usedpersonally will already be set
                     # to yes because we'll only ever have
                     # usedpersonally v4 pubkeys in the pubkeys table.
-                    sqlExecute(
+                    sqlExecuteDeferred(
                         '''UPDATE pubkeys SET usedpersonally='yes' '''
                         ''' WHERE address=?''',
                         toaddress
@@ -770,7 +772,7 @@ class singleWorker(StoppableThread):
                     if toaddress in state.neededPubkeys or \
                             toTag in state.neededPubkeys:
                         # We already sent a request for the pubkey
-                        sqlExecute(
+                        sqlExecuteDeferred(
                             '''UPDATE sent SET status='awaitingpubkey', '''
                             ''' sleeptill=? WHERE toaddress=? '''
                             ''' AND status='msgqueued' ''',
@@ -843,7 +845,7 @@ class singleWorker(StoppableThread):
                                 # with the correct tag then we'll try
                                 # to decrypt those.
                         if needToRequestPubkey:
-                            sqlExecute(
+                            sqlExecuteDeferred(
                                 '''UPDATE sent SET '''
                                 ''' status='doingpubkeypow' WHERE '''
                                 ''' toaddress=? AND status='msgqueued' ''',
@@ -1037,7 +1039,7 @@ class singleWorker(StoppableThread):
                         if cond1 or cond2:
                             # The demanded difficulty is more than
                             # we are willing to do.
-                            sqlExecute(
+                            sqlExecuteDeferred(
                                 '''UPDATE sent SET status='toodifficult' '''
                                 ''' WHERE ackdata=? ''',
                                 ackdata)
@@ -1186,7 +1188,7 @@ class singleWorker(StoppableThread):
                     payload, "04" + hexlify(pubEncryptionKeyBase256)
                 )
             except:
-                sqlExecute(
+                sqlExecuteDeferred(
                     '''UPDATE sent SET status='badkey' WHERE ackdata=?''',
                     ackdata
                 )
@@ -1292,7 +1294,7 @@ class singleWorker(StoppableThread):
                 newStatus = 'msgsent'
             # wait 10% past expiration
             sleepTill = int(time.time() + TTL * 1.1)
-            sqlExecute(
+            sqlExecuteDeferred(
                 '''UPDATE sent SET msgid=?, status=?, retrynumber=?, '''
                 ''' sleeptill=?, lastactiontime=? WHERE ackdata=?''',
                 inventoryHash, newStatus, retryNumber + 1,
@@ -1422,7 +1424,7 @@ class singleWorker(StoppableThread):
 
         # wait 10% past expiration
         sleeptill = int(time.time() + TTL * 1.1)
-        sqlExecute(
+        sqlExecuteDeferred(
             '''UPDATE sent SET lastactiontime=?, '''
             ''' status='awaitingpubkey', retrynumber=?, sleeptill=? '''
             ''' WHERE toaddress=? AND (status='doingpubkeypow' OR '''
@@ -3,6 +3,8 @@ sqlThread is defined here
 """
 
 import os
+import Queue
+import re
 import shutil  # used for moving the messages.dat file
 import sqlite3
 import sys
@@ -23,16 +25,39 @@ from debug import logger
 class sqlThread(threading.Thread):
     """A thread for all SQL operations"""
 
+    #: commit the statements submitted with `.helper_sql.sqlExecuteDeferred`
+    #: that many seconds after the first of them ...
+    deferredMaxDelay = 1
+    #: ... or when there are that many of them
+    deferredMaxStatements = 100
+    #: the columns of the inbox and sent in the full text index
+    searchColumns = 'toaddress, fromaddress, subject, message'
+    #: tables with the message bodies in message_body and their key columns
+    bodyKeys = (('inbox', 'msgid'), ('sent', 'ackdata'))
+    #: reclaim the free pages when idle for that many seconds ...
+    vacuumInterval = 10
+    #: ... that many pages at a time
+    vacuumPages = 256
+    #: the tables of which the deleted content is overwritten
+    secureDeleteTables = ('inbox', 'sent', 'message_body')
+    #: the writes and the table they write to
+    writeStatement = re.compile(
+        r'\s*(?:INSERT|REPLACE|UPDATE|DELETE)\b(?:\s+OR\s+\w+)?'
+        r'(?:\s+INTO|\s+FROM)?\s+(\w+)', re.I)
+
     def __init__(self):
         threading.Thread.__init__(self, name="SQL")
+        # number of the deferred writes not committed yet
+        self.deferred = 0
+        self.deferredSince = 0
+        self.secureDelete = True
+        # whether a write has opened a transaction not committed yet
+        self.inTransaction = False
+        self.reclaim = True
 
     def run(self):  # pylint: disable=too-many-locals, too-many-branches, too-many-statements
         """Process SQL queries from `.helper_sql.sqlSubmitQueue`"""
-        self.conn = sqlite3.connect(state.appdata + 'messages.dat')
-        self.conn.text_factory = str
-        self.cur = self.conn.cursor()
-
-        self.cur.execute('PRAGMA secure_delete = true')
+        self._connect(state.appdata + 'messages.dat')
 
         try:
             self.cur.execute(
@@ -54,20 +79,24 @@ class sqlThread(threading.Thread):
             self.cur.execute(
                 '''CREATE TABLE pubkeys (address text, addressversion int, transmitdata blob, time int,'''
                 ''' usedpersonally text, UNIQUE(address) ON CONFLICT REPLACE)''')
-            self.cur.execute(
-                '''CREATE TABLE inventory (hash blob, objecttype int, streamnumber int, payload blob,'''
-                ''' expirestime integer, tag blob, UNIQUE(hash) ON CONFLICT REPLACE)''')
             self.cur.execute(
                 '''INSERT INTO subscriptions VALUES'''
                 '''('Bitmessage new releases/announcements','BM-GtovgYdgs7qXPkoYaRgrLFuFKz1SFpsw',1)''')
             self.cur.execute(
                 '''CREATE TABLE settings (key blob, value blob, UNIQUE(key) ON CONFLICT REPLACE)''')
-            self.cur.execute('''INSERT INTO settings VALUES('version','10')''')
+            self.cur.execute('''INSERT INTO settings VALUES('version',18)''')
             self.cur.execute('''INSERT INTO settings VALUES('lastvacuumtime',?)''', (
                 int(time.time()),))
             self.cur.execute(
                 '''CREATE TABLE objectprocessorqueue'''
                 ''' (objecttype int, data blob, UNIQUE(objecttype, data) ON CONFLICT REPLACE)''')
+            # the indexes, tables and triggers of the versions 12 to 18
+            self._createFolderIndexes()
+            self._createLookupIndexes()
+            self._createUnreadCounters()
+            self._createMessageBodies()
+            for table, key in self.bodyKeys:
+                self._createSearchIndex(table, key)
             self.conn.commit()
             logger.info('Created messages database file')
         except Exception as err:
@@ -389,6 +418,138 @@ class sqlThread(threading.Thread):
                 ' and removing the hash field.')
             self.cur.execute('''update settings set value=10 WHERE key='version';''')
 
+        # Version 11 indexed the inventory table, which has since moved
+        # to inventory.dat: storage.sqlite copies the objects and drops it,
+        # the new tables are created with the indexes.
+        item = '''SELECT value FROM settings WHERE key='version';'''
+        parameters = ''
+        self.cur.execute(item, parameters)
+        currentVersion = int(self.cur.fetchall()[0][0])
+        if currentVersion == 10:
+            self.cur.execute('''update settings set value=11 WHERE key='version';''')
+            self.conn.commit()
+
+        # Index the inbox and sent folders by time and msgid,
+        # the order and the cursor of the paged API commands.
+        item = '''SELECT value FROM settings WHERE key='version';'''
+        parameters = ''
+        self.cur.execute(item, parameters)
+        currentVersion = int(self.cur.fetchall()[0][0])
+        if currentVersion == 11:
+            logger.debug(
+                'In messages.dat database, adding indexes for paging'
+                ' through the inbox and sent folders.')
+            self._createFolderIndexes()
+            self.cur.execute('''update settings set value=12 WHERE key='version';''')
+            self.conn.commit()
+
+        # Full text index of the addresses, subjects and bodies, searched by
+        # helper_search.search_sql. It's an FTS5 table with the trigram
+        # tokenizer if the SQLite library has it (3.34+), matching
+        # substrings like the LIKE it replaces, FTS4 otherwise.
+        # The index is created by the version 16, once the bodies
+        # have moved to the message_body table.
+        item = '''SELECT value FROM settings WHERE key='version';'''
+        parameters = ''
+        self.cur.execute(item, parameters)
+        currentVersion = int(self.cur.fetchall()[0][0])
+        if currentVersion == 12:
+            self.cur.execute('''update settings set value=13 WHERE key='version';''')
+            self.conn.commit()
+
+        # Index the columns by which the inbox and sent rows are looked up:
+        # the ackdata, msgid, status, recipient and sender of the sent
+        # messages, the sighash of the received ones and the read flag
+        # and recipient for the unread counts.
+        item = '''SELECT value FROM settings WHERE key='version';'''
+        parameters = ''
+        self.cur.execute(item, parameters)
+        currentVersion = int(self.cur.fetchall()[0][0])
+        if currentVersion == 13:
+            logger.debug(
+                'In messages.dat database, adding indexes to'
+                ' the inbox and sent tables.')
+            self._createLookupIndexes()
+            self.cur.execute('''update settings set value=14 WHERE key='version';''')
+            self.conn.commit()
+
+        # Count the unread messages by recipient, sender and folder in
+        # the inbox_unread table, kept up to date by triggers, instead
+        # of grouping the inbox on every refresh of the unread counts.
+        item = '''SELECT value FROM settings WHERE key='version';'''
+        parameters = ''
+        self.cur.execute(item, parameters)
+        currentVersion = int(self.cur.fetchall()[0][0])
+        if currentVersion == 14:
+            logger.debug(
+                'In messages.dat database, creating the inbox_unread table.')
+            self._createUnreadCounters()
+            self.cur.execute('''update settings set value=15 WHERE key='version';''')
+            self.conn.commit()
+
+        # Keep the message bodies in the message_body table, keyed by the
+        # msgid of the received and the ackdata of the sent messages, so
+        # that listing the folders doesn't read them. Triggers move the
+        # bodies inserted into the inbox and sent tables and the search
+        # index reads them through a view.
+        item = '''SELECT value FROM settings WHERE key='version';'''
+        parameters = ''
+        self.cur.execute(item, parameters)
+        currentVersion = int(self.cur.fetchall()[0][0])
+        if currentVersion == 15:
+            logger.debug(
+                'In messages.dat database, moving the message bodies'
+                ' to the message_body table.')
+            for table in ('inbox', 'sent'):
+                self._dropSearchIndex(table)
+            self._createMessageBodies()
+            for table, key in self.bodyKeys:
+                self._createSearchIndex(table, key)
+            self.cur.execute('''update settings set value=16 WHERE key='version';''')
+            self.conn.commit()
+
+        # Reclaim the free pages incrementally in the idle time of the thread
+        # (see _reclaim) instead of vacuuming the whole file. Switching
+        # an existing database to incremental auto_vacuum takes a VACUUM.
+        item = '''SELECT value FROM settings WHERE key='version';'''
+        parameters = ''
+        self.cur.execute(item, parameters)
+        currentVersion = int(self.cur.fetchall()[0][0])
+        if currentVersion == 16:
+            self.cur.execute('PRAGMA auto_vacuum')
+            if self.cur.fetchall()[0][0] != 2:
+                logger.info(
+                    'In messages.dat database, switching to incremental'
+                    ' auto_vacuum. Vacuuming now...')
+                self.conn.commit()
+                self.cur.execute(''' VACUUM ''')
+                # the full text indexes are keyed on the implicit rowids
+                # of the inbox and sent, which the VACUUM may renumber
+                for table, _ in self.bodyKeys:
+                    self._rebuildSearchIndex(table)
+            self.cur.execute('''update settings set value=17 WHERE key='version';''')
+            self.conn.commit()
+
+        # Page through the sent folder by time and ackdata: the msgid
+        # of the messages which are not sent yet is empty. The databases
+        # which reached the version 12 before have the index by msgid.
+        item = '''SELECT value FROM settings WHERE key='version';'''
+        parameters = ''
+        self.cur.execute(item, parameters)
+        currentVersion = int(self.cur.fetchall()[0][0])
+        if currentVersion == 17:
+            self.cur.execute(
+                "SELECT sql FROM sqlite_master"
+                " WHERE name='sent_folder_lastactiontime'")
+            if 'ackdata' not in self.cur.fetchall()[0][0]:
+                logger.debug(
+                    'In messages.dat database, indexing the sent folder'
+                    ' by lastactiontime and ackdata.')
+                self.cur.execute('''DROP INDEX sent_folder_lastactiontime''')
+                self._createFolderIndexes()
+            self.cur.execute('''update settings set value=18 WHERE key='version';''')
+            self.conn.commit()
+
         # Are you hoping to add a new option to the keys.dat file of existing
         # Bitmessage users or modify the SQLite database? Add it right
         # above this line!
@@ -433,60 +594,46 @@ class sqlThread(threading.Thread):
             else:
                 logger.error(err)
 
-        # Let us check to see the last time we vaccumed the messages.dat file.
-        # If it has been more than a month let's do it now.
-        item = '''SELECT value FROM settings WHERE key='lastvacuumtime';'''
-        parameters = ''
-        self.cur.execute(item, parameters)
-        queryreturn = self.cur.fetchall()
-        for row in queryreturn:
-            value, = row
-            if int(value) < int(time.time()) - 86400:
-                logger.info('It has been a long time since the messages.dat file has been vacuumed. Vacuuming now...')
-                try:
-                    self.cur.execute(''' VACUUM ''')
-                except Exception as err:
-                    if str(err) == 'database or disk is full':
-                        logger.fatal(
-                            '(While VACUUM) Alert: Your disk or data storage volume is full.'
-                            ' sqlThread will now exit.')
-                        queues.UISignalQueue.put((
-                            'alert', (
-                                tr._translate(
-                                    "MainWindow",
-                                    "Disk full"),
-                                tr._translate(
-                                    "MainWindow",
-                                    'Alert: Your disk or data storage volume is full. Bitmessage will now exit.'),
-                                True)))
-                        os._exit(0)
-                item = '''update settings set value=? WHERE key='lastvacuumtime';'''
-                parameters = (int(time.time()),)
-                self.cur.execute(item, parameters)
-
+        helper_sql.sqlStats.slowThreshold = BMConfigParser().safeGetInt(
+            'sql', 'slowquerythreshold') / 1000.0
+        helper_sql.sqlReaders.reset(state.appdata + 'messages.dat')
         state.sqlReady = True
 
         while True:
-            item = helper_sql.sqlSubmitQueue.get()
+            queued = 1
+            try:
+                item = helper_sql.sqlSubmitQueue.get(
+                    timeout=self._idleTimeout())
+            except Queue.Empty:
+                if not self.deferred:
+                    # the PRAGMA would commit an open bulk transaction
+                    if not self.inTransaction:
+                        self._reclaim()
+                    continue
+                # the time window of the deferred writes is over
+                item, queued = 'commit', 0
             if item == 'commit':
-                try:
-                    self.conn.commit()
-                except Exception as err:
-                    if str(err) == 'database or disk is full':
-                        logger.fatal(
-                            '(While committing) Alert: Your disk or data storage volume is full.'
-                            ' sqlThread will now exit.')
-                        queues.UISignalQueue.put((
-                            'alert', (
-                                tr._translate(
-                                    "MainWindow",
-                                    "Disk full"),
-                                tr._translate(
-                                    "MainWindow",
-                                    'Alert: Your disk or data storage volume is full. Bitmessage will now exit.'),
-                                True)))
-                        os._exit(0)
+                self._commit()
+                self._committed(queued)
+            elif isinstance(item, helper_sql.SqlFuture):
+                rows, rowcount = self._execute(
+                    item.statement, item.parameters, item.many,
+                    item.submission, item.commit and not item.deferred)
+                if item.deferred:
+                    if not self.deferred:
+                        self.deferredSince = time.time()
+                    self.deferred += 1
+                elif item.commit:
+                    self._commit()
+                    self._committed()
+                item.set_result(rows, rowcount)
+                if self.deferred >= self.deferredMaxStatements:
+                    self._commit()
+                    self._committed(0)
             elif item == 'exit':
+                helper_sql.sqlReaders.reset()
+                self._commit()
+                self._committed()
                 self.conn.close()
                 logger.info('sqlThread exiting gracefully.')
 
@@ -511,12 +658,9 @@ class sqlThread(threading.Thread):
                                     'Alert: Your disk or data storage volume is full. Bitmessage will now exit.'),
                                 True)))
                         os._exit(0)
-                self.conn.close()
-                shutil.move(
+                self._moveDatabase(
                     paths.lookupAppdataFolder() + 'messages.dat', paths.lookupExeFolder() + 'messages.dat')
-                self.conn = sqlite3.connect(paths.lookupExeFolder() + 'messages.dat')
-                self.conn.text_factory = str
-                self.cur = self.conn.cursor()
+                self._committed()
             elif item == 'movemessagstoappdata':
                 logger.debug('the sqlThread is moving the messages.dat file to the Appdata folder.')
 
@@ -537,70 +681,369 @@ class sqlThread(threading.Thread):
                                     'Alert: Your disk or data storage volume is full. Bitmessage will now exit.'),
                                 True)))
                         os._exit(0)
-                self.conn.close()
-                shutil.move(
+                self._moveDatabase(
                     paths.lookupExeFolder() + 'messages.dat', paths.lookupAppdataFolder() + 'messages.dat')
-                self.conn = sqlite3.connect(paths.lookupAppdataFolder() + 'messages.dat')
-                self.conn.text_factory = str
-                self.cur = self.conn.cursor()
+                self._committed()
             elif item == 'deleteandvacuume':
-                self.cur.execute('''delete from inbox where folder='trash' ''')
-                self.cur.execute('''delete from sent where folder='trash' ''')
-                self.conn.commit()
-                try:
-                    self.cur.execute(''' VACUUM ''')
-                except Exception as err:
-                    if str(err) == 'database or disk is full':
-                        logger.fatal(
-                            '(while deleteandvacuume) Alert: Your disk or data storage volume is full.'
-                            ' sqlThread will now exit.')
-                        queues.UISignalQueue.put((
-                            'alert', (
-                                tr._translate(
-                                    "MainWindow",
-                                    "Disk full"),
-                                tr._translate(
-                                    "MainWindow",
-                                    'Alert: Your disk or data storage volume is full. Bitmessage will now exit.'),
-                                True)))
-                        os._exit(0)
+                self._execute('''delete from inbox where folder='trash' ''', ())
+                self._execute('''delete from sent where folder='trash' ''', ())
+                self._commit()
+                # reclaim all the free pages
+                self._execute('''PRAGMA incremental_vacuum''', ())
+                self.reclaim = False
+                self._committed()
             else:
                 parameters = helper_sql.sqlSubmitQueue.get()
-                rowcount = 0
-                # print 'item', item
-                # print 'parameters', parameters
-                try:
-                    self.cur.execute(item, parameters)
-                    rowcount = self.cur.rowcount
-                except Exception as err:
-                    if str(err) == 'database or disk is full':
-                        logger.fatal(
-                            '(while cur.execute) Alert: Your disk or data storage volume is full.'
-                            ' sqlThread will now exit.')
-                        queues.UISignalQueue.put((
-                            'alert', (
-                                tr._translate(
-                                    "MainWindow",
-                                    "Disk full"),
-                                tr._translate(
-                                    "MainWindow",
-                                    'Alert: Your disk or data storage volume is full. Bitmessage will now exit.'),
-                                True)))
-                        os._exit(0)
-                    else:
-                        logger.fatal(
-                            'Major error occurred when trying to execute a SQL statement within the sqlThread.'
-                            ' Please tell Atheros about this error message or post it in the forum!'
-                            ' Error occurred while trying to execute statement: "%s"  Here are the parameters;'
-                            ' you might want to censor this data with asterisks (***)'
-                            ' as it can contain private information: %s.'
-                            ' Here is the actual error message thrown by the sqlThread: %s',
-                            str(item),
-                            str(repr(parameters)),
-                            str(err))
-                        logger.fatal('This program shall now abruptly exit!')
-
-                    os._exit(0)
-
-                helper_sql.sqlReturnQueue.put((self.cur.fetchall(), rowcount))
+                submission, helper_sql.sqlStats.submission = \
+                    helper_sql.sqlStats.submission, None
+                helper_sql.sqlReturnQueue.put(
+                    self._execute(
+                        item, parameters, submission=submission,
+                        single=True))
                 # helper_sql.sqlSubmitQueue.task_done()
+
+    def _connect(self, filename):
+        """Connect to the database in *filename*"""
+        self.conn = sqlite3.connect(filename)
+        self.conn.text_factory = str
+        self.cur = self.conn.cursor()
+
+        # before any table is created, switches the new databases
+        # to the incremental reclaiming of the free pages
+        self.cur.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # changed between the transactions by _execute
+        self.cur.execute('PRAGMA secure_delete = true')
+        self.secureDelete = True
+        self.inTransaction = False
+        # lets the readers of the helper_sql.sqlReaders pool
+        # work concurrently with the writes done in this thread
+        self.cur.execute('PRAGMA journal_mode = WAL')
+        # fire the delete triggers (of the search index)
+        # on the rows replaced by INSERT OR REPLACE
+        self.cur.execute('PRAGMA recursive_triggers = ON')
+
+    def _moveDatabase(self, source, destination):
+        """
+        Move the database file *source* to *destination* and reconnect.
+        The readers are closed and the WAL is checkpointed into the file;
+        the -wal and -shm files, if a reader still keeps them, are moved
+        along with it.
+        """
+        helper_sql.sqlReaders.reset()
+        self.cur.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(source + suffix):
+                shutil.move(source + suffix, destination + suffix)
+        self._connect(destination)
+        helper_sql.sqlReaders.reset(destination)
+
+    def _idleTimeout(self):
+        """
+        How long to wait before committing the deferred writes
+        or reclaiming the free pages
+        """
+        if self.deferred:
+            return max(
+                self.deferredSince + self.deferredMaxDelay - time.time(), 0)
+        if self.reclaim:
+            return self.vacuumInterval
+        return None
+
+    def _reclaim(self):
+        """Reclaim up to `vacuumPages` free pages of the database file"""
+        self._execute(
+            'PRAGMA incremental_vacuum(%i)' % self.vacuumPages, ())
+        rows, _ = self._execute('PRAGMA freelist_count', ())
+        self.reclaim = rows[0][0] > 0
+
+    def _setSecureDelete(self, table, single):
+        """
+        Overwrite the deleted content unless the write to *table*
+        is the *single* statement of its transaction and the table
+        isn't one of the `secureDeleteTables`. Changing it commits
+        the current transaction, so it's changed only when a write
+        opens a new one: a transaction of several writes keeps it on.
+        """
+        secure = not single or table.lower() in self.secureDeleteTables
+        if secure != self.secureDelete:
+            self.cur.execute('PRAGMA secure_delete = %s' % secure)
+            self.secureDelete = secure
+
+    def _createFolderIndexes(self):
+        """
+        Index the inbox and sent folders by time and msgid or ackdata,
+        the order and the cursor of the paged API commands
+        """
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS inbox_folder_received'''
+            ''' ON inbox (folder, received, msgid)''')
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS sent_folder_lastactiontime'''
+            ''' ON sent (folder, lastactiontime, ackdata)''')
+
+    def _createLookupIndexes(self):
+        """
+        Index the columns by which the inbox and sent rows are looked up:
+        the ackdata, msgid, status, recipient and sender of the sent
+        messages, the sighash of the received ones and the read flag
+        and recipient for the unread counts
+        """
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS sent_ackdata ON sent (ackdata)''')
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS sent_msgid ON sent (msgid)''')
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS sent_status ON sent (status)''')
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS sent_toaddress_status'''
+            ''' ON sent (toaddress, status)''')
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS sent_fromaddress'''
+            ''' ON sent (fromaddress)''')
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS inbox_sighash ON inbox (sighash)''')
+        self.cur.execute(
+            '''CREATE INDEX IF NOT EXISTS inbox_read_toaddress_folder'''
+            ''' ON inbox (read, toaddress, folder, msgid)''')
+
+    def _createSearchIndex(self, table, key=None):
+        """
+        Create the full text index *table*_search of the addresses,
+        subject and message of *table* and the triggers which keep it
+        up to date. If *key* is given the message bodies are looked up
+        in the message_body table by the *key* column of *table*.
+        """
+        index = table + '_search'
+        columns = self.searchColumns
+        content = table
+        when = ''
+        oldValues = 'old.' + columns.replace(', ', ', old.')
+        newValues = 'new.' + columns.replace(', ', ', new.')
+        if key:
+            content = index + '_content'
+            self.cur.execute(
+                "CREATE VIEW %s AS SELECT %s.rowid AS rowid,"
+                " toaddress, fromaddress, subject, message_body.message"
+                " AS message FROM %s LEFT JOIN message_body"
+                " ON message_body.id = %s.%s"
+                % (content, table, table, table, key))
+            # not when the trigger moving a body blanks the message column
+            when = " WHEN old.message = '' OR new.message != ''"
+            body = (
+                "coalesce(nullif(%s.message, ''), (SELECT message"
+                " FROM message_body WHERE id = %s.%s), '')")
+            oldValues = oldValues.replace(
+                'old.message', body % ('old', 'old', key))
+            newValues = newValues.replace(
+                'new.message', body % ('new', 'new', key))
+        try:
+            self.cur.execute(
+                "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s',"
+                " tokenize='trigram')" % (index, columns, content))
+            delete = (
+                "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.rowid, %s)"
+                % (index, index, columns, oldValues))
+        except sqlite3.OperationalError:
+            self.cur.execute(
+                "CREATE VIRTUAL TABLE %s USING fts4(%s, content='%s')"
+                % (index, columns, content))
+            delete = "DELETE FROM %s WHERE rowid=old.rowid" % index
+        insert = "INSERT INTO %s(rowid, %s) VALUES (new.rowid, %s)" % (
+            index, columns, newValues)
+        self.cur.execute(
+            "CREATE TRIGGER %s_bd BEFORE DELETE ON %s BEGIN %s; END"
+            % (index, table, delete))
+        self.cur.execute(
+            "CREATE TRIGGER %s_bu BEFORE UPDATE OF %s ON %s%s BEGIN %s; END"
+            % (index, columns, table, when, delete))
+        self.cur.execute(
+            "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s; END"
+            % (index, table, insert))
+        self.cur.execute(
+            "CREATE TRIGGER %s_au AFTER UPDATE OF %s ON %s%s BEGIN %s; END"
+            % (index, columns, table, when, insert))
+        self._rebuildSearchIndex(table)
+
+    def _rebuildSearchIndex(self, table):
+        """Index again all the messages of *table* in *table*_search"""
+        index = table + '_search'
+        self.cur.execute(
+            "INSERT INTO %s(%s) VALUES ('rebuild')" % (index, index))
+
+    def _dropSearchIndex(self, table):
+        """Drop the full text index of *table* and its triggers"""
+        index = table + '_search'
+        for suffix in ('_bd', '_bu', '_ai', '_au'):
+            self.cur.execute('DROP TRIGGER IF EXISTS %s%s' % (index, suffix))
+        self.cur.execute('DROP TABLE IF EXISTS %s' % index)
+
+    def _createMessageBodies(self):
+        """
+        Create the message_body table, move the bodies of the inbox
+        and sent messages into it and create the triggers which move
+        the bodies of the new messages and delete those of the deleted
+        """
+        self.cur.execute(
+            '''CREATE TABLE message_body (id blob, message text,'''
+            ''' UNIQUE(id) ON CONFLICT REPLACE)''')
+        for table, key in self.bodyKeys:
+            self.cur.execute(
+                "INSERT INTO message_body SELECT %s, message FROM %s"
+                % (key, table))
+            self.cur.execute("UPDATE %s SET message = ''" % table)
+            move = (
+                "INSERT INTO message_body VALUES (new.%s, new.message);"
+                " UPDATE %s SET message = '' WHERE rowid = new.rowid;"
+                % (key, table))
+            self.cur.execute(
+                "CREATE TRIGGER %s_body_ai AFTER INSERT ON %s BEGIN %s END"
+                % (table, table, move))
+            self.cur.execute(
+                "CREATE TRIGGER %s_body_au AFTER UPDATE OF message ON %s"
+                " WHEN new.message != '' BEGIN %s END" % (table, table, move))
+            self.cur.execute(
+                "CREATE TRIGGER %s_body_ad AFTER DELETE ON %s BEGIN"
+                " DELETE FROM message_body WHERE id = old.%s; END"
+                % (table, table, key))
+            self.cur.execute(
+                "CREATE TRIGGER %s_body_ak AFTER UPDATE OF %s ON %s BEGIN"
+                " UPDATE message_body SET id = new.%s WHERE id = old.%s; END"
+                % (table, key, table, key, key))
+
+    def _createUnreadCounters(self):
+        """
+        Create the inbox_unread table with the numbers of unread messages
+        and the triggers which count the changes of the inbox
+        """
+        self.cur.execute(
+            '''CREATE TABLE inbox_unread (toaddress text, fromaddress text,'''
+            ''' folder text, count integer)''')
+        self.cur.execute(
+            '''CREATE INDEX inbox_unread_key'''
+            ''' ON inbox_unread (toaddress, fromaddress, folder)''')
+        key = (
+            "toaddress IS {0}.toaddress AND fromaddress IS {0}.fromaddress"
+            " AND folder IS {0}.folder")
+        increment = (
+            "INSERT INTO inbox_unread"
+            " SELECT new.toaddress, new.fromaddress, new.folder, 0"
+            " WHERE new.read = 0 AND NOT EXISTS"
+            " (SELECT 1 FROM inbox_unread WHERE {0});"
+            " UPDATE inbox_unread SET count = count + 1"
+            " WHERE new.read = 0 AND {0};").format(key.format('new'))
+        decrement = (
+            "UPDATE inbox_unread SET count = count - 1"
+            " WHERE old.read = 0 AND {0};"
+            " DELETE FROM inbox_unread WHERE count <= 0 AND {0};"
+        ).format(key.format('old'))
+        self.cur.execute(
+            "CREATE TRIGGER inbox_unread_ai AFTER INSERT ON inbox"
+            " WHEN new.read = 0 BEGIN %s END" % increment)
+        self.cur.execute(
+            "CREATE TRIGGER inbox_unread_ad AFTER DELETE ON inbox"
+            " WHEN old.read = 0 BEGIN %s END" % decrement)
+        self.cur.execute(
+            "CREATE TRIGGER inbox_unread_au AFTER UPDATE OF"
+            " read, toaddress, fromaddress, folder ON inbox"
+            " WHEN old.read = 0 OR new.read = 0 BEGIN %s %s END"
+            % (decrement, increment))
+        self.cur.execute(
+            '''INSERT INTO inbox_unread SELECT toaddress, fromaddress,'''
+            ''' folder, count(*) FROM inbox WHERE read = 0'''
+            ''' GROUP BY toaddress, fromaddress, folder''')
+
+    def _committed(self, queued=1):
+        """
+        Tell the readers about the *queued* commits and the deferred writes
+        which have been committed
+        """
+        helper_sql.sqlReaders.committed(queued, self.deferred)
+        self.deferred = 0
+
+    def _commit(self):
+        """Commit, exit if the disk is full"""
+        try:
+            started = time.time()
+            self.conn.commit()
+            self.inTransaction = False
+            helper_sql.sqlStats.record(
+                'COMMIT', None, started, time.time(), 0)
+            # something may have been deleted
+            self.reclaim = True
+        except Exception as err:
+            if str(err) == 'database or disk is full':
+                logger.fatal(
+                    '(While committing) Alert: Your disk or data storage volume is full.'
+                    ' sqlThread will now exit.')
+                queues.UISignalQueue.put((
+                    'alert', (
+                        tr._translate(
+                            "MainWindow",
+                            "Disk full"),
+                        tr._translate(
+                            "MainWindow",
+                            'Alert: Your disk or data storage volume is full. Bitmessage will now exit.'),
+                        True)))
+                os._exit(0)
+
+    def _execute(
+        self, item, parameters, many=False, submission=None, single=False
+    ):
+        """
+        Execute the statement, for each of the *parameters* if *many*,
+        return the rows and the rowcount. The timings and the *submission*
+        are recorded in `.helper_sql.sqlStats`. A *single* statement
+        is committed right after, in a transaction of its own.
+        """
+        # pylint: disable=too-many-arguments
+        rowcount = 0
+        # print 'item', item
+        # print 'parameters', parameters
+        try:
+            write = self.writeStatement.match(item)
+            if write:
+                if not self.inTransaction:
+                    self._setSecureDelete(write.group(1), single)
+                self.inTransaction = True
+            started = time.time()
+            if many:
+                self.cur.executemany(item, parameters)
+            else:
+                self.cur.execute(item, parameters)
+            rowcount = self.cur.rowcount
+            rows = self.cur.fetchall()
+            helper_sql.sqlStats.record(
+                item, submission, started, time.time(),
+                len(rows) if rowcount < 0 else rowcount)
+        except Exception as err:
+            if str(err) == 'database or disk is full':
+                logger.fatal(
+                    '(while cur.execute) Alert: Your disk or data storage volume is full.'
+                    ' sqlThread will now exit.')
+                queues.UISignalQueue.put((
+                    'alert', (
+                        tr._translate(
+                            "MainWindow",
+                            "Disk full"),
+                        tr._translate(
+                            "MainWindow",
+                            'Alert: Your disk or data storage volume is full. Bitmessage will now exit.'),
+                        True)))
+                os._exit(0)
+            else:
+                logger.fatal(
+                    'Major error occurred when trying to execute a SQL statement within the sqlThread.'
+                    ' Please tell Atheros about this error message or post it in the forum!'
+                    ' Error occurred while trying to execute statement: "%s"  Here are the parameters;'
+                    ' you might want to censor this data with asterisks (***)'
+                    ' as it can contain private information: %s.'
+                    ' Here is the actual error message thrown by the sqlThread: %s',
+                    str(item),
+                    str(repr(parameters)),
+                    str(err))
+                logger.fatal('This program shall now abruptly exit!')
+
+            os._exit(0)
+
+        return rows, rowcount
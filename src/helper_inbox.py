@@ -1,12 +1,13 @@
 """Helper Inbox performs inbox messages related operations"""
 
 import queues
-from helper_sql import sqlExecute, sqlQuery
+from helper_sql import sqlExecute, sqlExecuteDeferred, sqlQuery
 
 
 def insert(t):
     """Perform an insert into the "inbox" table"""
-    sqlExecute('''INSERT INTO inbox VALUES (?,?,?,?,?,?,?,?,?,?)''', *t)
+    sqlExecuteDeferred(
+        '''INSERT INTO inbox VALUES (?,?,?,?,?,?,?,?,?,?)''', *t)
     # shouldn't emit changedInboxUnread and displayNewInboxMessage
     # at the same time
     # queues.UISignalQueue.put(('changedInboxUnread', None))
@@ -23,3 +24,25 @@ def isMessageAlreadyInInbox(sigHash):
     queryReturn = sqlQuery(
         '''SELECT COUNT(*) FROM inbox WHERE sighash=?''', sigHash)
     return queryReturn[0][0] != 0
+
+
+def unreadCounts(toAddress=None):
+    """
+    Return the numbers of unread messages as (address, folder, count)
+    tuples: by recipient and folder or, if *toAddress* is given,
+    by sender and folder of the messages sent to *toAddress*
+    """
+    if toAddress is None:
+        return sqlQuery(
+            'SELECT toaddress, folder, sum(count) FROM inbox_unread'
+            ' GROUP BY toaddress, folder')
+    return sqlQuery(
+        'SELECT fromaddress, folder, count FROM inbox_unread'
+        ' WHERE toaddress=?', toAddress)
+
+
+def unreadCount(folder='inbox'):
+    """Return the number of unread messages in *folder*"""
+    return sqlQuery(
+        'SELECT ifnull(sum(count), 0) FROM inbox_unread WHERE folder=?',
+        folder)[0][0]
@@ -1,11 +1,48 @@
 """
 Additional SQL helper for searching messages.
-Used by :mod:`.bitmessageqt`.
+Used by :mod:`.bitmessageqt` and :mod:`.bitmessagekivy`.
 """
 
 from helper_sql import sqlQuery
 from tr import _translate
 
+_searchIndexKind = []
+
+
+def _search_index_kind():
+    """
+    Return the kind of the full text search index created by the sqlThread:
+    'fts5' (with the trigram tokenizer), 'fts4' or None if there is none
+    """
+    if not _searchIndexKind:
+        queryreturn = sqlQuery(
+            "SELECT sql FROM sqlite_master WHERE name='inbox_search'")
+        if not queryreturn:
+            return None
+        _searchIndexKind.append(
+            'fts5' if 'fts5' in queryreturn[0][0].lower() else 'fts4')
+    return _searchIndexKind[0]
+
+
+def search_match(what):
+    """
+    Return the full text query for the messages containing *what*
+    or None if the search index can't be used for it
+    """
+    kind = _search_index_kind()
+    if kind == 'fts5':
+        # the trigram tokenizer needs at least 3 characters
+        if len(what) < 3:
+            return None
+        return '"%s"' % what.replace('"', '""')
+    if kind == 'fts4':
+        # the tokens are matched by prefix, not by any substring
+        words = what.replace('"', ' ').split()
+        if not words:
+            return None
+        return ' '.join('"%s*"' % word for word in words)
+    return None
+
 
 def search_sql(
     xAddress='toaddress', account=None, folder='inbox', where=None,
@@ -22,30 +59,47 @@ def search_sql(
       instance
     :param str folder: the folder which is checked
     :param str where: message field which is checked ('toaddress',
-      'fromaddress', 'subject' or 'message'), by default check any field
+      'fromaddress', 'subject' or 'message' or their translated labels),
+      by default check any field
     :param str what: the search term
     :param bool unreadOnly: if True, search only for unread messages
     :return: all messages where <where> field contains <what>
     :rtype: list[list]
     """
-    # pylint: disable=too-many-arguments, too-many-branches
+    # pylint: disable=too-many-arguments
     if what:
-        what = '%' + what + '%'
-        if where == _translate("MainWindow", "To"):
+        if where in (_translate("MainWindow", "To"), 'toaddress'):
             where = 'toaddress'
-        elif where == _translate("MainWindow", "From"):
+        elif where in (_translate("MainWindow", "From"), 'fromaddress'):
             where = 'fromaddress'
-        elif where == _translate("MainWindow", "Subject"):
+        elif where in (_translate("MainWindow", "Subject"), 'subject'):
             where = 'subject'
-        elif where == _translate("MainWindow", "Message"):
+        elif where in (_translate("MainWindow", "Message"), 'message'):
             where = 'message'
         else:
-            where = 'toaddress || fromaddress || subject || message'
+            where = None
+    return search_messages(
+        'toaddress, fromaddress, subject, ' + (
+            'status, ackdata, lastactiontime' if folder == 'sent'
+            else 'folder, msgid, received, read'),
+        xAddress, account, folder, where, what, unreadOnly)
 
-    sqlStatementBase = 'SELECT toaddress, fromaddress, subject, ' + (
-        'status, ackdata, lastactiontime FROM sent ' if folder == 'sent'
-        else 'folder, msgid, received, read FROM inbox '
-    )
+
+def search_messages(
+    columns, xAddress='toaddress', account=None, folder='inbox', where=None,
+    what=None, unreadOnly=False
+):
+    """
+    Select the *columns* of the messages found as in :func:`search_sql`,
+    with *where* being the name of the message field or None for any field
+    """
+    # pylint: disable=too-many-arguments, too-many-branches
+    table = 'sent' if folder == 'sent' else 'inbox'
+    if what:
+        match = search_match(what)
+        what = '%' + what + '%'
+
+    sqlStatementBase = 'SELECT %s FROM %s ' % (columns, table)
 
     sqlStatementParts = []
     sqlArguments = []
@@ -66,8 +120,16 @@ def search_sql(
     else:
         sqlStatementParts.append('folder != ?')
         sqlArguments.append('trash')
-    if what:
-        sqlStatementParts.append('%s LIKE ?' % (where))
+    if what and match:
+        sqlStatementParts.append(
+            'rowid IN (SELECT rowid FROM {0}_search WHERE {1} MATCH ?)'.format(
+                table, where or table + '_search'))
+        sqlArguments.append(match)
+    elif what:
+        where = where or 'toaddress || fromaddress || subject || message'
+        sqlStatementParts.append('%s LIKE ?' % where.replace(
+            'message', '(SELECT message FROM message_body WHERE id=%s)' % (
+                'ackdata' if table == 'sent' else 'msgid')))
         sqlArguments.append(what)
     if unreadOnly:
         sqlStatementParts.append('read = 0')
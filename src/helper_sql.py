@@ -16,8 +16,17 @@ SQLite objects can only be used from one thread.
    or isn't thread-safe.
 """
 
+import logging
+import os
 import Queue
+import re
+import sqlite3
+import sys
 import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger('default')
 
 sqlSubmitQueue = Queue.Queue()
 """the queue for SQL"""
@@ -26,6 +35,359 @@ sqlReturnQueue = Queue.Queue()
 sqlLock = threading.Lock()
 
 
+class SqlStats(object):
+    """
+    Timings of the statements, aggregated by statement shape: the statement
+    with the whitespace and the lists of placeholders collapsed. For each
+    shape it keeps the time spent waiting for `sqlLock`, waiting in the
+    queue (or for a reader connection) and executing, a histogram of the
+    execution times, the number of rows and the callers.
+
+    A submission is a tuple (caller, requested, submitted): where and when
+    the statement was requested and when it was put into the queue.
+    The statements are logged as slow when they take `slowThreshold`
+    seconds or more in total, set by the sqlThread from the config.
+    """
+    #: upper bounds of the histogram buckets, in seconds
+    buckets = (.0001, .0003, .001, .003, .01, .03, .1, .3, 1, 3)
+    slowThreshold = 0
+    _shapeCacheSize = 1024
+    _spaces = re.compile(r'\s+')
+    _placeholders = re.compile(r'\?(?:\s*,\s*\?)+')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shapes = {}
+        self._stats = {}
+        self.since = time.time()
+        # the submission of the pending statement of the
+        # statement / parameters protocol, protected by sqlLock
+        self.submission = None
+
+    @staticmethod
+    def caller(depth=2):
+        """Describe the code calling the function calling this"""
+        # pylint: disable=protected-access
+        frame = sys._getframe(depth)
+        return '%s:%i (%s)' % (
+            os.path.basename(frame.f_code.co_filename), frame.f_lineno,
+            frame.f_code.co_name)
+
+    def shape(self, sqlStatement):
+        """Return the shape of *sqlStatement*"""
+        try:
+            return self._shapes[sqlStatement]
+        except KeyError:
+            pass
+        if len(self._shapes) >= self._shapeCacheSize:
+            self._shapes.clear()
+        shape = self._shapes[sqlStatement] = self._placeholders.sub(
+            '?, ...', self._spaces.sub(' ', sqlStatement).strip())
+        return shape
+
+    def record(self, sqlStatement, submission, started, finished, rows):
+        """
+        Record a statement executed from *started* till *finished*
+        which returned or modified *rows* rows
+        """
+        caller, requested, submitted = submission or (None, started, started)
+        lockWait = submitted - requested
+        queueWait = started - submitted
+        execute = finished - started
+        shape = self.shape(sqlStatement)
+        with self._lock:
+            try:
+                entry = self._stats[shape]
+            except KeyError:
+                entry = self._stats[shape] = {
+                    'count': 0, 'rows': 0, 'lockWait': 0., 'queueWait': 0.,
+                    'execute': 0., 'maxExecute': 0.,
+                    'histogram': [0] * (len(self.buckets) + 1),
+                    'callers': {}
+                }
+            entry['count'] += 1
+            entry['rows'] += rows
+            entry['lockWait'] += lockWait
+            entry['queueWait'] += queueWait
+            entry['execute'] += execute
+            entry['maxExecute'] = max(entry['maxExecute'], execute)
+            entry['histogram'][bisect_left(self.buckets, execute)] += 1
+            if caller:
+                entry['callers'][caller] = entry['callers'].get(caller, 0) + 1
+        if self.slowThreshold and finished - requested >= self.slowThreshold:
+            logger.warning(
+                'Slow SQL statement from %s: %.3fs waiting for the lock,'
+                ' %.3fs in the queue, %.3fs executing, %i rows: %s',
+                caller, lockWait, queueWait, execute, rows, shape)
+
+    def dump(self, reset=False):
+        """
+        Return the stats as a dict with the keys *since* and *statements*,
+        a list of dicts sorted by the total execution time, with the times
+        in milliseconds. Start over if *reset* is set.
+        """
+        with self._lock:
+            stats, since = self._stats, self.since
+            if reset:
+                self._stats, self.since = {}, time.time()
+            statements = [
+                {
+                    'statement': shape,
+                    'count': entry['count'],
+                    'rows': entry['rows'],
+                    'lockWaitMs': entry['lockWait'] * 1000,
+                    'queueWaitMs': entry['queueWait'] * 1000,
+                    'executeMs': entry['execute'] * 1000,
+                    'maxExecuteMs': entry['maxExecute'] * 1000,
+                    'histogram': dict(zip(
+                        ['%gms' % (bound * 1000) for bound in self.buckets]
+                        + ['inf'], entry['histogram'])),
+                    'callers': dict(entry['callers'])
+                } for shape, entry in stats.iteritems()
+            ]
+        statements.sort(key=lambda entry: entry['executeMs'], reverse=True)
+        return {'since': since, 'statements': statements}
+
+
+sqlStats = SqlStats()
+"""the timings of the statements"""
+
+
+class SqlReaderPool(object):
+    """
+    A small pool of read-only connections to the database in WAL mode,
+    used by `sqlQuery` so that reads don't wait in the `sqlSubmitQueue`.
+    The sqlThread remains the only writer.
+
+    While a commit is queued, a reader could miss the changes done by
+    the thread which queued it, so `sqlQuery` goes through the sqlThread.
+    The deferred writes wait for their commit longer, so they only send
+    the queries of the thread which submitted them to the sqlThread.
+    """
+    size = 4
+
+    def __init__(self):
+        self.filename = None
+        self._lock = threading.Lock()
+        #: notified when a connection is released or may be created
+        self._released = threading.Condition(self._lock)
+        self._idle = []
+        self._created = 0
+        self._generation = 0
+        self._pendingCommits = 0
+        #: the numbers of the deferred writes submitted and committed
+        self._deferredSubmitted = 0
+        self._deferredCommitted = 0
+        #: the number of the last deferred write of the thread
+        self._local = threading.local()
+
+    def reset(self, filename=None):
+        """
+        Close the connections and use *filename* for the new ones.
+        The connections in use are closed when released.
+        """
+        with self._lock:
+            self.filename = filename
+            self._generation += 1
+            self._created = 0
+            idle, self._idle = self._idle, []
+            # the waiting readers can create the new connections
+            self._released.notify_all()
+        for _, conn in idle:
+            conn.close()
+
+    def commitQueued(self):
+        """Called when putting 'commit' into the `sqlSubmitQueue`"""
+        with self._lock:
+            self._pendingCommits += 1
+
+    def deferredQueued(self):
+        """Called when putting a deferred write into the `sqlSubmitQueue`"""
+        with self._lock:
+            self._deferredSubmitted += 1
+            self._local.deferred = self._deferredSubmitted
+
+    def committed(self, count=1, deferred=0):
+        """
+        Called by the sqlThread when it has committed *count* queued
+        commits and *deferred* deferred statements
+        """
+        with self._lock:
+            self._pendingCommits = max(self._pendingCommits - count, 0)
+            self._deferredCommitted += deferred
+
+    def lastDeferred(self):
+        """The number of the last deferred write of the current thread"""
+        return getattr(self._local, 'deferred', 0)
+
+    def isCommitted(self, deferred):
+        """Whether the deferred writes up to number *deferred* are committed"""
+        return deferred <= self._deferredCommitted
+
+    def available(self):
+        """Whether a query of the current thread can be served by the pool"""
+        return (
+            self.filename is not None and not self._pendingCommits
+            and self.isCommitted(self.lastDeferred()))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.filename, check_same_thread=False)
+        conn.text_factory = str
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            while not self._idle and self._created >= self.size:
+                self._released.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+            generation = self._generation
+        try:
+            return generation, self._connect()
+        except Exception:
+            with self._lock:
+                if generation == self._generation:
+                    self._created -= 1
+                    self._released.notify()
+            raise
+
+    def _release(self, generation, conn):
+        with self._lock:
+            if generation == self._generation:
+                self._idle.append((generation, conn))
+                self._released.notify()
+                return
+        conn.close()
+
+    def query(self, sqlStatement, parameters, submission=None):
+        """
+        Execute the statement in one of the readers, return all rows.
+        The *submission* is recorded in `sqlStats`.
+        """
+        generation, conn = self._acquire()
+        try:
+            started = time.time()
+            cur = conn.cursor()
+            cur.execute(sqlStatement, parameters)
+            rows = cur.fetchall()
+            sqlStats.record(
+                sqlStatement, submission, started, time.time(), len(rows))
+            return rows
+        finally:
+            self._release(generation, conn)
+
+
+sqlReaders = SqlReaderPool()
+"""the pool of reader connections, set up by the sqlThread"""
+
+
+class SqlFuture(object):
+    """
+    A statement submitted to the sqlThread by `sqlSubmit`,
+    `sqlExecuteDeferred` or `sqlExecuteMany`, which receives the result
+    when it's executed. If *many* is set, the statement is executed
+    for each item of *parameters* with `executemany`. Unless *commit*
+    is cleared, in which case the submitter queues the commit,
+    the statement is committed as soon as it's executed or, if
+    *deferred* is set, together with the other deferred statements.
+    """
+
+    def __init__(
+        self, sqlStatement, parameters, deferred=False, many=False,
+        commit=True
+    ):
+        self.statement = sqlStatement
+        self.parameters = parameters
+        self.deferred = deferred
+        self.many = many
+        self.commit = commit
+        #: set when submitting, see `SqlStats`
+        self.submission = None
+        self.rowcount = None
+        self._rows = None
+        self._done = threading.Event()
+
+    def set_result(self, rows, rowcount):
+        """Called by the sqlThread when the statement is executed"""
+        self._rows = rows
+        self.rowcount = rowcount
+        self._done.set()
+
+    def done(self):
+        """Whether the statement has been executed"""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the statement to be executed and return the rows,
+        or None if it's not executed within *timeout* seconds.
+        After that the number of modified rows is in `rowcount`.
+        """
+        self._done.wait(timeout)
+        return self._rows
+
+
+def _parameters(args):
+    if args == ():
+        return ''
+    if isinstance(args[0], (list, tuple)):
+        return args[0]
+    return args
+
+
+def _submit(future, caller, commit=True):
+    requested = time.time()
+    with sqlLock:
+        future.submission = (caller, requested, time.time())
+        if future.deferred:
+            sqlReaders.deferredQueued()
+        elif commit:
+            sqlReaders.commitQueued()
+        sqlSubmitQueue.put(future)
+    return future
+
+
+def sqlSubmit(sqlStatement, *args):
+    """
+    Submit the statement to the sqlThread without waiting for it.
+    It's committed as soon as it's executed.
+
+    :param str sqlStatement: SQL statement string
+    :param list args: SQL query parameters
+    :rtype: SqlFuture
+    """
+    return _submit(
+        SqlFuture(sqlStatement, _parameters(args)), sqlStats.caller())
+
+
+def sqlExecuteDeferred(sqlStatement, *args):
+    """
+    Execute the statement without waiting for it and without committing
+    it right away: the deferred statements are committed together,
+    `.threads.sqlThread.deferredMaxDelay` seconds after the first of them
+    or when there are `.threads.sqlThread.deferredMaxStatements` of them,
+    whichever comes first.
+
+    :rtype: SqlFuture
+    """
+    return _submit(
+        SqlFuture(sqlStatement, _parameters(args), deferred=True),
+        sqlStats.caller())
+
+
+def sqlExecuteMany(sqlStatement, parameters):
+    """
+    Execute the statement for each tuple in *parameters*
+    in one transaction, return the number of modified rows
+    """
+    future = _submit(
+        SqlFuture(sqlStatement, parameters, many=True), sqlStats.caller())
+    future.result()
+    return future.rowcount
+
+
 def sqlQuery(sqlStatement, *args):
     """
     Query sqlite and return results
@@ -34,15 +396,22 @@ def sqlQuery(sqlStatement, *args):
     :param list args: SQL query parameters
     :rtype: list
     """
+    parameters = _parameters(args)
+    caller = sqlStats.caller()
+    requested = time.time()
+
+    if sqlReaders.available():
+        try:
+            return sqlReaders.query(
+                sqlStatement, parameters, (caller, requested, requested))
+        except sqlite3.Error:
+            # let the sqlThread handle it
+            pass
+
     sqlLock.acquire()
+    sqlStats.submission = (caller, requested, time.time())
     sqlSubmitQueue.put(sqlStatement)
-
-    if args == ():
-        sqlSubmitQueue.put('')
-    elif isinstance(args[0], (list, tuple)):
-        sqlSubmitQueue.put(args[0])
-    else:
-        sqlSubmitQueue.put(args)
+    sqlSubmitQueue.put(parameters)
     queryreturn, _ = sqlReturnQueue.get()
     sqlLock.release()
 
@@ -58,31 +427,42 @@ def sqlExecuteChunked(sqlStatement, idCount, *args):
     if idCount == 0 or idCount > len(args):
         return 0
 
-    totalRowCount = 0
+    staticCount = len(args) - idCount
+    chunkSize = sqlExecuteChunked.chunkSize - staticCount
+    # all the full chunks share one statement, executed with executemany
+    batches = []
+    for i in range(staticCount, len(args), chunkSize):
+        chunk_slice = args[i:i + chunkSize]
+        statement = sqlStatement.format(','.join('?' * len(chunk_slice)))
+        # first static args, and then iterative chunk
+        parameters = args[0:staticCount] + chunk_slice
+        if batches and batches[-1].statement == statement:
+            batches[-1].parameters.append(parameters)
+        else:
+            batches.append(SqlFuture(
+                statement, [parameters], many=True, commit=False))
+    caller = sqlStats.caller()
+    requested = time.time()
     with sqlLock:
-        for i in range(
-            len(args) - idCount, len(args),
-            sqlExecuteChunked.chunkSize - (len(args) - idCount)
-        ):
-            chunk_slice = args[
-                i:i + sqlExecuteChunked.chunkSize - (len(args) - idCount)
-            ]
-            sqlSubmitQueue.put(
-                sqlStatement.format(','.join('?' * len(chunk_slice)))
-            )
-            # first static args, and then iterative chunk
-            sqlSubmitQueue.put(
-                args[0:len(args) - idCount] + chunk_slice
-            )
-            retVal = sqlReturnQueue.get()
-            totalRowCount += retVal[1]
+        submitted = time.time()
+        for future in batches:
+            future.submission = (caller, requested, submitted)
+            sqlSubmitQueue.put(future)
+        sqlReaders.commitQueued()
         sqlSubmitQueue.put('commit')
+    totalRowCount = 0
+    for future in batches:
+        future.result()
+        totalRowCount += future.rowcount
     return totalRowCount
 
 
 def sqlExecute(sqlStatement, *args):
     """Execute SQL statement (optionally with arguments)"""
+    caller = sqlStats.caller()
+    requested = time.time()
     sqlLock.acquire()
+    sqlStats.submission = (caller, requested, time.time())
     sqlSubmitQueue.put(sqlStatement)
 
     if args == ():
@@ -90,6 +470,7 @@ def sqlExecute(sqlStatement, *args):
     else:
         sqlSubmitQueue.put(args)
     _, rowcount = sqlReturnQueue.get()
+    sqlReaders.commitQueued()
     sqlSubmitQueue.put('commit')
     sqlLock.release()
     return rowcount
@@ -98,28 +479,56 @@ def sqlExecute(sqlStatement, *args):
 def sqlStoredProcedure(procName):
     """Schedule procName to be run"""
     sqlLock.acquire()
+    # the procedures modify the database and commit
+    sqlReaders.commitQueued()
     sqlSubmitQueue.put(procName)
     sqlLock.release()
 
 
 class SqlBulkExecute(object):
-    """This is used when you have to execute the same statement in a cycle."""
+    """
+    This is used when you have to execute the same statement in a cycle.
+    The parameters of consecutive executions of the same statement are
+    sent to the sqlThread in batches of `batchSize`, executed with
+    `executemany` and committed together when leaving the block.
+    """
+    batchSize = 1000
+
+    def __init__(self):
+        self._statement = None
+        self._parameters = []
+        self._caller = None
+        self._lockWait = 0
 
     def __enter__(self):
+        requested = time.time()
         sqlLock.acquire()
+        self._caller = sqlStats.caller()
+        self._lockWait = time.time() - requested
         return self
 
     def __exit__(self, exc_type, value, traceback):
+        self._flush()
+        sqlReaders.commitQueued()
         sqlSubmitQueue.put('commit')
         sqlLock.release()
 
-    @staticmethod
-    def execute(sqlStatement, *args):
-        """Used for statements that do not return results."""
-        sqlSubmitQueue.put(sqlStatement)
+    def _flush(self):
+        if self._parameters:
+            future = SqlFuture(
+                self._statement, self._parameters, many=True, commit=False)
+            submitted = time.time()
+            future.submission = (
+                self._caller, submitted - self._lockWait, submitted)
+            self._lockWait = 0
+            sqlSubmitQueue.put(future)
+        self._parameters = []
 
-        if args == ():
-            sqlSubmitQueue.put('')
-        else:
-            sqlSubmitQueue.put(args)
-        sqlReturnQueue.get()
+    def execute(self, sqlStatement, *args):
+        """Used for statements that do not return results."""
+        if sqlStatement != self._statement:
+            self._flush()
+            self._statement = sqlStatement
+        self._parameters.append(args)
+        if len(self._parameters) >= self.batchSize:
+            self._flush()
@@ -1,17 +1,24 @@
 """The Inventory singleton"""
 
+import time
+
 # TODO make this dynamic, and watch out for frozen, like with messagetypes
 import storage.filesystem
+import storage.segmented
 import storage.sqlite
 from bmconfigparser import BMConfigParser
 from singleton import Singleton
+from storage.cache import PayloadCache
+from storage.storage import InventoryItem
 
 
 @Singleton
 class Inventory():
     """
     Inventory singleton class which uses storage backends
-    to manage the inventory.
+    to manage the inventory. The recently stored and served objects
+    are cached in front of the backend, up to
+    inventory.cachesize MiB of payloads.
     """
     def __init__(self):
         self._moduleName = BMConfigParser().safeGet("inventory", "storage")
@@ -21,6 +28,8 @@ class Inventory():
         )
         self._realInventory = self._inventoryClass()
         self.numberOfInventoryLookupsPerformed = 0
+        self.cache = PayloadCache(BMConfigParser().safeGetInt(
+            "inventory", "cachesize") * 1024 * 1024)
 
     # cheap inheritance copied from asyncore
     def __getattr__(self, attr):
@@ -38,4 +47,40 @@ class Inventory():
 
     # hint for pylint: this is dictionary like object
     def __getitem__(self, key):
-        return self._realInventory[key]
+        value = self.cache.get(key)
+        if value is None:
+            value = self._realInventory[key]
+            self.cache.put(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        value = InventoryItem(*value)
+        self._realInventory[key] = value
+        self.cache.put(key, value)
+
+    def __delitem__(self, key):
+        self.cache.discard(key)
+        del self._realInventory[key]
+
+    def packet(self, key):
+        """
+        Return the header and the payload of the object packet,
+        the header is calculated once while the object is cached
+        """
+        from protocol import CreatePacketHeader
+
+        value = self[key]
+        header = self.cache.header(key)
+        if header is None:
+            header = CreatePacketHeader('object', value.payload)
+            self.cache.setHeader(key, header)
+        return header, value.payload
+
+    def setPacketHeader(self, key, header):
+        """Keep the received *header* of the object packet"""
+        self.cache.setHeader(key, header)
+
+    def clean(self):
+        """Clean the backend and drop the expired objects from the cache"""
+        self._realInventory.clean()
+        self.cache.clean(int(time.time()) - (60 * 60 * 3))
@@ -7,7 +7,7 @@ from connectionpool import BMConnectionPool
 from dandelion import Dandelion
 from downloadthread import DownloadThread
 from invthread import InvThread
-from networkthread import BMNetworkThread
+from networkthread import BMNetworkShardThread, BMNetworkThread
 from receivequeuethread import ReceiveQueueThread
 from threads import StoppableThread
 from uploadthread import UploadThread
@@ -15,6 +15,6 @@ from uploadthread import UploadThread
 
 __all__ = [
     "BMConnectionPool", "Dandelion",
-    "AddrThread", "AnnounceThread", "BMNetworkThread", "DownloadThread",
-    "InvThread", "ReceiveQueueThread", "UploadThread", "StoppableThread"
+    "AddrThread", "AnnounceThread", "BMNetworkThread",
+    "BMNetworkShardThread", "DownloadThread", "InvThread", "ReceiveQueueThread", "UploadThread", "StoppableThread"
 ]
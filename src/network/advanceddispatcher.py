@@ -2,12 +2,16 @@
 Improved version of asyncore dispatcher
 """
 # pylint: disable=attribute-defined-outside-init
+import collections
+import errno
+import itertools
 import socket
 import threading
 import time
 
 import network.asyncore_pollchoose as asyncore
 import state
+from queues import receiveDataQueue
 from threads import BusyError, nonBlocking
 
 
@@ -22,17 +26,145 @@ class UnknownStateError(ProcessingError):
     pass
 
 
+class ReceiveBuffer(object):
+    """
+    The stream read buffer: received data is written with `recv_into`
+    at the end of a chunk and read from a cursor, so the processed
+    data is never moved. When the chunk is full, or the expected message
+    doesn't fit in it, the unprocessed data is copied to a new one large
+    enough for the expected message.
+    The chunks are never written over, so the views returned by
+    `view` stay valid.
+    """
+    def __init__(self, chunkSize):
+        self.chunkSize = chunkSize
+        self._chunk = bytearray()
+        self._start = self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __getitem__(self, key):
+        """A copy of the slice *key* of the unprocessed data"""
+        start, stop, _ = key.indices(len(self))
+        return self._chunk[self._start + start:self._start + max(start, stop)]
+
+    def view(self, length):
+        """A read only buffer of the first *length* bytes, not a copy"""
+        return buffer(self._chunk, self._start, min(length, len(self)))
+
+    def consume(self, length):
+        """Move the cursor after the first *length* bytes"""
+        self._start = min(self._start + length, self._end)
+
+    def reserve(self, length, expected=0):
+        """
+        Return a writable view of up to *length* bytes at the end,
+        for a message of *expected* bytes from the cursor
+        """
+        room = len(self._chunk) - self._end
+        if not room or room < length and (
+                self._start + expected > len(self._chunk)):
+            size = len(self)
+            chunk = bytearray(max(self.chunkSize, size + length, expected))
+            chunk[:size] = buffer(self._chunk, self._start, size)
+            self._chunk, self._start, self._end = chunk, 0, size
+        return memoryview(self._chunk)[self._end:self._end + length]
+
+    def advance(self, length):
+        """Add *length* bytes written into the view from `reserve`"""
+        self._end += length
+
+    def extend(self, data):
+        """Append a copy of the *data*"""
+        self.reserve(len(data), len(self) + len(data))[:] = data
+        self.advance(len(data))
+
+    def clear(self):
+        """Drop all the data"""
+        self._chunk = bytearray()
+        self._start = self._end = 0
+
+
+class SendBuffer(object):
+    """
+    The stream write buffer: a queue of the appended buffers, sent
+    from an offset into the first one. The large buffers (such as the
+    object payloads) are sent without copying, the small ones
+    (such as inv packets) are joined into one up to the size of a send.
+    """
+    #: buffers smaller than that are joined with the following ones
+    joinSize = 16384
+
+    def __init__(self):
+        self._buffers = collections.deque()
+        self._offset = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, data):
+        """Queue the *data*, which must not be changed afterwards"""
+        if data:
+            self._buffers.append(data)
+            self._size += len(data)
+
+    def peek(self, length):
+        """Return up to *length* bytes from the front"""
+        if not self._buffers:
+            return b''
+        first = self._buffers[0]
+        if len(first) - self._offset < self.joinSize and (
+                len(self._buffers) > 1):
+            # replace the small buffers by one
+            joined = bytearray(buffer(first, self._offset))
+            count = 1
+            for data in itertools.islice(self._buffers, 1, None):
+                if len(data) >= self.joinSize or (
+                        len(joined) + len(data) > length):
+                    break
+                joined.extend(data)
+                count += 1
+            if count > 1:
+                for _ in range(count):
+                    self._buffers.popleft()
+                self._buffers.appendleft(joined)
+                self._offset = 0
+        return buffer(self._buffers[0], self._offset, length)
+
+    def consume(self, length):
+        """Drop the first *length* bytes, which have been sent"""
+        self._size -= min(length, self._size)
+        length += self._offset
+        while self._buffers and length >= len(self._buffers[0]):
+            length -= len(self._buffers.popleft())
+        self._offset = length if self._buffers else 0
+
+    def clear(self):
+        """Drop all the data"""
+        self._buffers.clear()
+        self._offset = self._size = 0
+
+
 class AdvancedDispatcher(asyncore.dispatcher):
     """Improved version of asyncore dispatcher,
     with buffers and protocol state."""
     # pylint: disable=too-many-instance-attributes
     _buf_len = 131072  # 128kB
+    #: whether to place the dispatcher into one of the shards
+    #: (`asyncore.shard_map`) instead of the main socket map
+    sharded = False
+    #: process the received data in the network thread instead of
+    #: passing the connection to a `.ReceiveQueueThread`
+    inlineProcessing = False
 
     def __init__(self, sock=None):
         if not hasattr(self, '_map'):
-            asyncore.dispatcher.__init__(self, sock)
-        self.read_buf = bytearray()
-        self.write_buf = bytearray()
+            asyncore.dispatcher.__init__(
+                self, sock, asyncore.shard_map() if self.sharded else None)
+        self.read_buf = ReceiveBuffer(self._buf_len)
+        self.write_buf = SendBuffer()
         self.state = "init"
         self.lastTx = time.time()
         self.sentBytes = 0
@@ -43,33 +175,31 @@ class AdvancedDispatcher(asyncore.dispatcher):
         self.processingLock = threading.RLock()
 
     def append_write_buf(self, data):
-        """Append binary data to the end of stream write buffer."""
+        """
+        Append binary data, or a list of chunks, to the end of stream
+        write buffer. The data is queued, not copied.
+        """
         if data:
             if isinstance(data, list):
                 with self.writeLock:
                     for chunk in data:
-                        self.write_buf.extend(chunk)
+                        self.write_buf.append(chunk)
             else:
                 with self.writeLock:
-                    self.write_buf.extend(data)
+                    self.write_buf.append(data)
+            self.update_interest()
 
     def slice_write_buf(self, length=0):
         """Cut the beginning of the stream write buffer."""
         if length > 0:
             with self.writeLock:
-                if length >= len(self.write_buf):
-                    del self.write_buf[:]
-                else:
-                    del self.write_buf[0:length]
+                self.write_buf.consume(length)
 
     def slice_read_buf(self, length=0):
         """Cut the beginning of the stream read buffer."""
         if length > 0:
             with self.readLock:
-                if length >= len(self.read_buf):
-                    del self.read_buf[:]
-                else:
-                    del self.read_buf[0:length]
+                self.read_buf.consume(length)
 
     def process(self):
         """Process (parse) data that's in the buffer,
@@ -93,11 +223,38 @@ class AdvancedDispatcher(asyncore.dispatcher):
                 return False
         return False
 
+    def process_received(self):
+        """Process the data received, logging the errors"""
+        try:
+            self.process()
+        # state isn't implemented
+        except UnknownStateError:
+            pass
+        except socket.error as err:
+            if err.errno == errno.EBADF:
+                self.set_state("close", 0)
+            else:
+                self.logger.error('Socket error: %s', err)
+        except:  # noqa:E722
+            self.logger.error('Error processing', exc_info=True)
+
+    def schedule_process(self, dest):
+        """
+        Have the data received processed: right away with the
+        `inlineProcessing`, otherwise by a `.ReceiveQueueThread`
+        which finds the connection by *dest*
+        """
+        if self.inlineProcessing:
+            self.process_received()
+        else:
+            receiveDataQueue.put(dest)
+
     def set_state(self, state_str, length=0, expectBytes=0):
         """Set the next processing state."""
         self.expectBytes = expectBytes
         self.slice_read_buf(length)
         self.state = state_str
+        self.update_interest()
 
     def writable(self):
         """Is data from the write buffer ready to be sent to the network?"""
@@ -127,18 +284,22 @@ class AdvancedDispatcher(asyncore.dispatcher):
                 self.connected and self.downloadChunk > 0))
 
     def handle_read(self):
-        """Append incoming data to the read buffer."""
+        """Receive incoming data into the read buffer."""
         self.lastTx = time.time()
-        newData = self.recv(self.downloadChunk)
-        self.receivedBytes += len(newData)
-        asyncore.update_received(len(newData))
         with self.readLock:
-            self.read_buf.extend(newData)
+            buf = self.read_buf.reserve(
+                self.downloadChunk, self.expectBytes)
+            received = self.recv_into(buf, len(buf))
+            self.read_buf.advance(received)
+        self.receivedBytes += received
+        asyncore.update_received(received)
 
     def handle_write(self):
         """Send outgoing data from write buffer."""
         self.lastTx = time.time()
-        written = self.send(self.write_buf[0:self.uploadChunk])
+        with self.writeLock:
+            data = self.write_buf.peek(self.uploadChunk)
+        written = self.send(data)
         asyncore.update_sent(written)
         self.sentBytes += written
         self.slice_write_buf(written)
@@ -164,8 +325,8 @@ class AdvancedDispatcher(asyncore.dispatcher):
         """Callback for connection being closed,
         but can also be called directly when you want connection to close."""
         with self.readLock:
-            self.read_buf = bytearray()
+            self.read_buf.clear()
         with self.writeLock:
-            self.write_buf = bytearray()
+            self.write_buf.clear()
         self.set_state("close")
         self.close()
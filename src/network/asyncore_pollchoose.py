@@ -17,7 +17,7 @@ from errno import (
     ECONNRESET, EHOSTUNREACH, EINPROGRESS, EINTR, EINVAL, EISCONN, ENETUNREACH,
     ENOTCONN, ENOTSOCK, EPIPE, ESHUTDOWN, ETIMEDOUT, EWOULDBLOCK, errorcode
 )
-from threading import current_thread
+from threading import Lock, current_thread
 
 import helper_random
 
@@ -47,10 +47,65 @@ _DISCONNECTED = frozenset((
 OP_READ = 1
 OP_WRITE = 2
 
+
+
+class SocketMap(dict):
+    """
+    A map of the file descriptors to the dispatchers, keeping the state
+    of the pollers which serve it, so that the maps can be polled
+    by the separate threads
+    """
+    def __init__(self, *args, **kwargs):
+        super(SocketMap, self).__init__(*args, **kwargs)
+        #: the pollsters by the poller name
+        self.pollsters = {}
+        #: the dispatchers of which the interest in the events may have
+        #: changed, updated by the `epoll_event_poller`
+        self.interest_changed = set()
+        #: the rate limits state last seen by the `epoll_event_poller`
+        self.buckets = None
+
+
 try:
     socket_map
 except NameError:
-    socket_map = {}
+    socket_map = SocketMap()
+
+#: the poller state of the maps which aren't a `SocketMap`
+_shared_state = SocketMap()
+#: the additional maps, each polled by its own thread, see `add_shard`
+shard_maps = []
+#: use the `epoll_event_poller` where available
+event_poller = False
+
+
+def _state(map):
+    """The `SocketMap` keeping the poller state of the *map*"""
+    return map if isinstance(map, SocketMap) else _shared_state
+
+
+def _pollster(map, name, factory):
+    """The pollster *name* of the *map*, created by *factory* if needed"""
+    pollsters = _state(map).pollsters
+    try:
+        return pollsters[name]
+    except KeyError:
+        return pollsters.setdefault(name, factory())
+
+
+def add_shard():
+    """Add a map for the connections, to be polled by a separate thread"""
+    shard = SocketMap()
+    shard_maps.append(shard)
+    return shard
+
+
+def shard_map():
+    """
+    The map with the fewest dispatchers out of `socket_map` and the
+    `shard_maps`, for a new connection
+    """
+    return min([socket_map] + shard_maps, key=len)
 
 
 def _strerror(err):
@@ -78,6 +133,9 @@ maxUploadRate = 0
 uploadTimestamp = 0
 uploadBucket = 0
 sentBytes = 0
+#: the rate limits are shared by all the maps, which may be polled
+#: by the separate threads
+_rates_lock = Lock()
 
 
 def read(obj):
@@ -137,16 +195,17 @@ def update_received(download=0):
 
     global receivedBytes, downloadBucket, downloadTimestamp
 
-    currentTimestamp = time.time()
-    receivedBytes += download
-    if maxDownloadRate > 0:
-        bucketIncrease = \
-            maxDownloadRate * (currentTimestamp - downloadTimestamp)
-        downloadBucket += bucketIncrease
-        if downloadBucket > maxDownloadRate:
-            downloadBucket = int(maxDownloadRate)
-        downloadBucket -= download
-    downloadTimestamp = currentTimestamp
+    with _rates_lock:
+        currentTimestamp = time.time()
+        receivedBytes += download
+        if maxDownloadRate > 0:
+            bucketIncrease = \
+                maxDownloadRate * (currentTimestamp - downloadTimestamp)
+            downloadBucket += bucketIncrease
+            if downloadBucket > maxDownloadRate:
+                downloadBucket = int(maxDownloadRate)
+            downloadBucket -= download
+        downloadTimestamp = currentTimestamp
 
 
 def update_sent(upload=0):
@@ -154,14 +213,16 @@ def update_sent(upload=0):
 
     global sentBytes, uploadBucket, uploadTimestamp
 
-    currentTimestamp = time.time()
-    sentBytes += upload
-    if maxUploadRate > 0:
-        bucketIncrease = maxUploadRate * (currentTimestamp - uploadTimestamp)
-        uploadBucket += bucketIncrease
-        if uploadBucket > maxUploadRate:
-            uploadBucket = int(maxUploadRate)
-        uploadBucket -= upload
+    with _rates_lock:
+        currentTimestamp = time.time()
+        sentBytes += upload
+        if maxUploadRate > 0:
+            bucketIncrease = \
+                maxUploadRate * (currentTimestamp - uploadTimestamp)
+            uploadBucket += bucketIncrease
+            if uploadBucket > maxUploadRate:
+                uploadBucket = int(maxUploadRate)
+            uploadBucket -= upload
     uploadTimestamp = currentTimestamp
 
 
@@ -262,10 +323,7 @@ def poll_poller(timeout=0.0, map=None):
     if timeout is not None:
         # timeout is in milliseconds
         timeout = int(timeout * 1000)
-    try:
-        poll_poller.pollster
-    except AttributeError:
-        poll_poller.pollster = select.poll()
+    pollster = _pollster(map, 'poll', select.poll)
     if map:
         for fd, obj in list(map.items()):
             flags = newflags = 0
@@ -284,14 +342,14 @@ def poll_poller(timeout=0.0, map=None):
                 obj.poller_flags = newflags
                 try:
                     if obj.poller_registered:
-                        poll_poller.pollster.modify(fd, flags)
+                        pollster.modify(fd, flags)
                     else:
-                        poll_poller.pollster.register(fd, flags)
+                        pollster.register(fd, flags)
                         obj.poller_registered = True
                 except IOError:
                     pass
         try:
-            r = poll_poller.pollster.poll(timeout)
+            r = pollster.poll(timeout)
         except KeyboardInterrupt:
             r = []
         except socket.error as err:
@@ -316,10 +374,7 @@ def epoll_poller(timeout=0.0, map=None):
 
     if map is None:
         map = socket_map
-    try:
-        epoll_poller.pollster
-    except AttributeError:
-        epoll_poller.pollster = select.epoll()
+    pollster = _pollster(map, 'epoll', select.epoll)
     if map:
         for fd, obj in map.items():
             flags = newflags = 0
@@ -341,14 +396,14 @@ def epoll_poller(timeout=0.0, map=None):
                 flags |= select.POLLERR | select.POLLHUP | select.POLLNVAL
                 try:
                     if obj.poller_registered:
-                        epoll_poller.pollster.modify(fd, flags)
+                        pollster.modify(fd, flags)
                     else:
-                        epoll_poller.pollster.register(fd, flags)
+                        pollster.register(fd, flags)
                         obj.poller_registered = True
                 except IOError:
                     pass
         try:
-            r = epoll_poller.pollster.poll(timeout)
+            r = pollster.poll(timeout)
         except IOError as e:
             if e.errno != EINTR:
                 raise
@@ -366,16 +421,89 @@ def epoll_poller(timeout=0.0, map=None):
         current_thread().stop.wait(timeout)
 
 
+def _buckets_state():
+    """Whether the rate limits allow to receive and to send"""
+    return (
+        maxDownloadRate == 0 or downloadBucket > dispatcher.minTx,
+        maxUploadRate == 0 or uploadBucket > dispatcher.minTx)
+
+
+def epoll_event_poller(timeout=0.0, map=None):
+    """
+    A poller which uses epoll() keeping the dispatchers registered.
+    Only the interest of the dispatchers which may have changed
+    (`dispatcher.update_interest`), handled an event, or of all of them
+    when a rate limit bucket gets exhausted or refilled, is checked.
+    """
+
+    if map is None:
+        map = socket_map
+    state = _state(map)
+    interest_changed = state.interest_changed
+    pollster = _pollster(map, 'epoll_event', select.epoll)
+    if not map:
+        current_thread().stop.wait(timeout)
+        return
+    buckets = _buckets_state()
+    if buckets != state.buckets:
+        state.buckets = buckets
+        interest_changed.update(map.values())
+    while interest_changed:
+        obj = interest_changed.pop()
+        fd = obj._fileno  # pylint: disable=protected-access
+        if fd is None or map.get(fd) is not obj:
+            continue
+        flags = newflags = 0
+        if obj.readable():
+            flags |= select.POLLIN | select.POLLPRI
+            newflags |= OP_READ
+        # accepting sockets should not be writable
+        if obj.writable() and not obj.accepting:
+            flags |= select.POLLOUT
+            newflags |= OP_WRITE
+        if newflags != obj.poller_flags or not obj.poller_registered:
+            obj.poller_flags = newflags
+            flags |= select.POLLERR | select.POLLHUP | select.POLLNVAL
+            try:
+                if obj.poller_registered:
+                    pollster.modify(fd, flags)
+                else:
+                    pollster.register(fd, flags)
+                    obj.poller_registered = True
+            except IOError:
+                pass
+    try:
+        r = pollster.poll(timeout)
+    except IOError as e:
+        if e.errno != EINTR:
+            raise
+        r = []
+    except select.error as err:
+        if err.args[0] != EINTR:
+            raise
+        r = []
+    for fd, flags in helper_random.randomsample(r, len(r)):
+        obj = map.get(fd)
+        if obj is None:
+            continue
+        # the interest may have changed since the registration,
+        # this also sets the sizes of the reads and the writes
+        if flags & (select.POLLIN | select.POLLPRI) and not obj.readable():
+            flags &= ~(select.POLLIN | select.POLLPRI)
+        if flags & select.POLLOUT and (
+                obj.accepting or not obj.writable()):
+            flags &= ~select.POLLOUT
+        readwrite(obj, flags)
+        interest_changed.add(obj)
+
+
 def kqueue_poller(timeout=0.0, map=None):
     """A poller which uses kqueue(), BSD specific."""
     # pylint: disable=no-member,too-many-statements
 
     if map is None:
         map = socket_map
-    try:
-        kqueue_poller.pollster
-    except AttributeError:
-        kqueue_poller.pollster = select.kqueue()
+    pollster = _pollster(map, 'kqueue', select.kqueue)
     if map:
         updates = []
         selectables = 0
@@ -418,7 +546,7 @@ def kqueue_poller(timeout=0.0, map=None):
             current_thread().stop.wait(timeout)
             return
 
-        events = kqueue_poller.pollster.control(updates, selectables, timeout)
+        events = pollster.control(updates, selectables, timeout)
         if len(events) > 1:
             events = helper_random.randomsample(events, len(events))
 
@@ -455,6 +583,8 @@ def loop(timeout=30.0, use_poll=False, map=None, count=None, poller=None):
     if poller is None:
         if use_poll:
             poller = poll_poller
+        elif event_poller and hasattr(select, 'epoll'):
+            poller = epoll_event_poller
         elif hasattr(select, 'epoll'):
             poller = epoll_poller
         elif hasattr(select, 'kqueue'):
@@ -549,9 +679,21 @@ class dispatcher(object):
         # pylint: disable=attribute-defined-outside-init
         if map is None:
             map = self._map
+        else:
+            self._map = map
         map[self._fileno] = self
         self.poller_flags = 0
         self.poller_filter = 0
+        self.update_interest()
+
+    def update_interest(self):
+        """
+        Let the `epoll_event_poller` check `readable` and `writable`
+        again, when the result may change otherwise than by the
+        handling of an event or the rate limits
+        """
+        if event_poller:
+            _state(self._map).interest_changed.add(self)
 
     def del_channel(self, map=None):
         """Delete a channel"""
@@ -561,26 +703,22 @@ class dispatcher(object):
         if fd in map:
             del map[fd]
         if self._fileno:
-            try:
-                kqueue_poller.pollster.control([select.kevent(
-                    fd, select.KQ_FILTER_READ, select.KQ_EV_DELETE)], 0)
-            except(AttributeError, KeyError, TypeError, IOError, OSError):
-                pass
-            try:
-                kqueue_poller.pollster.control([select.kevent(
-                    fd, select.KQ_FILTER_WRITE, select.KQ_EV_DELETE)], 0)
-            except(AttributeError, KeyError, TypeError, IOError, OSError):
-                pass
-            try:
-                epoll_poller.pollster.unregister(fd)
-            except (AttributeError, KeyError, TypeError, IOError):
-                # no epoll used, or not registered
-                pass
-            try:
-                poll_poller.pollster.unregister(fd)
-            except (AttributeError, KeyError, TypeError, IOError):
-                # no poll used, or not registered
-                pass
+            pollsters = _state(map).pollsters
+            kqueue = pollsters.get('kqueue')
+            for kq_filter in (
+                    select.KQ_FILTER_READ, select.KQ_FILTER_WRITE
+            ) if kqueue else ():
+                try:
+                    kqueue.control([select.kevent(
+                        fd, kq_filter, select.KQ_EV_DELETE)], 0)
+                except (KeyError, TypeError, IOError, OSError):
+                    pass
+            for name in ('epoll', 'epoll_event', 'poll'):
+                try:
+                    pollsters[name].unregister(fd)
+                except (KeyError, TypeError, IOError):
+                    # not used, or not registered
+                    pass
         self._fileno = None
         self.poller_flags = 0
         self.poller_filter = 0
@@ -711,6 +849,25 @@ class dispatcher(object):
             else:
                 raise
 
+    def recv_into(self, buf, nbytes):
+        """Receive up to *nbytes* into the writable *buf*"""
+        try:
+            received = self.socket.recv_into(buf, nbytes)
+            if not received:
+                # a closed connection is indicated by signaling
+                # a read condition, and having recv_into() return 0.
+                self.handle_close()
+            return received
+        except socket.error as why:
+            # winsock sometimes raises ENOTCONN
+            if why.args[0] in (EAGAIN, EWOULDBLOCK, WSAEWOULDBLOCK):
+                return 0
+            if why.args[0] in _DISCONNECTED:
+                self.handle_close()
+                return 0
+            else:
+                raise
+
     def close(self):
         """Close connection"""
         self.connected = False
@@ -62,14 +62,16 @@ class BMObject(object):  # pylint: disable=too-many-instance-attributes
             version,
             streamNumber,
             data,
-            payloadOffset
+            payloadOffset,
+            digest=None
     ):  # pylint: disable=too-many-arguments
         self.nonce = nonce
         self.expiresTime = expiresTime
         self.objectType = objectType
         self.version = version
         self.streamNumber = streamNumber
-        self.inventoryHash = calculateInventoryHash(data)
+        # *digest* is the SHA-512 of the data from the packet checksum
+        self.inventoryHash = calculateInventoryHash(data, digest)
         # copy to avoid memory issues
         self.data = bytearray(data)
         self.tag = self.data[payloadOffset:payloadOffset + 32]
@@ -73,6 +73,7 @@ class BMProto(AdvancedDispatcher, ObjectTracker):
         self.command = None
         self.payloadLength = 0
         self.checksum = None
+        self.payloadDigest = None
         self.payload = None
         self.invalid = False
         self.payloadOffset = 0
@@ -102,8 +103,11 @@ class BMProto(AdvancedDispatcher, ObjectTracker):
 
     def state_bm_command(self):     # pylint: disable=too-many-branches
         """Process incoming command"""
-        self.payload = self.read_buf[:self.payloadLength]
-        if self.checksum != hashlib.sha512(self.payload).digest()[0:4]:
+        # a view of the read buffer, the fields are sliced from it
+        self.payload = self.read_buf.view(self.payloadLength)
+        # also used for the inventory hash of an object
+        self.payloadDigest = hashlib.sha512(self.payload).digest()
+        if self.checksum != self.payloadDigest[0:4]:
             logger.debug('Bad checksum, ignoring')
             self.invalid = True
         retval = True
@@ -162,8 +166,9 @@ class BMProto(AdvancedDispatcher, ObjectTracker):
 
     def decode_payload_varint(self):
         """Decode a varint from the payload"""
+        # a varint is at most 9 bytes long
         value, offset = addresses.decodeVarint(
-            self.payload[self.payloadOffset:])
+            self.payload[self.payloadOffset:self.payloadOffset + 9])
         self.payloadOffset += offset
         return value
 
@@ -374,7 +379,7 @@ class BMProto(AdvancedDispatcher, ObjectTracker):
             self.decode_payload_content("QQIvv")
         self.object = BMObject(
             nonce, expiresTime, objectType, version, streamNumber,
-            self.payload, self.payloadOffset)
+            self.payload, self.payloadOffset, self.payloadDigest)
 
         if len(self.payload) - self.payloadOffset > MAX_OBJECT_PAYLOAD_SIZE:
             logger.info(
@@ -422,6 +427,10 @@ class BMProto(AdvancedDispatcher, ObjectTracker):
             buffer(self.payload[objectOffset:]), self.object.expiresTime,
             buffer(self.object.tag)
         )
+        # the checksum has been verified, send the same header
+        Inventory().setPacketHeader(
+            self.object.inventoryHash, protocol.CreatePacketHeader(
+                'object', self.payload, self.checksum))
         self.handleReceivedObject(
             self.object.streamNumber, self.object.inventoryHash)
         invQueue.put((
@@ -15,6 +15,7 @@ import protocol
 import state
 from bmconfigparser import BMConfigParser
 from connectionchooser import chooseConnection
+from network.advanceddispatcher import AdvancedDispatcher
 from node import Peer
 from proxy import Proxy
 from singleton import Singleton
@@ -51,6 +52,10 @@ class BMConnectionPool(object):
             BMConfigParser().safeGetInt(
                 "bitmessagesettings", "maxuploadrate")
         )
+        asyncore.event_poller = BMConfigParser().safeGetBoolean(
+            "network", "eventpoller")
+        AdvancedDispatcher.inlineProcessing = BMConfigParser().safeGetBoolean(
+            "network", "inlineprocessing")
         self.outboundConnections = {}
         self.inboundConnections = {}
         self.listeningSockets = {}
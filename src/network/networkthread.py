@@ -40,3 +40,24 @@ class BMNetworkThread(StoppableThread):
 
         # just in case
         asyncore.close_all()
+        for shard in asyncore.shard_maps:
+            asyncore.close_all(shard)
+
+
+class BMNetworkShardThread(StoppableThread):
+    """
+    A network thread polling its own shard of the connections,
+    added to the `asyncore.shard_maps`. The new connections are assigned
+    to the least loaded map, see `asyncore.shard_map`.
+    """
+    def __init__(self, num=1):
+        super(BMNetworkShardThread, self).__init__(name="Asyncore_%i" % num)
+        self.map = asyncore.add_shard()
+
+    def run(self):
+        try:
+            while not self._stopped and state.shutdown == 0:
+                asyncore.loop(timeout=2.0, map=self.map, count=1000)
+        except Exception as e:
+            excQueue.put((self.name, e))
+            raise
@@ -1,12 +1,9 @@
 """
 Process data incoming from network
 """
-import errno
 import Queue
-import socket
 
 import state
-from network.advanceddispatcher import UnknownStateError
 from network.connectionpool import BMConnectionPool
 from queues import receiveDataQueue
 from threads import StoppableThread
@@ -41,16 +38,5 @@ class ReceiveQueueThread(StoppableThread):
             except KeyError:
                 receiveDataQueue.task_done()
                 continue
-            try:
-                connection.process()
-            # state isn't implemented
-            except UnknownStateError:
-                pass
-            except socket.error as err:
-                if err.errno == errno.EBADF:
-                    connection.set_state("close", 0)
-                else:
-                    self.logger.error('Socket error: %s', err)
-            except:
-                self.logger.error('Error processing', exc_info=True)
+            connection.process_received()
             receiveDataQueue.task_done()
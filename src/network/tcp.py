@@ -29,7 +29,7 @@ from network.socks4a import Socks4aConnection
 from network.socks5 import Socks5Connection
 from network.tls import TLSDispatcher
 from node import Peer
-from queues import invQueue, receiveDataQueue, UISignalQueue
+from queues import invQueue, UISignalQueue
 from tr import _translate
 
 logger = logging.getLogger('default')
@@ -44,6 +44,7 @@ class TCPConnection(BMProto, TLSDispatcher):
     """
     .. todo:: Look to understand and/or fix the non-parent-init-called
     """
+    sharded = True
 
     def __init__(self, address=None, sock=None):
         BMProto.__init__(self, address=address, sock=sock)
@@ -271,12 +272,12 @@ class TCPConnection(BMProto, TLSDispatcher):
                 connectionpool.BMConnectionPool().streams,
                 False, nodeid=self.nodeid))
         self.connectedAt = time.time()
-        receiveDataQueue.put(self.destination)
+        self.schedule_process(self.destination)
 
     def handle_read(self):
         """Callback for reading from a socket"""
         TLSDispatcher.handle_read(self)
-        receiveDataQueue.put(self.destination)
+        self.schedule_process(self.destination)
 
     def handle_write(self):
         """Callback for writing to a socket"""
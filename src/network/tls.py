@@ -10,7 +10,6 @@ import sys
 import network.asyncore_pollchoose as asyncore
 import paths
 from network.advanceddispatcher import AdvancedDispatcher
-from queues import receiveDataQueue
 
 logger = logging.getLogger('default')
 
@@ -239,5 +238,5 @@ class TLSDispatcher(AdvancedDispatcher):
 
             self.bm_proto_reset()
             self.set_state("connection_fully_established")
-            receiveDataQueue.put(self.destination)
+            self.schedule_process(self.destination)
         return False
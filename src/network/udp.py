@@ -10,7 +10,6 @@ import state
 from bmproto import BMProto
 from node import Peer
 from objectracker import ObjectTracker
-from queues import receiveDataQueue
 
 logger = logging.getLogger('default')
 
@@ -135,14 +134,16 @@ class UDPSocket(BMProto):  # pylint: disable=too-many-instance-attributes
         self.local = bool(protocol.checkIPAddress(encodedAddr, True))
         # overwrite the old buffer to avoid mixing data and so that
         # self.local works correctly
-        self.read_buf[0:] = recdata
+        self.read_buf.clear()
+        self.read_buf.extend(recdata)
         self.bm_proto_reset()
-        receiveDataQueue.put(self.listening)
+        self.schedule_process(self.listening)
 
     def handle_write(self):
         try:
             retval = self.socket.sendto(
-                self.write_buf, ('<broadcast>', self.port))
+                self.write_buf.peek(len(self.write_buf)),
+                ('<broadcast>', self.port))
         except socket.error as e:
             logger.error("socket error on sendto: %s", e)
             if e.errno == 101:
@@ -4,7 +4,6 @@
 import time
 
 import helper_random
-import protocol
 from inventory import Inventory
 from network.connectionpool import BMConnectionPool
 from network.dandelion import Dandelion
@@ -37,7 +36,7 @@ class UploadThread(StoppableThread):
                         RandomTrackingDict.maxPending)
                 except KeyError:
                     continue
-                payload = bytearray()
+                packets = []
                 chunk_count = 0
                 for chunk in request:
                     del i.pendingUpload[chunk]
@@ -49,8 +48,8 @@ class UploadThread(StoppableThread):
                             i.destination)
                         break
                     try:
-                        payload.extend(protocol.CreatePacket(
-                            'object', Inventory()[chunk].payload))
+                        # the header and the payload, queued without copying
+                        packets.extend(Inventory().packet(chunk))
                         chunk_count += 1
                     except KeyError:
                         i.antiIntersectionDelay()
@@ -60,7 +59,7 @@ class UploadThread(StoppableThread):
                         break
                 if not chunk_count:
                     continue
-                i.append_write_buf(payload)
+                i.append_write_buf(packets)
                 self.logger.debug(
                     '%s:%i Uploading %i objects',
                     i.destination.host, i.destination.port, chunk_count)
@@ -268,8 +268,10 @@ def isProofOfWorkSufficient(
     TTL = endOfLifeTime - (int(recvTime) if recvTime else int(time.time()))
     if TTL < 300:
         TTL = 300
+    # the initial hash covers the object without the nonce,
+    # hashed without copying it
     POW, = unpack('>Q', hashlib.sha512(hashlib.sha512(
-        data[:8] + hashlib.sha512(data[8:]).digest()
+        data[:8] + hashlib.sha512(buffer(data, 8)).digest()
     ).digest()).digest()[0:8])
     return POW <= 2 ** 64 / (
         nonceTrialsPerByte * (
@@ -280,13 +282,20 @@ def isProofOfWorkSufficient(
 # Packet creation
 
 
+def CreatePacketHeader(command, payload='', checksum=None):
+    """
+    Construct and return the header of a packet, the *checksum*
+    of the *payload* is calculated if not given
+    """
+    if checksum is None:
+        checksum = hashlib.sha512(payload).digest()[0:4]
+    return Header.pack(0xE9BEB4D9, command, len(payload), checksum)
+
+
 def CreatePacket(command, payload=''):
     """Construct and return a packet"""
-    payload_length = len(payload)
-    checksum = hashlib.sha512(payload).digest()[0:4]
-
-    b = bytearray(Header.size + payload_length)
-    Header.pack_into(b, 0, 0xE9BEB4D9, command, payload_length, checksum)
+    b = bytearray(Header.size + len(payload))
+    b[:Header.size] = CreatePacketHeader(command, payload)
     b[Header.size:] = payload
     return bytes(b)
 
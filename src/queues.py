@@ -3,12 +3,24 @@
 import Queue
 import threading
 import time
+from collections import deque
 
+from helper_sql import sqlReaders
 from multiqueue import MultiQueue
+from storage.journal import Journal
 
 
 class ObjectProcessorQueue(Queue.Queue):
-    """Special queue class using lock for `.threads.objectProcessor`"""
+    """
+    Special queue class using lock for `.threads.objectProcessor`.
+
+    When a journal is opened the objects are also appended to it and
+    the consumer acknowledges them once processed. The acknowledgement
+    is recorded once the deferred writes submitted by the consumer
+    while processing the object are committed. The objects left
+    in the journal by the previous run are read from the disk and
+    got before the others.
+    """
 
     maxSize = 32000000
 
@@ -19,20 +31,77 @@ class ObjectProcessorQueue(Queue.Queue):
         #: with objects which take up too much memory. If this gets
         #: too big we'll sleep before asking for further objects.
         self.curSize = 0
+        self.journal = None
+        #: keeps the order of the objects in the journal and in the queue
+        self.journalLock = threading.Lock()
+        self._backlog = iter(())
+        self._position = None
+        #: the positions of the processed objects and the numbers of
+        #: the deferred writes to commit before acknowledging them
+        self._processed = deque()
+
+    def open(self, directory):
+        """
+        Journal the objects in *directory*,
+        return the number of objects left in it
+        """
+        self.journal = Journal(directory)
+        self._backlog = self.journal.backlog()
+        with self.sizeLock:
+            self.curSize += self.journal.backlogSize
+        return self.journal.backlogCount
+
+    def close(self):
+        """Close the journal, the objects left in it are kept"""
+        with self.journalLock:
+            if self.journal:
+                # the others are processed again on the next start
+                self._acknowledge()
+                self.journal.close()
+            self.journal = None
+            self._backlog = iter(())
+            self._processed.clear()
 
     def put(self, item, block=True, timeout=None):
         while self.curSize >= self.maxSize:
             time.sleep(1)
         with self.sizeLock:
             self.curSize += len(item[1])
-        Queue.Queue.put(self, item, block, timeout)
+        with self.journalLock:
+            position = None
+            # not the commands like 'checkShutdownVariable'
+            if self.journal and isinstance(item[0], int):
+                position = self.journal.append(*item)
+            Queue.Queue.put(self, (item, position), block, timeout)
 
     def get(self, block=True, timeout=None):
-        item = Queue.Queue.get(self, block, timeout)
+        try:
+            item, self._position = next(self._backlog)
+        except StopIteration:
+            if self.journal and self.empty():
+                self._acknowledge()
+                self.journal.sync()
+            item, self._position = Queue.Queue.get(self, block, timeout)
         with self.sizeLock:
             self.curSize -= len(item[1])
         return item
 
+    def acknowledge(self):
+        """Record the processing of the last object got in the journal"""
+        if self.journal and self._position:
+            self._processed.append(
+                (self._position, sqlReaders.lastDeferred()))
+            self._acknowledge()
+        self._position = None
+
+    def _acknowledge(self):
+        position = None
+        while self._processed and sqlReaders.isCommitted(
+                self._processed[0][1]):
+            position = self._processed.popleft()[0]
+        if position:
+            self.journal.acknowledge(position)
+
 
 workerQueue = Queue.Queue()
 UISignalQueue = Queue.Queue()
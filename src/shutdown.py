@@ -39,6 +39,7 @@ def doCleanShutdown():
         'updateStatusBar',
         'Flushing inventory in memory out to disk.'
         ' This should normally only take a second...'))
+    # the inventoryWriter stopped above is joined with the others below
     Inventory().flush()
 
     # Verify that the objectProcessor has finished exiting. It should have
@@ -0,0 +1,84 @@
+"""
+A cache of the recently stored and served inventory items,
+bounded by the total size of their payloads
+"""
+import collections
+import threading
+
+
+class PayloadCache(object):
+    """
+    Least recently used inventory items, at most *maxSize* bytes
+    of payloads. Counts the lookups which found the item (hits)
+    and those which didn't (misses). The header of the object packet
+    can be kept with the item to send it without framing it again.
+    """
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._headers = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        """Return the cached item and mark it used, None if not cached"""
+        with self.lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._items[key] = value
+            self.hits += 1
+            return value
+
+    def header(self, key):
+        """Return the packet header of the cached item, None if not set"""
+        with self.lock:
+            return self._headers.get(key)
+
+    def setHeader(self, key, header):
+        """Keep the packet header of the item while it's cached"""
+        with self.lock:
+            if key in self._items:
+                self._headers[key] = header
+
+    def put(self, key, value):
+        """Cache the item, dropping the least recently used ones"""
+        size = len(value.payload)
+        with self.lock:
+            self._discard(key)
+            if size > self.maxSize:
+                return
+            self._items[key] = value
+            self.size += size
+            while self.size > self.maxSize:
+                dropped, value = self._items.popitem(last=False)
+                self._headers.pop(dropped, None)
+                self.size -= len(value.payload)
+
+    def _discard(self, key):
+        value = self._items.pop(key, None)
+        self._headers.pop(key, None)
+        if value is not None:
+            self.size -= len(value.payload)
+
+    def discard(self, key):
+        """Drop the item from the cache if it's there"""
+        with self.lock:
+            self._discard(key)
+
+    def clean(self, minTime):
+        """Drop the items which expired before *minTime*"""
+        with self.lock:
+            for key, value in self._items.items():
+                if value.expires < minTime:
+                    self._discard(key)
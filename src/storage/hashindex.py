@@ -0,0 +1,185 @@
+"""
+Compact in-memory index of inventory vectors
+"""
+from array import array
+from itertools import izip
+
+
+class HashIndex(object):
+    """
+    A set of fixed width keys (inventory vectors) kept as one sorted
+    string, searched with a binary search. Recent additions and removals
+    go to small sets which are merged into the sorted string once they
+    grow beyond a fraction of its size, so the memory overhead per key
+    stays close to the key width.
+    """
+    #: merge pending changes when there are at least that many of them ...
+    minMerge = 4096
+    #: ... or more than 1/mergeRatio of the merged keys
+    mergeRatio = 8
+
+    def __init__(self, keys=(), width=32):
+        self.width = width
+        self._keys = ''
+        self._count = 0
+        self._added = set()
+        self._removed = set()
+        for key in keys:
+            if len(key) != width:
+                raise ValueError('Key length should be %i' % width)
+            self._added.add(key)
+        self._merge()
+
+    def __contains__(self, key):
+        if key in self._added:
+            return True
+        if key in self._removed:
+            return False
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self._count + len(self._added) - len(self._removed)
+
+    def __iter__(self):
+        self._merge()
+        return iter(self._split())
+
+    def _split(self):
+        return [
+            self._keys[i:i + self.width]
+            for i in xrange(0, len(self._keys), self.width)]
+
+    def _key(self, index):
+        return self._keys[index * self.width:(index + 1) * self.width]
+
+    def _find(self, key):
+        """Return the position of *key* in the merged keys or None"""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key(lo) == key:
+            return lo
+        return None
+
+    def _merge(self):
+        """Merge the pending changes into the sorted string"""
+        if not self._added and not self._removed:
+            return
+        keys = self._split()
+        if self._removed:
+            keys = [key for key in keys if key not in self._removed]
+        keys.extend(self._added)
+        keys.sort()
+        self._keys = ''.join(keys)
+        self._count = len(keys)
+        self._added.clear()
+        self._removed.clear()
+
+    def _maybe_merge(self):
+        pending = len(self._added) + len(self._removed)
+        if pending >= max(self.minMerge, self._count // self.mergeRatio):
+            self._merge()
+
+    def add(self, key):
+        """Add *key* to the index"""
+        if len(key) != self.width:
+            raise ValueError('Key length should be %i' % self.width)
+        if key in self._removed:
+            self._removed.discard(key)
+        elif self._find(key) is None:
+            self._added.add(key)
+            self._maybe_merge()
+
+    def discard(self, key):
+        """Remove *key* from the index if present"""
+        if key in self._added:
+            self._added.discard(key)
+        elif key not in self._removed and self._find(key) is not None:
+            self._removed.add(key)
+            self._maybe_merge()
+
+    def update(self, keys):
+        """Add all the *keys*"""
+        for key in keys:
+            self.add(key)
+
+    def clear(self):
+        """Remove all keys"""
+        self._keys = ''
+        self._count = 0
+        self._added.clear()
+        self._removed.clear()
+
+
+class HashMap(HashIndex):
+    """
+    A `HashIndex` mapping the keys to small integers, which are kept
+    in an array parallel to the sorted keys
+    """
+
+    def __init__(self, items=(), width=32):
+        self._values = array('i')
+        super(HashMap, self).__init__(width=width)
+        self._added = {}
+        for key, value in items:
+            if len(key) != width:
+                raise ValueError('Key length should be %i' % width)
+            self._added[key] = value
+        self._merge()
+
+    def __getitem__(self, key):
+        if key in self._added:
+            return self._added[key]
+        if key not in self._removed:
+            index = self._find(key)
+            if index is not None:
+                return self._values[index]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if len(key) != self.width:
+            raise ValueError('Key length should be %i' % self.width)
+        index = None if key in self._added else self._find(key)
+        if index is None:
+            self._added[key] = value
+            self._maybe_merge()
+        else:
+            self._removed.discard(key)
+            self._values[index] = value
+
+    def _merge(self):
+        """Merge the pending changes into the sorted string and values"""
+        if not self._added and not self._removed:
+            return
+        items = izip(self._split(), self._values)
+        if self._removed:
+            items = (item for item in items if item[0] not in self._removed)
+        # two sorted runs, merged by the sort
+        items = list(items) + sorted(self._added.iteritems())
+        items.sort()
+        self._keys = ''.join(key for key, _ in items)
+        self._values = array('i', (value for _, value in items))
+        self._count = len(items)
+        self._added.clear()
+        self._removed.clear()
+
+    def add(self, key, value=0):
+        """Add *key* with the *value*"""
+        self[key] = value
+
+    def discard(self, key):
+        """Remove *key* from the map if present"""
+        if key in self._added:
+            del self._added[key]
+        elif key not in self._removed and self._find(key) is not None:
+            self._removed.add(key)
+            self._maybe_merge()
+
+    def clear(self):
+        """Remove all keys"""
+        super(HashMap, self).clear()
+        self._values = array('i')
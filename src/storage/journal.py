@@ -0,0 +1,183 @@
+"""
+Append-only journal of the objects queued for processing.
+
+The objects put into the `.queues.ObjectProcessorQueue` are appended to
+segment files, followed by the acknowledgements of their processing.
+Each acknowledgement records the position of the end of the last
+processed object, so after a restart the processing resumes from the
+last acknowledgement. The segments before it are removed.
+
+The records are synced to the disk by the consumer, when acknowledging
+and when it runs out of objects, so the threads appending the objects
+don't wait for the disk.
+"""
+import os
+import threading
+import time
+from struct import Struct
+
+#: kind, object type or segment, length or offset
+recordHeader = Struct('>BQL')
+
+OBJECT = 0
+ACK = 1
+
+
+class Journal(object):
+    """A journal of objects and acknowledgements in *directory*"""
+    suffix = '.dat'
+    #: start a new segment when the current one is that large
+    segmentSize = 16 * 1024 * 1024
+    #: sync the records to the disk at most that often when acknowledging,
+    #: they are written to the file (and survive a kill) at once
+    syncInterval = 1
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._segments = sorted(
+            int(name[:-len(self.suffix)]) for name in os.listdir(directory)
+            if name.endswith(self.suffix)
+            and name[:-len(self.suffix)].isdigit())
+        self._synced = time.time()
+        self._unsynced = False
+        #: the files of the full segments, closed once synced
+        self._full = []
+        #: the position after the last processed object
+        self.acknowledged = (self._segments or [0])[0], 0
+        objects = []
+        for segment in self._segments:
+            for kind, value, length, end in self._records(segment):
+                if kind == ACK:
+                    self.acknowledged = max(self.acknowledged, (value, length))
+                else:
+                    objects.append((segment, end, length))
+        objects = [obj for obj in objects if obj[:2] > self.acknowledged]
+        #: the number and size of the objects left to process
+        self.backlogCount = len(objects)
+        self.backlogSize = sum(length for _, _, length in objects)
+        if not self._segments:
+            self._segments.append(0)
+        self._file = open(self._filename(self._segments[-1]), 'ab')
+        self._file.seek(0, os.SEEK_END)
+        self._size = self._file.tell()
+        self._end = self._segments[-1], self._size
+
+    def _filename(self, segment):
+        return os.path.join(self.directory, '%i%s' % (segment, self.suffix))
+
+    def _records(self, segment):
+        """
+        Iterate over (kind, value, length, end offset) of the records
+        in the *segment*, truncating an incomplete record at the end
+        """
+        with open(self._filename(segment), 'r+b') as data:
+            size = os.fstat(data.fileno()).st_size
+            offset = 0
+            while True:
+                header = data.read(recordHeader.size)
+                if len(header) < recordHeader.size:
+                    break
+                kind, value, length = recordHeader.unpack(header)
+                end = offset + recordHeader.size
+                if kind == OBJECT:
+                    end += length
+                    if end > size:
+                        break
+                    data.seek(length, os.SEEK_CUR)
+                yield kind, value, length, end
+                offset = end
+            data.truncate(offset)
+
+    def backlog(self):
+        """
+        Iterate over the ((object type, data), position) of the objects
+        left to process when the journal was opened, reading them
+        from the disk as they are requested
+        """
+        segment, offset = self.acknowledged
+        while (segment, offset) < self._end:
+            if segment not in self._segments:
+                segment, offset = segment + 1, 0
+                continue
+            with open(self._filename(segment), 'rb') as data:
+                data.seek(offset)
+                while (segment, offset) < self._end:
+                    header = data.read(recordHeader.size)
+                    if len(header) < recordHeader.size:
+                        break
+                    kind, value, length = recordHeader.unpack(header)
+                    offset += recordHeader.size
+                    if kind == OBJECT:
+                        offset += length
+                        yield (value, data.read(length)), (segment, offset)
+            segment, offset = segment + 1, 0
+
+    def _append(self, record):
+        """Append the *record*, return the position of its end"""
+        if self._size >= self.segmentSize:
+            if self._unsynced:
+                self._full.append(self._file)
+            else:
+                self._file.close()
+            self._unsynced = False
+            self._segments.append(self._segments[-1] + 1)
+            self._file = open(self._filename(self._segments[-1]), 'ab')
+            self._size = 0
+        # in one write, it's not lost if the process is killed
+        self._file.write(record)
+        self._file.flush()
+        self._size += len(record)
+        self._unsynced = True
+        return self._segments[-1], self._size
+
+    def append(self, objectType, data):
+        """Append an object, return its position"""
+        with self.lock:
+            return self._append(
+                recordHeader.pack(OBJECT, objectType, len(data)) + data)
+
+    def acknowledge(self, position):
+        """
+        Record the processing of the objects up to *position* and remove
+        the segments which have no objects left to process
+        """
+        with self.lock:
+            segment, offset = self.acknowledged = position
+            self._append(recordHeader.pack(ACK, segment, offset))
+            while self._segments[0] < segment:
+                try:
+                    os.remove(self._filename(self._segments[0]))
+                except OSError:
+                    # still open somewhere, retry on the next acknowledgement
+                    break
+                del self._segments[0]
+        if time.time() - self._synced > self.syncInterval:
+            self.sync()
+
+    def sync(self):
+        """
+        Make sure the appended records are on the disk,
+        the objects can be appended meanwhile
+        """
+        with self.lock:
+            full, self._full = self._full, []
+            current = os.dup(self._file.fileno()) if self._unsynced else None
+            self._unsynced = False
+            self._synced = time.time()
+        for data in full:
+            os.fsync(data.fileno())
+            data.close()
+        if current is not None:
+            try:
+                os.fsync(current)
+            finally:
+                os.close(current)
+
+    def close(self):
+        """Sync and close the journal"""
+        self.sync()
+        with self.lock:
+            self._file.close()
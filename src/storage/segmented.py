@@ -0,0 +1,274 @@
+"""
+Module for using append-only segment files for inventory storage.
+
+Objects are appended to a segment file chosen by their expiration time,
+each segment covering `SegmentedInventory.bucketLength` seconds. Payloads
+are read through a memory map of the segment and expired objects are
+reclaimed by removing whole segments.
+"""
+import collections
+import mmap
+import os
+import time
+from struct import Struct
+from threading import RLock
+
+from paths import lookupAppdataFolder
+from storage import InventoryItem, InventoryStorage
+
+#: hash, payload length, expires, stream, object type, tag length
+recordHeader = Struct('>32sLqQLB')
+
+IndexEntry = collections.namedtuple(
+    'IndexEntry', 'segment offset length expires stream type tag')
+
+
+class Segment(object):
+    """
+    An append-only file of records, each being `recordHeader`,
+    the tag and the payload
+    """
+    suffix = '.dat'
+
+    def __init__(self, filename):
+        self.filename = filename
+        # unbuffered, so that a failed write leaves nothing to flush later
+        self._file = open(filename, 'a+b', 0)
+        self._file.seek(0, os.SEEK_END)
+        self.size = self._file.tell()
+        self._map = None
+
+    def _mapping(self, end):
+        """Return a mapping of the file which covers at least *end* bytes"""
+        if self._map is None or len(self._map) < end:
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def append(self, hashval, value):
+        """
+        Append an object, return the payload offset. If the record
+        can't be written the file is truncated back and IOError raised.
+        """
+        tag = str(value.tag)
+        header = recordHeader.pack(
+            hashval, len(value.payload), value.expires, value.stream,
+            value.type, len(tag))
+        record = bytearray(header)
+        record += tag
+        record += value.payload
+        try:
+            self._file.write(record)
+        except IOError:
+            # drop the part of the record which was written
+            try:
+                os.ftruncate(self._file.fileno(), self.size)
+            except OSError:
+                pass
+            raise
+        offset = self.size + recordHeader.size + len(tag)
+        self.size = offset + len(value.payload)
+        return offset
+
+    def read(self, offset, length):
+        """Return the payload as a buffer pointing into the mapping"""
+        return buffer(self._mapping(offset + length), offset, length)
+
+    def records(self):
+        """
+        Iterate over (hash, IndexEntry) of the records in the file,
+        dropping an incomplete record at the end if there is one
+        """
+        if not self.size:
+            return
+        data = self._mapping(self.size)
+        offset = 0
+        while offset + recordHeader.size <= self.size:
+            hashval, length, expires, stream, objectType, tagLength = \
+                recordHeader.unpack_from(data, offset)
+            start = offset + recordHeader.size + tagLength
+            if start + length > self.size:
+                break
+            yield hashval, IndexEntry(
+                self, start, length, expires, stream, objectType,
+                data[start - tagLength:start])
+            offset = start + length
+        if offset < self.size:
+            self._map = None
+            self._file.truncate(offset)
+            self.size = offset
+
+    def sync(self):
+        """Make sure the appended records are on the disk"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def remove(self):
+        """Close and remove the file"""
+        self._map = None
+        self._file.close()
+        os.remove(self.filename)
+
+
+class SegmentedInventory(InventoryStorage):
+    """Inventory stored in time-bucketed, append-only segment files"""
+    # pylint: disable=too-many-ancestors, abstract-method
+    topDir = "segments"
+    #: time span of the expiration times of objects in one segment
+    bucketLength = 6 * 60 * 60
+
+    def __init__(self):
+        super(SegmentedInventory, self).__init__()
+        self.baseDir = os.path.join(
+            lookupAppdataFolder(), SegmentedInventory.topDir)
+        if os.path.exists(self.baseDir):
+            if not os.path.isdir(self.baseDir):
+                raise IOError(
+                    "%s exists but it's not a directory" % self.baseDir)
+        else:
+            os.makedirs(self.baseDir)
+        # Guarantees that two receiveDataThreads
+        # don't receive and process the same message
+        # concurrently (probably sent by a malicious individual)
+        self.lock = RLock()
+        self._segments = {}
+        self._index = {}
+        #: the hashes by (object type, tag) and by object type
+        self._byTag = collections.defaultdict(set)
+        self._byType = collections.defaultdict(set)
+        #: the hashes by stream and by segment
+        self._byStream = collections.defaultdict(
+            lambda: collections.defaultdict(set))
+        self._removed = []
+        self._load()
+
+    def _load(self):
+        for filename in os.listdir(self.baseDir):
+            bucket, ext = os.path.splitext(filename)
+            if ext != Segment.suffix or not bucket.isdigit():
+                continue
+            segment = Segment(os.path.join(self.baseDir, filename))
+            self._segments[int(bucket)] = segment
+            for hashval, entry in segment.records():
+                self._add(hashval, entry)
+
+    def _add(self, hashval, entry):
+        """Index the entry of the object *hashval*"""
+        self._index[hashval] = entry
+        self._byTag[entry.type, entry.tag].add(hashval)
+        self._byType[entry.type].add(hashval)
+        self._byStream[entry.stream][
+            entry.expires // self.bucketLength].add(hashval)
+
+    def _discard(self, hashval):
+        """Remove the object *hashval* from the secondary indexes"""
+        entry = self._index[hashval]
+        for index, key in (
+                (self._byTag, (entry.type, entry.tag)),
+                (self._byType, entry.type)):
+            hashes = index[key]
+            hashes.discard(hashval)
+            if not hashes:
+                del index[key]
+
+    def _segment(self, expires):
+        bucket = expires // self.bucketLength
+        try:
+            return self._segments[bucket]
+        except KeyError:
+            segment = self._segments[bucket] = Segment(os.path.join(
+                self.baseDir, '%i%s' % (bucket, Segment.suffix)))
+            return segment
+
+    def __contains__(self, hashval):
+        return hashval in self._index
+
+    def __getitem__(self, hashval):
+        entry = self._index[hashval]
+        return InventoryItem(
+            entry.type, entry.stream,
+            entry.segment.read(entry.offset, entry.length),
+            entry.expires, entry.tag)
+
+    def __setitem__(self, hashval, value):
+        with self.lock:
+            if hashval in self._index:
+                return
+            value = InventoryItem(*value)
+            segment = self._segment(value.expires)
+            offset = segment.append(hashval, value)
+            self._add(hashval, IndexEntry(
+                segment, offset, len(value.payload), value.expires,
+                value.stream, value.type, str(value.tag)))
+
+    def __delitem__(self, hashval):
+        raise NotImplementedError
+
+    def __iter__(self):
+        with self.lock:
+            return iter(self._index.keys())
+
+    def __len__(self):
+        return len(self._index)
+
+    def by_type_and_tag(self, objectType, tag=None):
+        """
+        Get all inventory items of certain *objectType*
+        with *tag* if given.
+        """
+        with self.lock:
+            hashes = self._byType.get(objectType, ()) if tag is None \
+                else self._byTag.get((objectType, str(tag)), ())
+            entries = [self._index[hashval] for hashval in hashes]
+            return [
+                InventoryItem(
+                    entry.type, entry.stream,
+                    str(entry.segment.read(entry.offset, entry.length)),
+                    entry.expires, entry.tag)
+                for entry in entries
+            ]
+
+    def unexpired_hashes_by_stream(self, stream):
+        """Return unexpired inventory vectors filtered by stream"""
+        t = int(time.time())
+        current = t // self.bucketLength
+        result = []
+        with self.lock:
+            for bucket, hashes in self._byStream.get(stream, {}).iteritems():
+                if bucket > current:
+                    # all of them expire later
+                    result.extend(hashes)
+                elif bucket == current:
+                    result.extend(
+                        hashval for hashval in hashes
+                        if self._index[hashval].expires > t)
+        return result
+
+    def flush(self):
+        """Sync the segments to the disk"""
+        with self.lock:
+            for segment in self._segments.itervalues():
+                segment.sync()
+
+    def clean(self):
+        """Remove the segments in which all the objects have expired"""
+        minTime = int(time.time()) - (60 * 60 * 3)
+        with self.lock:
+            expired = [
+                bucket for bucket in self._segments
+                if (bucket + 1) * self.bucketLength <= minTime]
+            if not expired:
+                return
+            for bucket in expired:
+                self._removed.append(self._segments.pop(bucket))
+                for buckets in self._byStream.itervalues():
+                    for hashval in buckets.pop(bucket, ()):
+                        self._discard(hashval)
+                        del self._index[hashval]
+            removed, self._removed = self._removed, []
+            for segment in removed:
+                try:
+                    segment.remove()
+                except OSError:
+                    # still mapped somewhere, retry on the next cleaning
+                    self._removed.append(segment)
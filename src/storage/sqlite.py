@@ -2,50 +2,214 @@
 Sqlite Inventory
 """
 import sqlite3
+import threading
 import time
-from threading import RLock
 
-from helper_sql import SqlBulkExecute, sqlExecute, sqlQuery
+import state
+from debug import logger
+from hashindex import HashMap
+from helper_sql import sqlExecute, sqlQuery
 from storage import InventoryItem, InventoryStorage
 
 
 class SqliteInventory(InventoryStorage):  # pylint: disable=too-many-ancestors
-    """Inventory using SQLite"""
+    """
+    Inventory using SQLite. The objects are kept in their own database
+    file with its own connection, so that storing and cleaning them
+    doesn't contend with the mailbox queries in the sqlThread.
+
+    The objects are partitioned into tables by `bucketLength` of their
+    expiration time, so that the expired ones are removed by dropping
+    whole tables. The table of each object is found in a compact
+    in-memory map of the hashes. The queries of several tables are
+    made in one compound SELECT.
+
+    The new objects are written behind by the `.threads.inventoryWriter`
+    with its own connection when there are `flushCount` of them, they take
+    `flushSize` bytes or the oldest is `flushAge` seconds old. They are
+    read from memory until they are committed.
+    """
+    dbFilename = 'inventory.dat'
+    #: the time span of the expiration times of the objects in one table
+    bucketLength = 6 * 60 * 60
+    #: the number of tables queried in one compound SELECT
+    compoundSize = 100
+    #: write the new objects when there are that many of them ...
+    flushCount = 1000
+    #: ... or they take that many bytes ...
+    flushSize = 4 * 1024 * 1024
+    #: ... or the oldest of them is that many seconds old
+    flushAge = 30
+    #: the number of objects inserted with one executemany
+    batchSize = 100
+
     def __init__(self):
         super(SqliteInventory, self).__init__()
         # of objects (like msg payloads and pubkey payloads)
         # Does not include protocol headers (the first 24 bytes of each packet).
         self._inventory = {}
-        # cache for existing objects, used for quick lookups if we have an object.
-        # This is used for example whenever we receive an inv message from a peer
-        # to check to see what items are new to us.
-        # We don't delete things out of it; instead,
-        # the singleCleaner thread clears and refills it.
-        self._objects = {}
+        self._pendingSize = 0
+        self._pendingSince = 0
+        # the write behind is retried at this time after a failure
+        self._retryAt = 0
+        # the objects being written, until they are committed
+        self._flushing = {}
         # Guarantees that two receiveDataThreads don't receive
         # and process the same message concurrently
-        # (probably sent by a malicious individual)
-        self.lock = RLock()
+        # (probably sent by a malicious individual).
+        # Also serializes the use of the connection.
+        self.lock = threading.RLock()
+        # serializes the writes, done with their own connection
+        self.writeLock = threading.Lock()
+        self._flushEvent = threading.Event()
+        self._connect()
+        self._buckets = set(
+            int(name[len('inventory_'):]) for name, in self._query(
+                "SELECT name FROM sqlite_master WHERE type='table'"
+                " AND name GLOB 'inventory_[0-9]*'"))
+        self._moveFromMessagesDat()
+        self._moveFromTable()
+        # the bucket of all the objects we have, in memory and in the
+        # database, used for quick lookups if we have an object.
+        # This is used for example whenever we receive an inv message from a peer
+        # to check to see what items are new to us.
+        # It's loaded once and then updated on insert and on expiration.
+        self._objects = HashMap(
+            (str(x), bucket) for bucket in self._buckets
+            for x, in self._query('SELECT hash FROM %s' % self._table(bucket)))
+
+    def _open(self):
+        """Open a connection to the database, return it and its cursor"""
+        conn = sqlite3.connect(
+            state.appdata + self.dbFilename, check_same_thread=False)
+        conn.text_factory = str
+        cur = conn.cursor()
+        # the objects are public and transient: no need to overwrite
+        # the deleted ones and losing the last transactions is harmless
+        cur.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cur.execute('PRAGMA journal_mode = WAL')
+        cur.execute('PRAGMA synchronous = NORMAL')
+        cur.execute('PRAGMA secure_delete = false')
+        return conn, cur
+
+    def _connect(self):
+        """Open the database for the reads and for the writes"""
+        self.conn, self.cur = self._open()
+        self._writeConn, self._writeCur = self._open()
+        # checkpointed by flush() without holding the lock
+        self._writeCur.execute('PRAGMA wal_autocheckpoint = 0')
+
+    @staticmethod
+    def _table(bucket):
+        return 'inventory_%i' % bucket
+
+    def _bucket(self, expires):
+        """Return the bucket of the objects expiring at *expires*"""
+        bucket = expires // self.bucketLength
+        if bucket not in self._buckets:
+            table = self._table(bucket)
+            self._writeCur.execute(
+                '''CREATE TABLE IF NOT EXISTS %s (hash blob, objecttype int,'''
+                ''' streamnumber int, payload blob, expirestime integer,'''
+                ''' tag blob, UNIQUE(hash) ON CONFLICT REPLACE)''' % table)
+            self._writeCur.execute(
+                '''CREATE INDEX IF NOT EXISTS %s_stream_expires'''
+                ''' ON %s (streamnumber, expirestime, hash)''' % (table, table))
+            self._writeCur.execute(
+                '''CREATE INDEX IF NOT EXISTS %s_type_tag'''
+                ''' ON %s (objecttype, tag)''' % (table, table))
+            with self.lock:
+                self._buckets.add(bucket)
+        return bucket
+
+    def _moveFrom(self, table, minTime=0):
+        """
+        Move the objects expiring at *minTime* or later
+        from the unpartitioned *table* into the buckets,
+        reading it once with the other connection
+        """
+        buckets = {}
+        for row in self.conn.execute(
+                'SELECT hash, objecttype, streamnumber, payload, expirestime,'
+                ' tag FROM %s WHERE expirestime>=?' % table, (minTime,)):
+            bucket = self._bucket(row[4])
+            rows = buckets.setdefault(bucket, [])
+            rows.append(row)
+            if len(rows) >= self.batchSize:
+                self._insert(bucket, rows)
+                del rows[:]
+        for bucket, rows in buckets.iteritems():
+            self._insert(bucket, rows)
+        self._writeConn.commit()
+
+    def _insert(self, bucket, rows):
+        """Insert the *rows* into the table of the *bucket*"""
+        for i in range(0, len(rows), self.batchSize):
+            self._writeCur.executemany(
+                'INSERT INTO %s VALUES (?, ?, ?, ?, ?, ?)'
+                % self._table(bucket), rows[i:i + self.batchSize])
+
+    def _moveFromMessagesDat(self):
+        """Move the objects stored by the older versions in messages.dat"""
+        if not sqlQuery(
+                "SELECT name FROM sqlite_master"
+                " WHERE type='table' AND name='inventory'"):
+            return
+        logger.info('Moving the inventory from messages.dat to %s', self.dbFilename)
+        self.cur.execute(
+            'ATTACH DATABASE ? AS messages', (state.appdata + 'messages.dat',))
+        self._moveFrom('messages.inventory', int(time.time()) - (60 * 60 * 3))
+        self.cur.execute('DETACH DATABASE messages')
+        sqlExecute('DROP TABLE inventory')
+
+    def _moveFromTable(self):
+        """Partition the inventory table of the older versions"""
+        if not self._query(
+                "SELECT name FROM sqlite_master"
+                " WHERE type='table' AND name='inventory'"):
+            return
+        logger.info('Partitioning the inventory by the expiration time')
+        self._moveFrom('inventory')
+        self._writeCur.execute('DROP TABLE inventory')
+        self._writeConn.commit()
+
+    def _query(self, sqlStatement, *args):
+        with self.lock:
+            self.cur.execute(sqlStatement, args)
+            return self.cur.fetchall()
+
+    def _queryBuckets(self, sqlStatement, buckets, *args):
+        """
+        Query the tables of the *buckets* with the *sqlStatement*
+        formatted with the table name, return all the rows
+        """
+        buckets = sorted(buckets)
+        rows = []
+        for i in range(0, len(buckets), self.compoundSize):
+            chunk = buckets[i:i + self.compoundSize]
+            rows += self._query(' UNION ALL '.join(
+                sqlStatement % self._table(bucket) for bucket in chunk),
+                *(args * len(chunk)))
+        return rows
 
     def __contains__(self, hash_):
         with self.lock:
-            if hash_ in self._objects:
-                return True
-            rows = sqlQuery(
-                'SELECT streamnumber FROM inventory WHERE hash=?',
-                sqlite3.Binary(hash_))
-            if not rows:
-                return False
-            self._objects[hash_] = rows[0][0]
-            return True
+            return hash_ in self._objects
 
     def __getitem__(self, hash_):
         with self.lock:
             if hash_ in self._inventory:
                 return self._inventory[hash_]
-            rows = sqlQuery(
+            if hash_ in self._flushing:
+                return self._flushing[hash_]
+            try:
+                bucket = self._objects[hash_]
+            except KeyError:
+                raise KeyError(hash_)
+            rows = self._query(
                 'SELECT objecttype, streamnumber, payload, expirestime, tag'
-                ' FROM inventory WHERE hash=?', sqlite3.Binary(hash_))
+                ' FROM %s WHERE hash=?' % self._table(bucket),
+                sqlite3.Binary(hash_))
             if not rows:
                 raise KeyError(hash_)
             return InventoryItem(*rows[0])
@@ -53,22 +217,29 @@ class SqliteInventory(InventoryStorage):  # pylint: disable=too-many-ancestors
     def __setitem__(self, hash_, value):
         with self.lock:
             value = InventoryItem(*value)
+            if not self._inventory:
+                self._pendingSince = time.time()
+                # the writer starts waiting for the flushAge
+                self._flushEvent.set()
             self._inventory[hash_] = value
-            self._objects[hash_] = value.stream
+            self._pendingSize += len(value.payload)
+            self._objects[hash_] = value.expires // self.bucketLength
+            if (
+                len(self._inventory) >= self.flushCount
+                or self._pendingSize >= self.flushSize
+            ):
+                self._flushEvent.set()
 
     def __delitem__(self, hash_):
         raise NotImplementedError
 
     def __iter__(self):
         with self.lock:
-            hashes = self._inventory.keys()[:]
-            hashes += (x for x, in sqlQuery('SELECT hash FROM inventory'))
-            return hashes.__iter__()
+            return iter(self._objects)
 
     def __len__(self):
         with self.lock:
-            return len(self._inventory) + sqlQuery(
-                'SELECT count(*) FROM inventory')[0][0]
+            return len(self._objects)
 
     def by_type_and_tag(self, objectType, tag=None):
         """
@@ -77,47 +248,118 @@ class SqliteInventory(InventoryStorage):  # pylint: disable=too-many-ancestors
         """
         query = [
             'SELECT objecttype, streamnumber, payload, expirestime, tag'
-            ' FROM inventory WHERE objecttype=?', objectType]
+            ' FROM %s WHERE objecttype=?', objectType]
         if tag:
             query[0] += ' AND tag=?'
             query.append(sqlite3.Binary(tag))
         with self.lock:
             values = [
-                value for value in self._inventory.values()
+                value for value in
+                self._inventory.values() + self._flushing.values()
                 if value.type == objectType
                 and tag is None or value.tag == tag
-            ] + [InventoryItem(*value) for value in sqlQuery(*query)]
+            ]
+            values += (InventoryItem(*value) for value in self._queryBuckets(
+                query[0], self._buckets, *query[1:]))
             return values
 
     def unexpired_hashes_by_stream(self, stream):
         """Return unexpired inventory vectors filtered by stream"""
         with self.lock:
             t = int(time.time())
-            hashes = [x for x, value in self._inventory.items()
+            hashes = [x for x, value in
+                      self._inventory.items() + self._flushing.items()
                       if value.stream == stream and value.expires > t]
-            hashes += (str(payload) for payload, in sqlQuery(
-                'SELECT hash FROM inventory WHERE streamnumber=?'
-                ' AND expirestime>?', stream, t))
+            hashes += (str(payload) for payload, in self._queryBuckets(
+                'SELECT hash FROM %s WHERE streamnumber=? AND expirestime>?',
+                [bucket for bucket in self._buckets
+                 if (bucket + 1) * self.bucketLength > t], stream, t))
             return hashes
 
+    def _flushTimeout(self):
+        """How long to wait before writing the new objects"""
+        with self.lock:
+            if not self._inventory:
+                return None
+            due = self._pendingSince + self.flushAge
+            if (
+                len(self._inventory) >= self.flushCount
+                or self._pendingSize >= self.flushSize
+            ):
+                due = 0
+            return max(max(due, self._retryAt) - time.time(), 0)
+
+    def writeBehind(self, stop):
+        """
+        Write the new objects when it's time until *stop* is set,
+        checking it every second
+        """
+        while not stop.is_set():
+            timeout = self._flushTimeout()
+            self._flushEvent.wait(1 if timeout is None else min(timeout, 1))
+            self._flushEvent.clear()
+            if not stop.is_set() and self._flushTimeout() == 0:
+                self.flush()
+
     def flush(self):
-        """Flush cache"""
+        """
+        Write the new objects in batches of `batchSize` without holding
+        the lock, commit them and drop them from memory with it.
+        If that fails, they are kept in memory and written behind
+        again in `flushAge` seconds at the earliest.
+        """
+        with self.writeLock:
+            with self.lock:
+                self._flushing, self._inventory = self._inventory, {}
+                self._pendingSize = 0
+                # the writer stops waiting for the flushAge
+                self._flushEvent.set()
+            try:
+                buckets = {}
+                for objectHash, value in self._flushing.iteritems():
+                    buckets.setdefault(
+                        self._bucket(value.expires), []).append(
+                            (sqlite3.Binary(objectHash),) + value)
+                for bucket, rows in buckets.iteritems():
+                    self._insert(bucket, rows)
+                with self.lock:
+                    self._writeConn.commit()
+                    self._flushing = {}
+            except Exception:  # pylint: disable=broad-except
+                logger.error(
+                    'Failed to write %i inventory objects, keeping them'
+                    ' in memory', len(self._flushing), exc_info=True)
+                self._restore()
+                return
+            self._writeCur.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def _restore(self):
+        """Put back the objects which failed to be written"""
+        try:
+            self._writeConn.rollback()
+        except sqlite3.Error:
+            pass
         with self.lock:
-            # If you use both the inventoryLock and the sqlLock,
-            # always use the inventoryLock OUTSIDE of the sqlLock.
-            with SqlBulkExecute() as sql:
-                for objectHash, value in self._inventory.items():
-                    sql.execute(
-                        'INSERT INTO inventory VALUES (?, ?, ?, ?, ?, ?)',
-                        sqlite3.Binary(objectHash), *value)
-                self._inventory.clear()
+            self._retryAt = time.time() + self.flushAge
+            if not self._inventory:
+                self._pendingSince = time.time()
+            for objectHash, value in self._flushing.iteritems():
+                # unless it's been stored again meanwhile
+                if objectHash not in self._inventory:
+                    self._inventory[objectHash] = value
+                    self._pendingSize += len(value.payload)
+            self._flushing = {}
 
     def clean(self):
-        """Free memory / perform garbage collection"""
-        with self.lock:
-            sqlExecute(
-                'DELETE FROM inventory WHERE expirestime<?',
-                int(time.time()) - (60 * 60 * 3))
-            self._objects.clear()
-            for objectHash, value in self._inventory.items():
-                self._objects[objectHash] = value.stream
+        """Drop the tables in which all the objects have expired"""
+        with self.writeLock, self.lock:
+            minTime = int(time.time()) - (60 * 60 * 3)
+            for bucket in sorted(self._buckets):
+                if (bucket + 1) * self.bucketLength > minTime:
+                    break
+                table = self._table(bucket)
+                for objectHash, in self._query('SELECT hash FROM %s' % table):
+                    self._objects.discard(str(objectHash))
+                self._writeCur.execute('DROP TABLE %s' % table)
+                self._buckets.discard(bucket)
+            self._writeConn.commit()
@@ -49,6 +49,14 @@ class InventoryStorage(Storage, collections.MutableMapping):
         """Flush cache"""
         raise NotImplementedError
 
+    def writeBehind(self, stop):
+        """
+        Write the new objects in the background until the *stop* event
+        is set, in the `.threads.inventoryWriter`. The storages which
+        write them on `flush` only just wait.
+        """
+        stop.wait()
+
     def clean(self):
         """Free memory / perform garbage collection"""
         raise NotImplementedError
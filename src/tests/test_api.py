@@ -95,6 +95,60 @@ class TestAPI(TestAPIProto):
         else:
             self.assertGreater(status["networkConnections"], 0)
 
+    def test_sql_stats(self):
+        """Check the timings returned by getSqlStats and the reset"""
+        self.api.listAddressBookEntries()
+        stats = json.loads(self.api.getSqlStats(True))
+        self.assertIn(
+            'SELECT label, address from addressbook',
+            [entry['statement'] for entry in stats['statements']])
+        for entry in stats['statements']:
+            self.assertEqual(sum(entry['histogram'].values()), entry['count'])
+        self.assertGreater(json.loads(self.api.getSqlStats())['since'],
+                           stats['since'])
+
+    def test_message_pages(self):
+        """Check the paged message commands"""
+        sent = json.loads(self.api.getAllSentMessages())['sentMessages']
+        headers = []
+        cursor = ''
+        while True:
+            page = json.loads(self.api.getSentMessageHeaders(cursor, 1))
+            headers.extend(page['sentMessages'])
+            cursor = page['nextCursor']
+            if not cursor:
+                break
+        self.assertEqual(
+            [msg['msgid'] for msg in headers],
+            [msg['msgid'] for msg in sent])
+        for msg in headers:
+            self.assertNotIn('message', msg)
+        self.assertEqual(
+            self.api.getInboxMessages('', 0),
+            'API Error 0028: Limit should be between 1 and 1000')
+        self.assertEqual(
+            self.api.getInboxMessages('0', 1),
+            "API Error 0028: Invalid cursor: '0'")
+
+    def test_search_messages(self):
+        """Check the searchMessages results"""
+        sent = json.loads(self.api.getAllSentMessages())['sentMessages']
+        for msg in sent:
+            found = json.loads(self.api.searchMessages(
+                base64.b64decode(msg['subject']), 'sent', 'subject'))
+            self.assertIn(
+                msg['ackData'],
+                [result['ackData'] for result in found['sentMessages']])
+        self.assertEqual(
+            json.loads(self.api.searchMessages(
+                'no such message', 'inbox'))['inboxMessages'], [])
+
+    def test_unread_counts(self):
+        """Check the getUnreadCounts result"""
+        for entry in json.loads(self.api.getUnreadCounts())['unreadCounts']:
+            self.assertGreater(entry['count'], 0)
+            self.assertIn('toAddress', entry)
+
     def test_list_addresses(self):
         """Checking the return of API command 'listAddresses'"""
         self.assertEqual(
@@ -0,0 +1,202 @@
+"""
+Tests for the buffers of the AdvancedDispatcher
+"""
+
+import socket
+import unittest
+
+
+class TestReceiveBuffer(unittest.TestCase):
+    """Test case for the stream read buffer"""
+
+    def test_cursor(self):
+        """The processed data is skipped and the views stay valid"""
+        from pybitmessage.network.advanceddispatcher import ReceiveBuffer
+
+        buf = ReceiveBuffer(16)
+        buf.extend('header')
+        buf.extend('payload1')
+        self.assertEqual(len(buf), 14)
+        self.assertEqual(buf[:6], 'header')
+        buf.consume(6)
+        view = buf.view(8)
+        self.assertEqual(buf[-1:], '1')
+        buf.consume(8)
+        self.assertEqual(len(buf), 0)
+        # no room in the chunk: a new one for the expected message
+        buf.extend('next')
+        buf.reserve(10, 100)
+        self.assertEqual(buf[:], 'next')
+        self.assertEqual(str(view), 'payload1')
+        buf.consume(2)
+        buf.clear()
+        self.assertEqual(len(buf), 0)
+        self.assertEqual(str(view), 'payload1')
+
+    def test_recv_into(self):
+        """The data is received into the reserved part of the chunk"""
+        from pybitmessage.network.advanceddispatcher import ReceiveBuffer
+
+        buf = ReceiveBuffer(8)
+        sender, receiver = socket.socketpair()
+        try:
+            sender.sendall('0123456789' * 3)
+            while len(buf) < 30:
+                view = buf.reserve(8, 30)
+                buf.advance(receiver.recv_into(view, len(view)))
+            self.assertEqual(str(buf.view(30)), '0123456789' * 3)
+        finally:
+            sender.close()
+            receiver.close()
+
+
+class TestSendBuffer(unittest.TestCase):
+    """Test case for the stream write buffer"""
+
+    def test_partial_sends(self):
+        """The data is sent in order from any offset"""
+        from pybitmessage.network.advanceddispatcher import SendBuffer
+
+        buf = SendBuffer()
+        buf.joinSize = 10
+        payload = buffer('p' * 30)
+        for data in ('inv1', 'inv2', 'header', payload, 'inv3'):
+            buf.append(data)
+        self.assertEqual(len(buf), 48)
+        # the small ones are joined up to the large one
+        self.assertEqual(str(buf.peek(100)), 'inv1inv2header')
+        buf.consume(6)
+        self.assertEqual(str(buf.peek(5)), 'v2hea')
+        buf.consume(8)
+        # the large one is not copied
+        self.assertIsInstance(buf.peek(100), buffer)
+        self.assertEqual(str(buf.peek(100)), 'p' * 30)
+        buf.consume(25)
+        self.assertEqual(str(buf.peek(100)), 'pppppinv3')
+        buf.consume(9)
+        self.assertEqual(len(buf), 0)
+        self.assertFalse(buf)
+        self.assertEqual(str(buf.peek(100)), '')
+
+
+class TestEventPoller(unittest.TestCase):
+    """Test case for the poller keeping the dispatchers registered"""
+
+    def setUp(self):
+        # the module used by the dispatchers
+        from pybitmessage.network.advanceddispatcher import asyncore
+
+        self.asyncore = asyncore
+        asyncore.event_poller = True
+
+    def tearDown(self):
+        self.asyncore.event_poller = False
+
+    def test_interest(self):
+        """The writes queued and the data received are handled"""
+        from pybitmessage.network.advanceddispatcher import AdvancedDispatcher
+
+        socketMap = {}
+        local, remote = socket.socketpair()
+        local.setblocking(0)
+        dispatcher = AdvancedDispatcher()
+        dispatcher.set_socket(local, socketMap)
+        dispatcher.connected = True
+        try:
+            self.asyncore.epoll_event_poller(0, socketMap)
+            dispatcher.append_write_buf('ping')
+            self.asyncore.epoll_event_poller(0, socketMap)
+            self.assertEqual(remote.recv(10), 'ping')
+            self.assertEqual(len(dispatcher.write_buf), 0)
+            remote.sendall('pong')
+            self.asyncore.epoll_event_poller(1, socketMap)
+            self.assertEqual(dispatcher.read_buf[:], 'pong')
+        finally:
+            dispatcher.del_channel(socketMap)
+            local.close()
+            remote.close()
+
+
+class TestShards(unittest.TestCase):
+    """Test case for the connections split between the socket maps"""
+
+    def setUp(self):
+        from pybitmessage.network.advanceddispatcher import asyncore
+
+        self.asyncore = asyncore
+        self.shard = asyncore.add_shard()
+
+    def tearDown(self):
+        self.asyncore.shard_maps.remove(self.shard)
+
+    def test_assignment(self):
+        """The sharded dispatchers are placed into the least loaded map"""
+        from pybitmessage.network.advanceddispatcher import AdvancedDispatcher
+
+        class Sharded(AdvancedDispatcher):
+            """A dispatcher of the connection"""
+            sharded = True
+
+        self.asyncore.event_poller = True
+        local, remote = socket.socketpair()
+        dispatchers = []
+        try:
+            # the main map may have the listening sockets
+            for _ in range(len(self.asyncore.socket_map) + 2):
+                dispatcher = Sharded()
+                dispatcher.create_socket()
+                dispatchers.append(dispatcher)
+            self.assertIs(dispatchers[-1]._map, self.shard)
+            self.assertLessEqual(
+                abs(len(self.shard) - len(self.asyncore.socket_map)), 1)
+            self.assertIs(AdvancedDispatcher()._map, self.asyncore.socket_map)
+
+            # each map has its own poller state
+            dispatcher = dispatchers[-1]
+            dispatcher.del_channel()
+            dispatcher.set_socket(local)
+            dispatcher.connected = True
+            dispatcher.append_write_buf('ping')
+            self.assertIn(dispatcher, self.shard.interest_changed)
+            self.asyncore.epoll_event_poller(0, self.shard)
+            self.assertEqual(remote.recv(10), 'ping')
+            self.assertIn('epoll_event', self.shard.pollsters)
+        finally:
+            self.asyncore.event_poller = False
+            for dispatcher in dispatchers:
+                dispatcher.close()
+            remote.close()
+
+
+class TestInlineProcessing(unittest.TestCase):
+    """Test case for the processing of the data in the network thread"""
+
+    def test_schedule(self):
+        """The data is processed right away or queued for the threads"""
+        from pybitmessage.network.advanceddispatcher import (
+            AdvancedDispatcher, receiveDataQueue)
+
+        class Parser(AdvancedDispatcher):
+            """Collects the received lines"""
+            def state_init(self):
+                if '\n' not in self.read_buf[:]:
+                    return False
+                line = str(self.read_buf[:]).split('\n', 1)[0]
+                self.lines.append(line)
+                self.set_state('init', len(line) + 1)
+                return True
+
+        dispatcher = Parser()
+        dispatcher.lines = []
+        dispatcher.connected = True
+        dispatcher.read_buf.extend('ping\npong\npi')
+        dispatcher.schedule_process('dest')
+        self.assertEqual(receiveDataQueue.get_nowait(), 'dest')
+        receiveDataQueue.task_done()
+        self.assertEqual(dispatcher.lines, [])
+
+        dispatcher.inlineProcessing = True
+        dispatcher.schedule_process('dest')
+        self.assertTrue(receiveDataQueue.empty())
+        self.assertEqual(dispatcher.lines, ['ping', 'pong'])
+        self.assertEqual(dispatcher.read_buf[:], 'pi')
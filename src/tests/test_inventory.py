@@ -0,0 +1,447 @@
+"""
+Tests for the inventory storage
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def setUpModule():
+    """The storage modules import the others as top level modules"""
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+
+
+class TestHashIndex(unittest.TestCase):
+    """Test case for the in-memory index of inventory vectors"""
+
+    def test_membership(self):
+        """Keys are found before and after the pending changes are merged"""
+        from pybitmessage.storage.hashindex import HashIndex
+
+        keys = [os.urandom(32) for _ in range(1000)]
+        index = HashIndex(keys[:500])
+        index.minMerge = 100
+        self.assertEqual(len(index), 500)
+        for key in keys[500:]:
+            self.assertNotIn(key, index)
+            index.add(key)
+        self.assertEqual(len(index), 1000)
+        for key in keys[::2]:
+            index.discard(key)
+        self.assertEqual(len(index), 500)
+        for i, key in enumerate(keys):
+            self.assertEqual(key in index, i % 2 == 1)
+        self.assertEqual(sorted(index), sorted(keys[1::2]))
+
+    def test_map(self):
+        """The values of the keys are kept across the merges"""
+        from pybitmessage.storage.hashindex import HashMap
+
+        keys = [os.urandom(32) for _ in range(1000)]
+        index = HashMap((key, i) for i, key in enumerate(keys[:500]))
+        index.minMerge = 100
+        for i, key in enumerate(keys[500:]):
+            index[key] = 500 + i
+        for key in keys[::2]:
+            index.discard(key)
+        index[keys[0]] = 7
+        index[keys[1]] = 8
+        self.assertEqual(len(index), 501)
+        self.assertEqual(index[keys[0]], 7)
+        self.assertEqual(index[keys[1]], 8)
+        for i, key in enumerate(keys[2:], 2):
+            if i % 2:
+                self.assertEqual(index[key], i)
+            else:
+                self.assertRaises(KeyError, index.__getitem__, key)
+
+    def test_width(self):
+        """Keys of the wrong length are rejected"""
+        from pybitmessage.storage.hashindex import HashIndex
+
+        index = HashIndex()
+        with self.assertRaises(ValueError):
+            index.add('short')
+        self.assertNotIn('short', index)
+
+
+class TestPayloadCache(unittest.TestCase):
+    """Test case for the cache of the inventory items"""
+
+    def test_lru(self):
+        """The least recently used items are dropped past the size limit"""
+        from pybitmessage.storage.cache import PayloadCache
+        from pybitmessage.storage.storage import InventoryItem
+
+        cache = PayloadCache(1000)
+        for i in range(5):
+            cache.put(str(i), InventoryItem(1, 1, 'x' * 300, i, ''))
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.size, 900)
+        self.assertEqual(cache.get('2').expires, 2)
+        cache.put('5', InventoryItem(1, 1, 'x' * 300, 5, ''))
+        self.assertIsNone(cache.get('3'))
+        self.assertIn('2', cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # larger than the whole cache
+        cache.put('6', InventoryItem(1, 1, 'x' * 1001, 6, ''))
+        self.assertNotIn('6', cache)
+        cache.clean(5)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 300)
+
+    def test_header(self):
+        """The packet header is kept only while the item is cached"""
+        from pybitmessage.storage.cache import PayloadCache
+        from pybitmessage.storage.storage import InventoryItem
+
+        cache = PayloadCache(1000)
+        cache.setHeader('a', 'header a')
+        self.assertIsNone(cache.header('a'))
+        cache.put('a', InventoryItem(1, 1, 'x' * 600, 0, ''))
+        cache.setHeader('a', 'header a')
+        self.assertEqual(cache.header('a'), 'header a')
+        cache.put('b', InventoryItem(1, 1, 'x' * 600, 0, ''))
+        self.assertIsNone(cache.header('a'))
+
+
+class TestSegmentedInventory(unittest.TestCase):
+    """Test case for the segment files inventory backend"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self._home = os.environ.get('BITMESSAGE_HOME')
+        os.environ['BITMESSAGE_HOME'] = self.home
+
+    def tearDown(self):
+        if self._home is None:
+            del os.environ['BITMESSAGE_HOME']
+        else:
+            os.environ['BITMESSAGE_HOME'] = self._home
+        shutil.rmtree(self.home, ignore_errors=True)
+
+    def test_store_and_reload(self):
+        """Objects can be read back, also after reopening the inventory"""
+        from storage.segmented import SegmentedInventory
+
+        now = int(time.time())
+        objects = {
+            os.urandom(32): (i % 4, 1, os.urandom(100 + i), now + i * 3600,
+                             'tag%i' % (i % 2))
+            for i in range(50)}
+        inventory = SegmentedInventory()
+        for hashval, value in objects.iteritems():
+            inventory[hashval] = value
+        inventory.flush()
+        self.assertEqual(len(inventory), 50)
+        self.assertEqual(len(inventory.by_type_and_tag(1, 'tag1')), 13)
+
+        inventory = SegmentedInventory()
+        self.assertEqual(sorted(inventory), sorted(objects))
+        for hashval, value in objects.iteritems():
+            item = inventory[hashval]
+            self.assertEqual(str(item.payload), value[2])
+            self.assertEqual(tuple(item[:2]) + tuple(item[3:]),
+                             value[:2] + value[3:])
+        self.assertEqual(len(inventory.unexpired_hashes_by_stream(1)), 49)
+
+    def test_torn_record(self):
+        """An incomplete record at the end of a segment is dropped"""
+        from storage.segmented import SegmentedInventory
+
+        expires = int(time.time()) + 3600
+        inventory = SegmentedInventory()
+        inventory['a' * 32] = (1, 1, 'x' * 100, expires, '')
+        inventory['b' * 32] = (1, 1, 'y' * 100, expires, '')
+        inventory.flush()
+        segment = inventory._index['b' * 32].segment
+        with open(segment.filename, 'r+b') as f:
+            f.truncate(segment.size - 10)
+
+        inventory = SegmentedInventory()
+        self.assertIn('a' * 32, inventory)
+        self.assertNotIn('b' * 32, inventory)
+        inventory['c' * 32] = (1, 1, 'z' * 100, expires, '')
+        self.assertEqual(str(inventory['c' * 32].payload), 'z' * 100)
+
+    def test_clean(self):
+        """Expired segments are removed as a whole"""
+        from storage.segmented import SegmentedInventory
+
+        now = int(time.time())
+        inventory = SegmentedInventory()
+        inventory['a' * 32] = (1, 1, 'old', now - 86400, '')
+        inventory['b' * 32] = (
+            1, 1, buffer('new'), now + 86400, buffer('tag'))
+        self.assertEqual(len(os.listdir(inventory.baseDir)), 2)
+        inventory.clean()
+        self.assertNotIn('a' * 32, inventory)
+        self.assertIn('b' * 32, inventory)
+        self.assertEqual(inventory['b' * 32].tag, 'tag')
+        self.assertEqual(len(os.listdir(inventory.baseDir)), 1)
+        self.assertEqual(len(inventory.by_type_and_tag(1)), 1)
+        self.assertEqual(inventory.by_type_and_tag(1, ''), [])
+        self.assertEqual(
+            inventory.unexpired_hashes_by_stream(1), ['b' * 32])
+
+    def test_failed_write(self):
+        """A record which can't be written is not kept in part"""
+        from storage.segmented import SegmentedInventory
+
+        class FailingFile(object):
+            """Writes a part of the data, then fails"""
+            def __init__(self, f):
+                self.f = f
+
+            def write(self, data):
+                self.f.write(data[:10])
+                raise IOError(28, 'No space left on device')
+
+            def __getattr__(self, name):
+                return getattr(self.f, name)
+
+        expires = int(time.time()) + 3600
+        inventory = SegmentedInventory()
+        inventory['a' * 32] = (1, 1, 'x' * 100, expires, '')
+        segment = inventory._index['a' * 32].segment
+        size = segment.size
+        segment._file = FailingFile(segment._file)
+        with self.assertRaises(IOError):
+            inventory['b' * 32] = (1, 1, 'y' * 100, expires, '')
+        self.assertNotIn('b' * 32, inventory)
+        self.assertEqual(segment.size, size)
+        self.assertEqual(os.path.getsize(segment.filename), size)
+        segment._file = segment._file.f
+        inventory['c' * 32] = (1, 1, 'z' * 100, expires, '')
+
+        inventory = SegmentedInventory()
+        self.assertEqual(sorted(inventory), ['a' * 32, 'c' * 32])
+        self.assertEqual(str(inventory['c' * 32].payload), 'z' * 100)
+
+
+class TestSqliteInventory(unittest.TestCase):
+    """Test case for the SQLite inventory backend"""
+
+    @classmethod
+    def setUpClass(cls):
+        setUpModule()
+        import helper_startup
+        import state
+        from class_sqlThread import sqlThread
+
+        cls.home = tempfile.mkdtemp()
+        state.appdata = cls.home + os.sep
+        helper_startup.loadConfig()
+        cls.thread = sqlThread()
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        import state
+        from helper_sql import sqlStoredProcedure
+
+        sqlStoredProcedure('exit')
+        cls.thread.join(10)
+        state.sqlReady = False
+        shutil.rmtree(cls.home, ignore_errors=True)
+
+    def tearDown(self):
+        import state
+        from storage.sqlite import SqliteInventory
+
+        os.remove(state.appdata + SqliteInventory.dbFilename)
+
+    def _query_plan(self, inventory, query, *args):
+        return ' '.join(
+            row[-1] for row in inventory._query(
+                'EXPLAIN QUERY PLAN ' + query, *args))
+
+    def test_store(self):
+        """Objects are found before and after flushing and expire"""
+        from storage.sqlite import SqliteInventory
+
+        now = int(time.time())
+        inventory = SqliteInventory()
+        inventory['a' * 32] = (1, 1, 'old', now - 86400, '')
+        inventory['b' * 32] = (1, 1, buffer('new'), now + 86400, 'tag')
+        self.assertEqual(len(inventory), 2)
+        self.assertIn('a' * 32, inventory)
+        inventory.flush()
+        self.assertEqual(str(inventory['b' * 32].payload), 'new')
+        self.assertEqual(
+            inventory.unexpired_hashes_by_stream(1), ['b' * 32])
+        inventory.clean()
+        self.assertNotIn('a' * 32, inventory)
+        self.assertIn('b' * 32, inventory)
+
+        inventory = SqliteInventory()
+        self.assertEqual(list(inventory), ['b' * 32])
+
+    def test_indexes(self):
+        """The inventory lookups don't scan the whole table"""
+        from storage.sqlite import SqliteInventory
+
+        inventory = SqliteInventory()
+        inventory['a' * 32] = (
+            1, 1, 'payload', 2 * inventory.bucketLength, '')
+        inventory.flush()
+        plan = self._query_plan(
+            inventory, 'SELECT hash FROM inventory_2 WHERE streamnumber=?'
+            ' AND expirestime>?', 1, int(time.time()))
+        self.assertIn('COVERING INDEX inventory_2_stream_expires', plan)
+        plan = self._query_plan(
+            inventory, 'SELECT objecttype, streamnumber, payload,'
+            ' expirestime, tag FROM inventory_2 WHERE objecttype=? AND tag=?',
+            1, 'tag')
+        self.assertIn('INDEX inventory_2_type_tag', plan)
+
+    def test_buckets(self):
+        """The objects are partitioned by the hour of their expiration"""
+        from storage.sqlite import SqliteInventory
+
+        hour = int(time.time()) // 3600 * 3600
+        SqliteInventory.bucketLength = 3600
+        try:
+            self._test_buckets(hour)
+        finally:
+            SqliteInventory.bucketLength = 6 * 60 * 60
+
+    def _test_buckets(self, hour):
+        from storage.sqlite import SqliteInventory
+
+        inventory = SqliteInventory()
+        for i in range(-10, 20):
+            inventory[chr(65 + i + 10) * 32] = (
+                1, 1, 'payload%i' % i, hour + i * 1800, buffer('tag'))
+        inventory.flush()
+        self.assertEqual(len(inventory._buckets), 15)
+        self.assertEqual(len(inventory.by_type_and_tag(1, 'tag')), 30)
+        self.assertIn(len(inventory.unexpired_hashes_by_stream(1)), (18, 19))
+        inventory.clean()
+        # the hours which ended 3 hours ago are dropped as a whole
+        self.assertEqual(len(inventory._buckets), 13)
+        self.assertEqual(len(inventory._query(
+            "SELECT name FROM sqlite_master WHERE type='table'")), 13)
+        self.assertNotIn('D' * 32, inventory)
+        self.assertIn('E' * 32, inventory)
+
+        inventory = SqliteInventory()
+        self.assertEqual(len(inventory), 26)
+        self.assertEqual(str(inventory['Z' * 32].payload), 'payload15')
+
+    def test_partition(self):
+        """The inventory table of the older versions is partitioned"""
+        from storage.sqlite import SqliteInventory
+
+        inventory = SqliteInventory()
+        inventory.cur.execute(
+            'CREATE TABLE inventory (hash blob, objecttype int,'
+            ' streamnumber int, payload blob, expirestime integer, tag blob,'
+            ' UNIQUE(hash) ON CONFLICT REPLACE)')
+        for i in range(10):
+            inventory.cur.execute(
+                'INSERT INTO inventory VALUES (?, 1, 1, ?, ?, ?)', (
+                    buffer(chr(65 + i) * 32), 'payload%i' % i,
+                    i * 10000, ''))
+        inventory.conn.commit()
+
+        # moved in batches of 2 rows per bucket
+        SqliteInventory.batchSize = 2
+        try:
+            inventory = SqliteInventory()
+        finally:
+            SqliteInventory.batchSize = 100
+        self.assertEqual(len(inventory), 10)
+        self.assertEqual(sorted(inventory._buckets), [0, 1, 2, 3, 4])
+        self.assertEqual(str(inventory['E' * 32].payload), 'payload4')
+        self.assertEqual(inventory._query(
+            "SELECT name FROM sqlite_master"
+            " WHERE type='table' AND name='inventory'"), [])
+
+    def test_move_from_messages(self):
+        """Objects are moved out of messages.dat of the older versions"""
+        from helper_sql import sqlExecute, sqlQuery
+        from storage.sqlite import SqliteInventory
+
+        sqlExecute(
+            'CREATE TABLE inventory (hash blob, objecttype int,'
+            ' streamnumber int, payload blob, expirestime integer, tag blob,'
+            ' UNIQUE(hash) ON CONFLICT REPLACE)')
+        sqlExecute(
+            'INSERT INTO inventory VALUES (?, 1, 1, ?, ?, ?)',
+            buffer('c' * 32), 'payload', int(time.time()) + 3600, '')
+        inventory = SqliteInventory()
+        self.assertIn('c' * 32, inventory)
+        self.assertEqual(str(inventory['c' * 32].payload), 'payload')
+        self.assertEqual(sqlQuery(
+            "SELECT name FROM sqlite_master"
+            " WHERE type='table' AND name='inventory'"), [])
+
+    def test_write_behind(self):
+        """The new objects are written in the background past a threshold"""
+        from storage.sqlite import SqliteInventory
+
+        expires = int(time.time()) + 3600
+        inventory = SqliteInventory()
+        inventory.flushCount = 10
+        inventory.batchSize = 3
+        stop = threading.Event()
+        writer = threading.Thread(target=inventory.writeBehind, args=(stop,))
+        writer.start()
+        self.addCleanup(writer.join)
+        self.addCleanup(stop.set)
+        for i in range(9):
+            inventory[chr(65 + i) * 32] = (1, 1, 'payload%i' % i, expires, '')
+        time.sleep(0.1)
+        self.assertEqual(len(inventory._inventory), 9)
+        inventory['J' * 32] = (1, 1, 'payload9', expires, '')
+        for _ in range(50):
+            # readable while they are written
+            self.assertEqual(str(inventory['E' * 32].payload), 'payload4')
+            if not inventory._inventory and not inventory._flushing:
+                break
+            time.sleep(0.1)
+        self.assertEqual(inventory._query(
+            'SELECT count(*) FROM %s' % inventory._table(
+                expires // inventory.bucketLength)), [(10,)])
+        self.assertEqual(len(inventory.by_type_and_tag(1, '')), 10)
+        self.assertEqual(str(inventory['J' * 32].payload), 'payload9')
+
+    def test_failed_flush(self):
+        """The objects which failed to be written are kept in memory"""
+        import sqlite3
+        from storage.sqlite import SqliteInventory
+
+        expires = int(time.time()) + 3600
+        inventory = SqliteInventory()
+        inventory['a' * 32] = (1, 1, 'payload', expires, '')
+        writeCur = inventory._writeCur
+
+        class FailingCursor(object):
+            """Fails the inserts"""
+            def __getattr__(self, name):
+                return getattr(writeCur, name)
+
+            def executemany(self, *args):
+                raise sqlite3.OperationalError('database or disk is full')
+
+        inventory._writeCur = FailingCursor()
+        inventory.flush()
+        self.assertEqual(list(inventory._inventory), ['a' * 32])
+        self.assertEqual(inventory._flushing, {})
+        self.assertGreater(inventory._flushTimeout(), 0)
+        self.assertEqual(str(inventory['a' * 32].payload), 'payload')
+        inventory._writeCur = writeCur
+        inventory.flush()
+        self.assertEqual(inventory._inventory, {})
+        self.assertEqual(
+            str(SqliteInventory()['a' * 32].payload), 'payload')
@@ -0,0 +1,125 @@
+"""
+Tests for the journal of the objectProcessorQueue
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def setUpModule():
+    """The storage modules import the others as top level modules"""
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+
+
+class TestJournal(unittest.TestCase):
+    """Test case for the journaled objectProcessorQueue"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.home, ignore_errors=True)
+
+    def queue(self):
+        """Return a new queue journaled in the temporary directory"""
+        from queues import ObjectProcessorQueue
+
+        queue = ObjectProcessorQueue()
+        queue.open(self.home)
+        return queue
+
+    def test_resume(self):
+        """The objects which haven't been acknowledged are got again"""
+        objects = [(i % 4, os.urandom(100 + i)) for i in range(20)]
+        queue = self.queue()
+        for item in objects:
+            queue.put(item)
+        queue.put(('checkShutdownVariable', 'no data'))
+        for item in objects[:5]:
+            self.assertEqual(queue.get(), item)
+            queue.acknowledge()
+        # got but not acknowledged
+        self.assertEqual(queue.get(), objects[5])
+        queue.close()
+
+        queue = self.queue()
+        self.assertEqual(queue.journal.backlogCount, 15)
+        self.assertEqual(
+            queue.curSize, sum(len(data) for _, data in objects[5:]))
+        queue.put((1, 'new'))
+        for item in objects[5:12]:
+            self.assertEqual(queue.get(), item)
+            queue.acknowledge()
+        queue.close()
+
+        queue = self.queue()
+        for item in objects[12:] + [(1, 'new')]:
+            self.assertEqual(queue.get(), item)
+            queue.acknowledge()
+        self.assertTrue(queue.empty())
+        queue.close()
+        self.assertEqual(self.queue().journal.backlogCount, 0)
+
+    def test_deferred_writes(self):
+        """The objects are acknowledged once their writes are committed"""
+        from helper_sql import sqlReaders
+
+        queue = self.queue()
+        for i in range(3):
+            queue.put((1, str(i)))
+        queue.get()
+        queue.acknowledge()
+        acknowledged = queue.journal.acknowledged
+        queue.get()
+        # as by sqlExecuteDeferred while processing
+        sqlReaders.deferredQueued()
+        queue.acknowledge()
+        self.assertEqual(queue.journal.acknowledged, acknowledged)
+        # as by the sqlThread committing it
+        sqlReaders.committed(0, 1)
+        queue.get()
+        queue.acknowledge()
+        self.assertGreater(queue.journal.acknowledged, acknowledged)
+        queue.close()
+        self.assertEqual(self.queue().journal.backlogCount, 0)
+
+    def test_segments(self):
+        """The segments of the processed objects are removed"""
+        from storage.journal import Journal
+
+        Journal.segmentSize = 1000
+        try:
+            queue = self.queue()
+            for i in range(30):
+                queue.put((1, os.urandom(200)))
+            self.assertGreater(len(os.listdir(self.home)), 5)
+            for _ in range(25):
+                queue.get()
+                queue.acknowledge()
+            self.assertLessEqual(len(os.listdir(self.home)), 3)
+            queue.close()
+            self.assertEqual(self.queue().journal.backlogCount, 5)
+        finally:
+            Journal.segmentSize = 16 * 1024 * 1024
+
+    def test_torn_record(self):
+        """An incomplete record at the end of the journal is dropped"""
+        queue = self.queue()
+        queue.put((1, 'x' * 100))
+        queue.put((2, 'y' * 100))
+        queue.close()
+        filename = os.path.join(self.home, '0.dat')
+        with open(filename, 'r+b') as journal:
+            journal.truncate(os.path.getsize(filename) - 10)
+
+        queue = self.queue()
+        self.assertEqual(queue.journal.backlogCount, 1)
+        queue.put((3, 'z' * 100))
+        self.assertEqual(queue.get(), (1, 'x' * 100))
+        self.assertEqual(queue.get(), (3, 'z' * 100))
@@ -20,3 +20,15 @@ class TestProtocol(unittest.TestCase):
         self.assertTrue(
             not protocol.checkSocksIP('127.0.0.1')
             or state.socksIP)
+
+    def test_packet_header(self):
+        """The header reused for the object packet is the same"""
+        from pybitmessage import protocol
+
+        payload = buffer('\x00' * 8 + 'object payload')
+        packet = protocol.CreatePacket('object', payload)
+        header = protocol.CreatePacketHeader('object', payload)
+        self.assertEqual(header + str(payload), packet)
+        self.assertEqual(
+            protocol.CreatePacketHeader('object', payload, packet[20:24]),
+            header)
@@ -0,0 +1,604 @@
+"""
+Tests for the database schema maintained by sqlThread
+"""
+
+import ast
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def literal_statements(functions):
+    """
+    Find the calls of *functions* with a string literal
+    as the first argument in the source tree, yield the
+    (filename, line, string) of each of them
+    """
+    for root, dirs, files in os.walk(app_dir):
+        if 'tests' in dirs:
+            dirs.remove('tests')
+        for filename in files:
+            if not filename.endswith('.py'):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                with open(path) as src:
+                    tree = ast.parse(src.read())
+            except SyntaxError:
+                continue
+            for node in ast.walk(tree):
+                if not isinstance(node, ast.Call) or not node.args:
+                    continue
+                name = getattr(node.func, 'id', None) \
+                    or getattr(node.func, 'attr', None)
+                if name in functions and isinstance(node.args[0], ast.Str):
+                    yield (
+                        os.path.relpath(path, app_dir), node.lineno,
+                        node.args[0].s)
+
+
+class TestSqlThread(unittest.TestCase):
+    """Start the sqlThread on an empty database and inspect the schema"""
+
+    @classmethod
+    def setUpClass(cls):
+        from pybitmessage import helper_startup, state
+        from pybitmessage.class_sqlThread import sqlThread
+
+        cls.home = tempfile.mkdtemp()
+        state.appdata = cls.home + os.sep
+        helper_startup.loadConfig()
+        cls.thread = sqlThread()
+        cls.thread.daemon = True
+        cls.thread.start()
+        for _ in range(100):
+            if state.sqlReady:
+                break
+            time.sleep(0.1)
+
+    @classmethod
+    def tearDownClass(cls):
+        from pybitmessage import state
+        from pybitmessage.helper_sql import sqlStoredProcedure
+
+        sqlStoredProcedure('exit')
+        cls.thread.join(10)
+        state.sqlReady = False
+        shutil.rmtree(cls.home, ignore_errors=True)
+
+    def test_version(self):
+        """The database is created with the latest schema version"""
+        from pybitmessage.helper_sql import sqlQuery
+
+        self.assertEqual(
+            sqlQuery("SELECT value FROM settings WHERE key='version'"),
+            [(18,)])
+
+    def test_schema(self):
+        """The new database has the indexes and tables of the migrations"""
+        from pybitmessage.helper_sql import sqlQuery
+
+        names = set(name for name, in sqlQuery(
+            "SELECT name FROM sqlite_master WHERE type IN ('index', 'table')"))
+        for name in (
+            'inbox_folder_received', 'sent_folder_lastactiontime',
+            'sent_ackdata', 'inbox_read_toaddress_folder', 'inbox_unread',
+            'message_body', 'inbox_search', 'sent_search'
+        ):
+            self.assertIn(name, names)
+
+    def test_sent_pages(self):
+        """The unsent messages with the same time are paged by ackdata"""
+        import sys
+        from pybitmessage.helper_sql import sqlExecute, sqlExecuteMany
+
+        # the network package of the API imports the top level modules
+        if app_dir not in sys.path:
+            sys.path.insert(0, app_dir)
+        from pybitmessage.api import BMRPCDispatcher
+
+        sqlExecuteMany(
+            'INSERT INTO sent VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)', [
+                ('', 'BM-to', 'ripe', 'BM-from', 'subject', 'body',
+                 'ackdata%i' % i, 0, 1000 + i // 4, 0, 'msgqueued', 0,
+                 'sent', 2, 3600)
+                for i in range(7)])
+        try:
+            api = BMRPCDispatcher()
+            ackdata = []
+            cursor = ''
+            while True:
+                page, cursor = api._sent_page(cursor, 3, True)
+                self.assertLessEqual(len(page), 3)
+                ackdata.extend(msg['ackData'] for msg in page)
+                if not cursor:
+                    break
+            self.assertEqual(
+                ackdata, [('ackdata%i' % i).encode('hex') for i in range(7)])
+        finally:
+            sqlExecute("DELETE FROM sent WHERE ackdata LIKE 'ackdata%'")
+
+    def test_no_inventory(self):
+        """The inventory is not stored in messages.dat"""
+        from pybitmessage.helper_sql import sqlQuery
+
+        self.assertEqual(sqlQuery(
+            "SELECT name FROM sqlite_master"
+            " WHERE type='table' AND name='inventory'"), [])
+
+    def test_wal(self):
+        """The database is in WAL mode and sqlQuery uses the readers"""
+        from pybitmessage.helper_sql import sqlQuery, sqlReaders
+
+        self.assertEqual(sqlQuery('PRAGMA journal_mode'), [('wal',)])
+        self.assertTrue(sqlReaders.available())
+        sqlQuery('SELECT count(*) FROM inbox')
+        self.assertGreater(sqlReaders._created, 0)
+
+    def test_incremental_vacuum(self):
+        """The free pages are reclaimed when the sqlThread is idle"""
+        from pybitmessage.helper_sql import sqlExecute, sqlQuery
+
+        self.assertEqual(sqlQuery('PRAGMA auto_vacuum'), [(2,)])
+        self.thread.vacuumInterval = 0.1
+        self.thread.vacuumPages = 10
+        try:
+            for i in range(50):
+                sqlExecute(
+                    'INSERT INTO objectprocessorqueue VALUES (?, ?)',
+                    i, os.urandom(4000))
+            self.assertFalse(self.thread.secureDelete)
+            sqlExecute('DELETE FROM objectprocessorqueue')
+            self.assertGreater(sqlQuery('PRAGMA freelist_count')[0][0], 10)
+            for _ in range(50):
+                if not sqlQuery('PRAGMA freelist_count')[0][0]:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(sqlQuery('PRAGMA freelist_count'), [(0,)])
+        finally:
+            self.thread.vacuumInterval = 10
+            self.thread.vacuumPages = 256
+        sqlExecute("DELETE FROM inbox WHERE folder='trash'")
+        self.assertTrue(self.thread.secureDelete)
+
+    def test_read_own_writes(self):
+        """A query sees the changes done just before by the same thread"""
+        from pybitmessage.helper_sql import sqlExecute, sqlQuery
+
+        for i in range(100):
+            sqlExecute(
+                'INSERT INTO addressbook VALUES (?, ?)', 'label', str(i))
+            self.assertEqual(sqlQuery(
+                'SELECT count(*) FROM addressbook WHERE address=?', str(i)),
+                [(1,)])
+        sqlExecute('DELETE FROM addressbook')
+        self.assertEqual(sqlQuery('SELECT count(*) FROM addressbook'), [(0,)])
+
+    def test_submit(self):
+        """sqlSubmit returns a future with the result of the statement"""
+        from pybitmessage.helper_sql import sqlSubmit
+
+        future = sqlSubmit(
+            'INSERT INTO blacklist VALUES (?, ?, ?)', 'label', 'BM-1', True)
+        self.assertEqual(future.result(10), [])
+        self.assertTrue(future.done())
+        self.assertEqual(future.rowcount, 1)
+        self.assertEqual(sqlSubmit(
+            'SELECT address FROM blacklist').result(10), [('BM-1',)])
+        self.assertEqual(
+            sqlSubmit('DELETE FROM blacklist').result(10), [])
+
+    def test_deferred(self):
+        """Deferred writes are visible at once and committed in a while"""
+        import sqlite3
+        import threading
+        from pybitmessage import state
+        from pybitmessage.helper_sql import (
+            sqlExecuteDeferred, sqlQuery, sqlReaders)
+
+        conn = sqlite3.connect(state.appdata + 'messages.dat')
+        for i in range(10):
+            sqlExecuteDeferred(
+                'INSERT INTO whitelist VALUES (?, ?, ?)', 'label', str(i), 1)
+        self.assertEqual(
+            sqlQuery('SELECT count(*) FROM whitelist'), [(10,)])
+        self.assertLess(
+            conn.execute('SELECT count(*) FROM whitelist').fetchone()[0], 10)
+        # only the writing thread waits for the commit to read
+        self.assertFalse(sqlReaders.available())
+        other = []
+        reader = threading.Thread(
+            target=lambda: other.append(sqlReaders.available()))
+        reader.start()
+        reader.join()
+        self.assertEqual(other, [True])
+        time.sleep(self.thread.deferredMaxDelay + 0.5)
+        self.assertEqual(
+            conn.execute('SELECT count(*) FROM whitelist').fetchone()[0], 10)
+        self.assertTrue(sqlReaders.available())
+        conn.close()
+
+    def test_deferred_secure_delete(self):
+        """Writes to other tables don't commit the deferred mailbox writes"""
+        import sqlite3
+        from pybitmessage import state
+        from pybitmessage.helper_sql import (
+            sqlExecute, sqlExecuteDeferred, sqlQuery)
+
+        sqlExecute('INSERT INTO objectprocessorqueue VALUES (?, ?)', 0, 'x')
+        self.assertFalse(self.thread.secureDelete)
+        conn = sqlite3.connect(state.appdata + 'messages.dat')
+        count, = conn.execute('SELECT count(*) FROM whitelist').fetchone()
+        sqlExecuteDeferred(
+            'INSERT INTO whitelist VALUES (?, ?, ?)', 'label', 'BM-a', 1)
+        sqlExecuteDeferred("DELETE FROM inbox WHERE folder='trash'")
+        sqlExecuteDeferred('DELETE FROM objectprocessorqueue')
+        self.assertEqual(
+            sqlQuery('SELECT count(*) FROM objectprocessorqueue'), [(0,)])
+        self.assertTrue(self.thread.secureDelete)
+        self.assertEqual(
+            conn.execute('SELECT count(*) FROM whitelist').fetchone(),
+            (count,))
+        time.sleep(self.thread.deferredMaxDelay + 0.5)
+        self.assertEqual(
+            conn.execute('SELECT count(*) FROM whitelist').fetchone(),
+            (count + 1,))
+        conn.close()
+
+    def test_bulk(self):
+        """The bulk helpers execute many rows in one transaction"""
+        from pybitmessage.helper_sql import (
+            SqlBulkExecute, sqlExecute, sqlExecuteChunked, sqlExecuteMany,
+            sqlQuery)
+
+        with SqlBulkExecute() as sql:
+            for i in range(2500):
+                sql.execute(
+                    'INSERT INTO objectprocessorqueue VALUES (?, ?)', i % 4,
+                    str(i))
+            sql.execute('DELETE FROM objectprocessorqueue WHERE data=?', '0')
+        self.assertEqual(
+            sqlQuery('SELECT count(*) FROM objectprocessorqueue'), [(2499,)])
+        self.assertEqual(sqlExecuteChunked(
+            'DELETE FROM objectprocessorqueue'
+            ' WHERE objecttype=? AND data IN ({0})',
+            2000, 1, *[str(i) for i in range(2000)]), 500)
+        self.assertEqual(sqlExecuteMany(
+            'UPDATE objectprocessorqueue SET objecttype=? WHERE data=?',
+            [(5, str(i)) for i in range(2000, 2500)]), 500)
+        self.assertEqual(sqlQuery(
+            'SELECT count(*) FROM objectprocessorqueue WHERE objecttype=5'),
+            [(500,)])
+        sqlExecute('DELETE FROM objectprocessorqueue')
+
+    def test_stats(self):
+        """The statements are timed by shape and caller"""
+        from pybitmessage.helper_sql import (
+            sqlExecute, sqlExecuteChunked, sqlQuery, sqlStats)
+
+        sqlStats.dump(True)
+        sqlExecute('INSERT INTO addressbook VALUES (?, ?)', 'label', 'BM-1')
+        sqlQuery('SELECT  label\n FROM addressbook WHERE address=?', 'BM-1')
+        sqlExecuteChunked(
+            'DELETE FROM addressbook WHERE address IN ({0})', 3,
+            'BM-1', 'BM-2', 'BM-3')
+        stats = dict(
+            (entry['statement'], entry)
+            for entry in sqlStats.dump(True)['statements'])
+        self.assertEqual(
+            stats['INSERT INTO addressbook VALUES (?, ...)']['rows'], 1)
+        select = stats['SELECT label FROM addressbook WHERE address=?']
+        self.assertEqual(select['count'], 1)
+        self.assertEqual(select['rows'], 1)
+        self.assertEqual(sum(select['histogram'].values()), 1)
+        self.assertEqual(select['callers'].keys()[0].split(':')[0],
+                         'test_sqlthread.py')
+        self.assertEqual(
+            stats['DELETE FROM addressbook WHERE address IN (?, ...)']['rows'],
+            1)
+        self.assertIn('COMMIT', stats)
+
+    def test_search(self):
+        """The full text index follows the changes of the inbox"""
+        from pybitmessage import state
+        from pybitmessage.helper_search import search_messages, search_sql
+        from pybitmessage.helper_sql import sqlExecute, sqlQuery
+
+        state.enableGUI = False  # for the _translate in search_sql
+
+        for i, (subject, message) in enumerate((
+            ('Hello World', 'the first body'),
+            ('Other subject', 'the second body, also a world'),
+            ('Short', 'no'),
+        )):
+            sqlExecute(
+                'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                'msgid%i' % i, 'BM-to', 'BM-from%i' % i, subject,
+                str(i), message, 'inbox', 2, 0, '')
+
+        def found(what, where=None):
+            return sorted(
+                msgid for _, _, _, _, msgid, _, _ in search_sql(
+                    folder='inbox', where=where, what=what))
+
+        self.assertEqual(found('world'), ['msgid0', 'msgid1'])
+        self.assertEqual(found('world', 'subject'), ['msgid0'])
+        self.assertEqual(found('second', 'message'), ['msgid1'])
+        self.assertEqual(found('from2'), ['msgid2'])
+        self.assertEqual(found('no', 'message'), ['msgid2'])
+        # without the translated labels, as in the kivy client
+        self.assertEqual(
+            search_messages('msgid', where='message', what='second'),
+            [('msgid1',)])
+        sqlExecute(
+            "UPDATE inbox SET subject='Hello' WHERE msgid='msgid0'")
+        sqlExecute(
+            'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            'msgid1', 'BM-to', 'BM-from', 'Replaced', '5', 'body',
+            'inbox', 2, 0, '')
+        self.assertEqual(found('world'), [])
+        self.assertEqual(found('replaced'), ['msgid1'])
+        sqlExecute('DELETE FROM inbox')
+        self.assertEqual(found('body'), [])
+        self.assertEqual(sqlQuery('SELECT count(*) FROM inbox_search'), [(0,)])
+
+    def test_query_plans(self):
+        """None of the statements in the tree scans the inbox or sent"""
+        from pybitmessage import state
+
+        largeTableScan = re.compile(r'SCAN (TABLE )?(inbox|sent)\b')
+        conn = sqlite3.connect(state.appdata + 'messages.dat')
+        checked = 0
+        for path, line, statement in literal_statements((
+                'sqlQuery', 'sqlExecute', 'sqlExecuteDeferred', 'sqlSubmit',
+                'sqlExecuteMany', 'sqlExecuteChunked', 'execute')):
+            statement = statement.replace('{0}', '?')
+            try:
+                plan = conn.execute(
+                    'EXPLAIN QUERY PLAN ' + statement,
+                    (None,) * statement.count('?')).fetchall()
+            except (sqlite3.Error, ValueError):
+                # not a statement on the current schema
+                continue
+            checked += 1
+            for row in plan:
+                self.assertIsNone(
+                    largeTableScan.match(row[-1]),
+                    '%s:%i %s: %s' % (path, line, statement, row[-1]))
+        conn.close()
+        self.assertGreater(checked, 100)
+
+    def test_unread_counts(self):
+        """The unread counters follow the changes of the inbox"""
+        from pybitmessage.helper_inbox import unreadCount, unreadCounts
+        from pybitmessage.helper_sql import sqlExecute, sqlQuery
+
+        def counts():
+            """Compare the counters to the inbox and return them"""
+            self.assertEqual(
+                sorted(unreadCounts()), sorted(sqlQuery(
+                    'SELECT toaddress, folder, count(*) FROM inbox'
+                    ' WHERE read = 0 GROUP BY toaddress, folder')))
+            return sorted(unreadCounts())
+
+        for i in range(6):
+            sqlExecute(
+                'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                'unread%i' % i, 'BM-to%i' % (i % 2), 'BM-from%i' % (i % 3),
+                'subject', str(i), 'body', 'inbox', 2, i == 5, '')
+        self.assertEqual(
+            counts(), [('BM-to0', 'inbox', 3), ('BM-to1', 'inbox', 2)])
+        self.assertEqual(unreadCount(), 5)
+        self.assertEqual(
+            sorted(unreadCounts('BM-to1')),
+            [('BM-from0', 'inbox', 1), ('BM-from1', 'inbox', 1)])
+        sqlExecute("UPDATE inbox SET read=1 WHERE msgid='unread0'")
+        sqlExecute("UPDATE inbox SET read=0 WHERE msgid='unread5'")
+        sqlExecute("UPDATE inbox SET folder='trash' WHERE msgid='unread2'")
+        self.assertEqual(counts(), [
+            ('BM-to0', 'inbox', 1), ('BM-to0', 'trash', 1),
+            ('BM-to1', 'inbox', 3)])
+        # replaced by the same msgid
+        sqlExecute(
+            'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            'unread1', 'BM-to0', 'BM-from0', 'subject', '9', 'body',
+            'inbox', 2, 0, '')
+        self.assertEqual(counts(), [
+            ('BM-to0', 'inbox', 2), ('BM-to0', 'trash', 1),
+            ('BM-to1', 'inbox', 2)])
+        sqlExecute('DELETE FROM inbox')
+        self.assertEqual(counts(), [])
+        self.assertEqual(unreadCount(), 0)
+        self.assertEqual(sqlQuery('SELECT count(*) FROM inbox_unread'), [(0,)])
+
+    def test_message_bodies(self):
+        """The message bodies are kept in the message_body table"""
+        from pybitmessage.helper_sql import sqlExecute, sqlQuery
+
+        def bodies():
+            return sorted(sqlQuery('SELECT id, message FROM message_body'))
+
+        sqlExecute(
+            'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            'msgid0', 'BM-to', 'BM-from', 'subject', '0', 'inbox body',
+            'inbox', 2, 0, '')
+        sqlExecute(
+            'INSERT INTO sent VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+            'msgid1', 'BM-to', 'ripe', 'BM-from', 'subject', 'sent body',
+            'ackdata0', 0, 0, 0, 'msgqueued', 0, 'sent', 2, 3600)
+        self.assertEqual(
+            bodies(), [('ackdata0', 'sent body'), ('msgid0', 'inbox body')])
+        self.assertEqual(
+            sqlQuery("SELECT message FROM inbox UNION SELECT message FROM sent"),
+            [('',)])
+        sqlExecute("UPDATE sent SET ackdata='ackdata1' WHERE ackdata='ackdata0'")
+        sqlExecute("UPDATE sent SET message='new body'")
+        self.assertEqual(
+            bodies(), [('ackdata1', 'new body'), ('msgid0', 'inbox body')])
+        self.assertEqual(
+            sqlQuery("SELECT rowid FROM sent_search WHERE sent_search"
+                     " MATCH 'new body'"), [(1,)])
+        self.assertEqual(
+            sqlQuery("SELECT rowid FROM sent_search WHERE sent_search"
+                     " MATCH 'sent body'"), [])
+        # replaced by the same msgid
+        sqlExecute(
+            'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            'msgid0', 'BM-to', 'BM-from', 'subject', '1', '',
+            'inbox', 2, 0, '')
+        self.assertEqual(
+            bodies(), [('ackdata1', 'new body'), ('msgid0', '')])
+        sqlExecute('DELETE FROM inbox')
+        sqlExecute('DELETE FROM sent')
+        self.assertEqual(bodies(), [])
+
+
+class TestMigration(unittest.TestCase):
+    """Start the sqlThread on a database of the version 10"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        conn = sqlite3.connect(os.path.join(self.home, 'messages.dat'))
+        cur = conn.cursor()
+        cur.execute(
+            'CREATE TABLE inbox (msgid blob, toaddress text,'
+            ' fromaddress text, subject text, received text, message text,'
+            ' folder text, encodingtype int, read bool, sighash blob,'
+            ' UNIQUE(msgid) ON CONFLICT REPLACE)')
+        cur.execute(
+            'CREATE TABLE sent (msgid blob, toaddress text, toripe blob,'
+            ' fromaddress text, subject text, message text, ackdata blob,'
+            ' senttime integer, lastactiontime integer, sleeptill integer,'
+            ' status text, retrynumber integer, folder text,'
+            ' encodingtype int, ttl int)')
+        cur.execute(
+            'CREATE TABLE pubkeys (address text, addressversion int,'
+            ' transmitdata blob, time int, usedpersonally text,'
+            ' UNIQUE(address) ON CONFLICT REPLACE)')
+        cur.execute(
+            'CREATE TABLE inventory (hash blob, objecttype int,'
+            ' streamnumber int, payload blob, expirestime integer, tag blob,'
+            ' UNIQUE(hash) ON CONFLICT REPLACE)')
+        cur.execute(
+            'CREATE TABLE settings (key blob, value blob,'
+            ' UNIQUE(key) ON CONFLICT REPLACE)')
+        cur.execute("INSERT INTO settings VALUES('version', 10)")
+        cur.execute("INSERT INTO settings VALUES('lastvacuumtime', 0)")
+        cur.execute(
+            'INSERT INTO inbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ('msgid0', 'BM-to', 'BM-from', 'subject', '0', 'migrated body',
+             'inbox', 2, 0, ''))
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.home, ignore_errors=True)
+
+    def test_upgrade(self):
+        """The migrations reach the current schema"""
+        from pybitmessage import helper_startup, state
+        from pybitmessage.class_sqlThread import sqlThread
+        from pybitmessage.helper_sql import sqlQuery, sqlStoredProcedure
+
+        state.appdata = self.home + os.sep
+        helper_startup.loadConfig()
+        thread = sqlThread()
+        thread.daemon = True
+        thread.start()
+        try:
+            for _ in range(100):
+                if state.sqlReady:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(
+                sqlQuery("SELECT value FROM settings WHERE key='version'"),
+                [(18,)])
+            self.assertEqual(
+                sqlQuery('SELECT id, message FROM message_body'),
+                [('msgid0', 'migrated body')])
+            self.assertEqual(
+                sqlQuery("SELECT rowid FROM inbox_search WHERE inbox_search"
+                         " MATCH 'migrated'"), [(1,)])
+            self.assertEqual(sqlQuery('SELECT count FROM inbox_unread'), [(1,)])
+            # the old inventory table is moved by storage.sqlite, unindexed
+            self.assertEqual(sqlQuery(
+                "SELECT name FROM sqlite_master WHERE type='index'"
+                " AND name LIKE 'inventory%'"), [])
+        finally:
+            sqlStoredProcedure('exit')
+            thread.join(10)
+            state.sqlReady = False
+
+
+class TestSqlReaders(unittest.TestCase):
+    """Test case for the reader connections and the database file"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.filename = os.path.join(self.home, 'messages.dat')
+        conn = sqlite3.connect(self.filename)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('CREATE TABLE t (x int)')
+        conn.executemany('INSERT INTO t VALUES (?)', [(1,), (2,)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.home, ignore_errors=True)
+
+    def test_reset_waiting(self):
+        """A query waiting for a reader is served after the reset"""
+        import threading
+        from pybitmessage.helper_sql import SqlReaderPool
+
+        pool = SqlReaderPool()
+        pool.size = 1
+        pool.reset(self.filename)
+        generation, conn = pool._acquire()
+        result = []
+        waiting = threading.Thread(
+            target=lambda: result.append(
+                pool.query('SELECT count(*) FROM t', ())))
+        waiting.start()
+        waiting.join(0.2)
+        self.assertEqual(result, [])
+        pool.reset(self.filename)
+        waiting.join(5)
+        self.assertEqual(result, [[(2,)]])
+        pool._release(generation, conn)
+        self.assertEqual(len(pool._idle), 1)
+        pool.reset()
+
+    def test_move(self):
+        """The database is moved with the content of the WAL"""
+        from pybitmessage import helper_sql
+        from pybitmessage.class_sqlThread import sqlThread
+
+        destination = os.path.join(self.home, 'moved.dat')
+        thread = sqlThread()
+        thread._connect(self.filename)
+        helper_sql.sqlReaders.reset(self.filename)
+        try:
+            thread.cur.execute('INSERT INTO t VALUES (3)')
+            thread.conn.commit()
+            # a reader in the middle of a query keeps the WAL
+            reader = sqlite3.connect(self.filename)
+            rows = reader.execute('SELECT x FROM t')
+            rows.next()
+            thread._moveDatabase(self.filename, destination)
+            rows.close()
+            reader.close()
+            self.assertTrue(os.path.exists(destination))
+            self.assertFalse(os.path.exists(self.filename))
+            self.assertEqual(
+                helper_sql.sqlReaders.query('SELECT count(*) FROM t', ()),
+                [(3,)])
+        finally:
+            thread.conn.close()
+            helper_sql.sqlReaders.reset()
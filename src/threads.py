@@ -4,8 +4,9 @@ from `.network.StoppableThread`. There are `addressGenerator` for
 addresses generation, `objectProcessor` for processing the network objects
 passed minimal validation, `singleCleaner` to periodically clean various
 internal storages (like inventory and knownnodes) and do forced garbage
-collection, `singleWorker` for doing PoW, `sqlThread` for querying sqlite
-database.
+collection, `inventoryWriter` for writing the new inventory objects
+in the background, `singleWorker` for doing PoW, `sqlThread` for querying
+sqlite database.
 
 There are also other threads in the `.network` package.
 
@@ -16,6 +17,7 @@ There are also other threads in the `.network` package.
 import threading
 
 from class_addressGenerator import addressGenerator
+from class_inventoryWriter import inventoryWriter
 from class_objectProcessor import objectProcessor
 from class_singleCleaner import singleCleaner
 from class_singleWorker import singleWorker
@@ -43,6 +45,6 @@ else:
 printLock = threading.Lock()
 
 __all__ = [
-    "addressGenerator", "objectProcessor", "singleCleaner", "singleWorker",
-    "sqlThread", "printLock"
+    "addressGenerator", "inventoryWriter", "objectProcessor",
+    "singleCleaner", "singleWorker", "sqlThread", "printLock"
 ]